@@ -10,6 +10,7 @@ from tools.calendar import (
     list_events_for_day,
     list_events_between,
     find_events,
+    find_free_slots,
     delete_event,
     update_event,
     get_current_datetime,
@@ -19,6 +20,8 @@ from tools.calendar import (
 from tools.gmail import (
     list_messages,
     get_message,
+    get_messages,
+    search_local_mail,
     trash_message,
     delete_message_permanently,
     batch_modify_labels,
@@ -31,8 +34,19 @@ from tools.gmail import (
     create_reply_draft,
 )
 
+from history import HistoryManager, ModelSummarizer, recall_tool_result, tool_results
+from middleware import CardFastPathMiddleware, ToolConcurrencyMiddleware
+from tools.mailstore import MIRROR_ENABLED
+
 model = init_chat_model("gpt-4o-mini", temperature=0)
 
+# Shared by main.py and server.py: older turns are folded into a short rolling summary
+# and large tool results from earlier turns are swapped for stubs (see recall_tool_result)
+history_manager = HistoryManager(
+    summarizer=ModelSummarizer(model.bind(max_tokens=300)),
+    tool_results=tool_results,
+)
+
 
 
 TOOLS = [
@@ -41,6 +55,7 @@ TOOLS = [
     list_events_for_day,
     list_events_between,
     find_events,
+    find_free_slots,
     delete_event,
     update_event,
     get_current_datetime,
@@ -48,6 +63,8 @@ TOOLS = [
     # Gmail
     list_messages,
     get_message,
+    get_messages,
+    *([search_local_mail] if MIRROR_ENABLED else []),
     trash_message,
     delete_message_permanently,
     batch_modify_labels,
@@ -58,22 +75,42 @@ TOOLS = [
     update_draft,
     send_draft,
     create_reply_draft,
+
+    # History
+    recall_tool_result,
 ]
 
+# Server-only (opt-in per run): end the loop once read-only card tools have answered
+card_fast_path = CardFastPathMiddleware()
+# Parallel tool calls from one step run concurrently, bounded; write tools one at a time
+tool_concurrency = ToolConcurrencyMiddleware()
+
 agent = create_agent(
     model=model,
     tools=TOOLS,
+    middleware=[card_fast_path, tool_concurrency],
     system_prompt=(
         "You are a helpful assistant that manages my Google Calendar and Gmail.\n\n"
 
         "CALENDAR RULES:\n"
         "- When asked to create a calendar event, you MUST call create_event.\n"
-        "- When asked to list/find events, use list_events_for_day / list_events_between / find_events.\n"
+        "- When asked to list/find events, use list_events_for_day / list_events_between / find_events. "
+        "Pass calendar_id='all' (one call) to include shared, team and subscribed calendars; to update or "
+        "delete one of those events, pass its calendar_id along.\n"
+        "- When asked when someone is free or to find a meeting time, call find_free_slots once (all the "
+        "calendar ids together) instead of listing events.\n"
         "- When asked to update or delete an event, you MUST call update_event or delete_event.\n"
         "- Do not claim an event was created/updated/deleted unless the tool returns success.\n\n"
 
         "GMAIL RULES:\n"
-        "- When asked to find emails, you MUST use list_messages (and get_message for details).\n"
+        "- When asked to find emails, you MUST use list_messages. To show senders/subjects, pass hydrate=true "
+        "(one call for the whole list) instead of calling get_message for each id.\n"
+        "- To read several known messages, use get_messages with all the ids in one call; get_message is for a single message.\n"
+        + (
+            "- To find emails by words (subject, sender, recipient, content), try search_local_mail first: it is "
+            "instant, so rephrase and search again rather than giving up. Use list_messages for anything it can't answer.\n"
+            if MIRROR_ENABLED else ""
+        ) +
         "- When asked to draft an email, you MUST use create_draft (or update_draft if editing an existing draft).\n"
         "- When asked to reply, prefer create_reply_draft.\n"
         "- Do NOT send emails unless the user explicitly asks to send. If asked to send, use send_draft.\n"
@@ -84,7 +121,10 @@ agent = create_agent(
 
         "GENERAL:\n"
         "- Use any of the tools available to complete the task.\n"
+        "- When you need several independent lookups (e.g. get_message for a few ids, or several days), request them in the same step; they run in parallel.\n"
         "- If you need tools that don't exist, say so clearly.\n"
         "- Answer only the user's current message. Do not re-list or repeat information from previous tool results unless the user asks for it again.\n"
+        "- Older tool results may appear as stubs with \"elided\": true (tool, args, ids, ref). "
+        "The ids are usually enough; if you need the full data, call recall_tool_result with the stub's ref.\n"
     ),
 )
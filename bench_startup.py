@@ -0,0 +1,89 @@
+# bench_startup.py
+# Cold-start benchmark. Each measurement runs in a fresh interpreter, so it sees
+# what a new worker or `python main.py` sees:
+#   import main       until the CLI can show its prompt
+#   import tools      the Calendar and Gmail tool modules
+#   import server     the whole FastAPI app (agent, LangChain, OpenAI client)
+#   first tool call   list_events_for_day on a fresh process: credentials, discovery
+#                     parsing, client build and the request path, with Google replaced
+#                     by a canned local response so only our own start-up work counts
+#
+#   python bench_startup.py [--runs 5] [--json]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+_FIRST_TOOL_CALL = """
+import json, time
+started = time.perf_counter()
+import httplib2
+import tools.service as service
+from tools.calendar import list_events_for_day
+imported = time.perf_counter()
+
+class CannedTransport:
+    connections = {}
+    def request(self, uri, method="GET", *args, **kwargs):
+        return httplib2.Response({"status": "200"}), b'{"items": []}'
+
+service.get_credential_manager = lambda scopes, account: object()
+service._authorized_http = lambda creds: CannedTransport()
+list_events_for_day.func(date_str="2026-03-05")
+print(json.dumps({"seconds": time.perf_counter() - imported}))
+"""
+
+CASES = {
+    "import main": "import main",
+    "import tools": "import tools.calendar, tools.gmail",
+    "import server": "import server",
+}
+
+
+def _run(code: str) -> float:
+    """Wall time of a fresh interpreter running `code` (the interpreter's own start-up included)."""
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-bench")}
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def _first_tool_call() -> float:
+    env = {**os.environ, "STELLA_CALENDAR_CACHE": "0"}
+    out = subprocess.run([sys.executable, "-c", _FIRST_TOOL_CALL], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])["seconds"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print one JSON object instead of a table")
+    args = parser.parse_args()
+
+    baseline = [_run("pass") for _ in range(args.runs)]
+    results = {}
+    for name, code in CASES.items():
+        results[name] = [_run(code) - statistics.median(baseline) for _ in range(args.runs)]
+    results["first tool call"] = [_first_tool_call() for _ in range(args.runs)]
+
+    report = {
+        name: {"median_ms": round(statistics.median(times) * 1000, 1), "min_ms": round(min(times) * 1000, 1)}
+        for name, times in results.items()
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{'':<18}{'median':>10}{'min':>10}   ({args.runs} runs, interpreter start-up subtracted)")
+    for name, r in report.items():
+        print(f"{name:<18}{r['median_ms']:>8.1f}ms{r['min_ms']:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+# history.py
+# Token-budgeted conversation history shared by main.py and server.py.
+# Keeps the system prompt and the most recent turns verbatim and folds older turns
+# into a rolling summary, so prompt size stays flat as a conversation grows.
+
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.tools import tool
+from langchain_core.messages import SystemMessage, ToolMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("STELLA_HISTORY_TOKEN_BUDGET", "6000"))
+DEFAULT_MIN_RECENT_TURNS = int(os.getenv("STELLA_HISTORY_MIN_TURNS", "2"))
+
+# name= on the system message that carries the rolling summary
+SUMMARY_NAME = "conversation_summary"
+
+# Tool results from earlier turns shorter than this are left alone (a stub would not be much smaller)
+ELIDE_MIN_CHARS = int(os.getenv("STELLA_ELIDE_MIN_CHARS", "400"))
+# Most ids listed on a stub; the full list is in the stored payload
+_STUB_MAX_IDS = 20
+_STUB_ARGS_CHARS = 160
+
+# Per-message framing tokens the chat API adds around each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+# Tool output is truncated to this many characters when shown to the summarizer
+_SUMMARY_TOOL_CHARS = 400
+
+
+# -----------------------
+# Token counting
+# -----------------------
+_ENCODER = None
+_ENCODER_LOADED = False
+_ENCODER_LOCK = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken encoder for gpt-4o-mini, or None if tiktoken (or its BPE file) is unavailable."""
+    global _ENCODER, _ENCODER_LOADED
+    if not _ENCODER_LOADED:
+        with _ENCODER_LOCK:
+            if not _ENCODER_LOADED:
+                try:
+                    import tiktoken
+                    _ENCODER = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    logger.info("tiktoken unavailable; estimating tokens as chars/4")
+                    _ENCODER = None
+                _ENCODER_LOADED = True
+    return _ENCODER
+
+
+def _role(m) -> str:
+    role = getattr(m, "type", None) or (m.get("role") if isinstance(m, dict) else None)
+    return {"user": "human", "assistant": "ai"}.get(role, role or "")
+
+
+def _name(m) -> Optional[str]:
+    return getattr(m, "name", None) or (m.get("name") if isinstance(m, dict) else None)
+
+
+def message_text(m) -> str:
+    """Plain-text view of a message: content plus any tool call arguments."""
+    content = getattr(m, "content", None)
+    if content is None and isinstance(m, dict):
+        content = m.get("content")
+    text = content if isinstance(content, str) else json.dumps(content, default=str) if content else ""
+
+    tool_calls = getattr(m, "tool_calls", None) or (m.get("tool_calls") if isinstance(m, dict) else None)
+    if tool_calls:
+        text += json.dumps(tool_calls, default=str)
+    return text
+
+
+def count_tokens(messages: List[Any]) -> int:
+    """Approximate prompt tokens for a list of messages (objects or dicts)."""
+    encoder = _get_encoder()
+    total = 0
+    for m in messages:
+        text = message_text(m)
+        total += _MESSAGE_OVERHEAD_TOKENS + (len(encoder.encode(text)) if encoder else len(text) // 4)
+    return total
+
+
+# -----------------------
+# Summarization
+# -----------------------
+def render_transcript(messages: List[Any]) -> str:
+    """Compact transcript used as summarizer input."""
+    lines = []
+    for m in messages:
+        role = _role(m)
+        if role == "human":
+            lines.append(f"User: {message_text(m)}")
+        elif role == "ai":
+            content = getattr(m, "content", None) or (m.get("content") if isinstance(m, dict) else "")
+            calls = getattr(m, "tool_calls", None) or []
+            for call in calls:
+                lines.append(f"Assistant called {call.get('name')}({json.dumps(call.get('args'), default=str)})")
+            if isinstance(content, str) and content:
+                lines.append(f"Assistant: {content}")
+        elif role == "tool":
+            lines.append(f"Tool {_name(m)} returned: {message_text(m)[:_SUMMARY_TOOL_CHARS]}")
+    return "\n".join(lines)
+
+
+_SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and Stella, "
+    "an assistant that manages their Google Calendar and Gmail.\n"
+    "Update the summary with the new transcript. Keep facts the assistant may need later: "
+    "user preferences, decisions, pending requests, and any event/message/draft ids with what they refer to. "
+    "Drop pleasantries and full listings. Reply with the summary only, at most 200 words.\n\n"
+    "Current summary:\n{summary}\n\nNew transcript:\n{transcript}"
+)
+
+
+class ModelSummarizer:
+    """Folds turns into the rolling summary with a (cheap) chat model call."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def _prompt(self, summary: Optional[str], messages: List[Any]) -> str:
+        return _SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=render_transcript(messages))
+
+    def summarize(self, summary: Optional[str], messages: List[Any]) -> str:
+        return self.model.invoke(self._prompt(summary, messages)).content
+
+    async def asummarize(self, summary: Optional[str], messages: List[Any]) -> str:
+        return (await self.model.ainvoke(self._prompt(summary, messages))).content
+
+
+def _fallback_summary(summary: Optional[str], messages: List[Any]) -> str:
+    """Used when the summarizer fails: keep what the user asked, which is the part most likely needed later."""
+    asked = [message_text(m)[:200] for m in messages if _role(m) == "human"]
+    parts = [summary] if summary else []
+    parts += [f"User asked: {a}" for a in asked]
+    return "\n".join(parts)
+
+
+# -----------------------
+# Stale tool results
+# -----------------------
+Owner = Tuple[Optional[str], Optional[str]]   # (session id, account)
+
+_current_owner: contextvars.ContextVar[Owner] = contextvars.ContextVar("tool_result_owner", default=(None, None))
+
+
+@contextlib.contextmanager
+def tool_result_scope(session_id: Optional[str], account: Optional[str] = None) -> Iterator[None]:
+    """Tool results stored or recalled inside this block (and its copied contexts) belong to this session."""
+    token = _current_owner.set((session_id, account))
+    try:
+        yield
+    finally:
+        _current_owner.reset(token)
+
+
+class ToolResultStore:
+    """
+    Server-side LRU store for tool results elided from history, keyed by the owning
+    session (see tool_result_scope) and tool_call_id, so a session can only recall its
+    own results. Bounded by entry count and total payload size across all sessions.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[Tuple[Owner, str], Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, ref: str, tool_name: Optional[str], args: Any, content: str) -> None:
+        key = (_current_owner.get(), ref)
+        size = len(content)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old["content"])
+            self._items[key] = {"tool": tool_name, "args": args, "content": content}
+            self._bytes += size
+            while self._items and (len(self._items) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted["content"])
+
+    def get(self, ref: str) -> Optional[Dict[str, Any]]:
+        """The current session's result for `ref`; None if missing or stored by another session."""
+        key = (_current_owner.get(), ref)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes}
+
+
+# Shared by every session; entries are scoped per session by tool_result_scope
+tool_results = ToolResultStore()
+
+
+def _collect_ids(value: Any, out: List[str]) -> None:
+    """Collect values of *id fields (event_id, message_id, draft_id, ...) from a tool payload."""
+    if isinstance(value, dict):
+        for key, v in value.items():
+            if isinstance(v, str) and (key == "id" or key.endswith("_id")) and v not in out:
+                out.append(v)
+            else:
+                _collect_ids(v, out)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_ids(v, out)
+
+
+def _tool_payload(m: ToolMessage) -> Any:
+    """Structured view of a tool result for id extraction (None if content isn't JSON)."""
+    artifact = getattr(m, "artifact", None)
+    if artifact is not None:
+        return artifact
+    try:
+        return json.loads(m.content) if isinstance(m.content, str) else m.content
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def is_tool_stub(m) -> bool:
+    return isinstance(m, ToolMessage) and "elided_tokens" in (m.response_metadata or {})
+
+
+def make_tool_stub(m: ToolMessage, args: Any, count: Callable[[List[Any]], int]) -> ToolMessage:
+    """Short stand-in for a stale tool result: tool name, argument summary, ids and a recall ref."""
+    ids: List[str] = []
+    _collect_ids(_tool_payload(m), ids)
+    args_text = json.dumps(args, default=str)
+    if len(args_text) > _STUB_ARGS_CHARS:
+        args_text = args_text[:_STUB_ARGS_CHARS] + "..."
+    stub = {
+        "elided": True,
+        "tool": m.name,
+        "args": args_text,
+        "ids": ids[:_STUB_MAX_IDS],
+        "ref": m.tool_call_id,
+    }
+    if len(ids) > _STUB_MAX_IDS:
+        stub["more_ids"] = len(ids) - _STUB_MAX_IDS
+    content = json.dumps(stub, separators=(",", ":"))
+    saved = count([m]) - count([{"content": content}])
+    return ToolMessage(
+        content=content,
+        name=m.name,
+        tool_call_id=m.tool_call_id,
+        status=m.status,
+        response_metadata={"elided_tokens": max(saved, 0)},
+    )
+
+
+@tool(
+    "recall_tool_result",
+    description=(
+        "Fetch the full result of an earlier tool call that appears in history as a stub "
+        "with \"elided\": true. Pass the stub's ref."
+    ),
+)
+def recall_tool_result(ref: str) -> str:
+    item = tool_results.get(ref)
+    if item is None:
+        return json.dumps({"error": f"No stored result for ref {ref}; call the original tool again."})
+    return item["content"]
+
+
+# -----------------------
+# History manager
+# -----------------------
+@dataclass
+class HistoryReport:
+    prompt_tokens: int        # tokens of the history actually sent
+    verbatim_tokens: int      # tokens the full, uncompacted history would have cost
+    turns_folded: int         # turns folded into the summary on this call
+    tool_results_elided: int = 0  # stale tool results replaced by stubs on this call
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.verbatim_tokens - self.prompt_tokens
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "tokens_saved": self.tokens_saved}
+
+
+@dataclass
+class _Plan:
+    head: List[Any]
+    summary: Optional[Any]
+    old_turns: List[List[Any]]
+    recent: List[Any]
+
+
+class HistoryManager:
+    """
+    Keeps history under token_budget before each agent call:
+      [system prompt] + [rolling summary] + [most recent turns, verbatim]
+    A turn is a user message plus everything up to the next user message, so tool
+    calls are never separated from their results. The newest min_recent_turns turns
+    (including the one being asked) are always kept, even if they exceed the budget.
+
+    With a tool_results store, large tool results from earlier turns are first
+    replaced by stubs (tool name, args, ids, ref); the full payload stays in the
+    store for recall_tool_result.
+    """
+
+    def __init__(
+        self,
+        summarizer=None,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        min_recent_turns: int = DEFAULT_MIN_RECENT_TURNS,
+        count: Callable[[List[Any]], int] = count_tokens,
+        tool_results: Optional[ToolResultStore] = None,
+        elide_min_chars: int = ELIDE_MIN_CHARS,
+    ):
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.min_recent_turns = max(1, min_recent_turns)
+        self.count = count
+        self.tool_results = tool_results
+        self.elide_min_chars = elide_min_chars
+        self._lock = threading.Lock()
+        self._counters = {
+            "turns": 0,
+            "compactions": 0,
+            "turns_folded": 0,
+            "tool_results_elided": 0,
+            "tokens_saved": 0,
+        }
+
+    # --- public API ---
+
+    def prepare(self, messages: List[Any]) -> "tuple[List[Any], HistoryReport]":
+        """Return (history to send, report) for a history ending in the new user message."""
+        messages, elided = self.elide_tool_results(messages)
+        plan = self._plan(messages)
+        if plan is None:
+            return self._finish(messages, messages, 0, elided)
+        prev = self._summary_text(plan.summary)
+        old = [m for turn in plan.old_turns for m in turn]
+        try:
+            text = self.summarizer.summarize(prev, old) if self.summarizer else _fallback_summary(prev, old)
+        except Exception:
+            logger.exception("history: summarizer failed; using fallback summary")
+            text = _fallback_summary(prev, old)
+        return self._finish(messages, self._build(plan, text, old), len(plan.old_turns), elided)
+
+    async def aprepare(self, messages: List[Any]) -> "tuple[List[Any], HistoryReport]":
+        """Async prepare(); awaits the summarizer instead of blocking the event loop."""
+        messages, elided = self.elide_tool_results(messages)
+        plan = self._plan(messages)
+        if plan is None:
+            return self._finish(messages, messages, 0, elided)
+        prev = self._summary_text(plan.summary)
+        old = [m for turn in plan.old_turns for m in turn]
+        try:
+            if self.summarizer:
+                text = await self.summarizer.asummarize(prev, old)
+            else:
+                text = _fallback_summary(prev, old)
+        except Exception:
+            logger.exception("history: summarizer failed; using fallback summary")
+            text = _fallback_summary(prev, old)
+        return self._finish(messages, self._build(plan, text, old), len(plan.old_turns), elided)
+
+    def elide_tool_results(self, messages: List[Any]) -> "tuple[List[Any], int]":
+        """
+        Replace large tool results from before the latest user message with stubs.
+        Returns (messages, number elided). The input list is not modified.
+        """
+        if self.tool_results is None:
+            return messages, 0
+        last_human = max((i for i, m in enumerate(messages) if _role(m) == "human"), default=-1)
+
+        call_args = {}
+        out, elided = [], 0
+        for i, m in enumerate(messages):
+            for call in getattr(m, "tool_calls", None) or []:
+                call_args[call.get("id")] = call.get("args")
+            if (
+                i < last_human
+                and isinstance(m, ToolMessage)
+                and not is_tool_stub(m)
+                and len(message_text(m)) >= self.elide_min_chars
+            ):
+                args = call_args.get(m.tool_call_id)
+                self.tool_results.put(m.tool_call_id, m.name, args, message_text(m))
+                m = make_tool_stub(m, args, self.count)
+                elided += 1
+            out.append(m)
+        return out, elided
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {"token_budget": self.token_budget, **self._counters}
+        if self.tool_results is not None:
+            stats["tool_result_store"] = self.tool_results.stats()
+        return stats
+
+    # --- internals ---
+
+    @staticmethod
+    def is_summary(m) -> bool:
+        return _role(m) == "system" and _name(m) == SUMMARY_NAME
+
+    @staticmethod
+    def _summary_text(summary) -> Optional[str]:
+        if summary is None:
+            return None
+        return getattr(summary, "content", None) or (summary.get("content") if isinstance(summary, dict) else None)
+
+    @staticmethod
+    def _folded_tokens(summary) -> int:
+        """Tokens of all turns already folded into summary (carried on the summary message)."""
+        meta = getattr(summary, "response_metadata", None) or {}
+        return int(meta.get("folded_tokens", 0))
+
+    def _split(self, messages: List[Any]):
+        head, summary, turns = [], None, []
+        for m in messages:
+            if self.is_summary(m):
+                summary = m
+            elif _role(m) == "system" and not turns:
+                head.append(m)
+            elif _role(m) == "human" or not turns:
+                turns.append([m])
+            else:
+                turns[-1].append(m)
+        return head, summary, turns
+
+    def _plan(self, messages: List[Any]) -> Optional[_Plan]:
+        if self.count(messages) <= self.token_budget:
+            return None
+        head, summary, turns = self._split(messages)
+        if len(turns) <= self.min_recent_turns:
+            return None
+
+        # Room left for verbatim turns once the fixed parts are paid for
+        available = self.token_budget - self.count(head) - (self.count([summary]) if summary is not None else 0)
+        keep = self.min_recent_turns
+        used = sum(self.count(t) for t in turns[-keep:])
+        while keep < len(turns):
+            cost = self.count(turns[-keep - 1])
+            if used + cost > available:
+                break
+            used += cost
+            keep += 1
+
+        if keep == len(turns):
+            return None
+        return _Plan(
+            head=head,
+            summary=summary,
+            old_turns=turns[:-keep],
+            recent=[m for t in turns[-keep:] for m in t],
+        )
+
+    def _build(self, plan: _Plan, text: str, old: List[Any]) -> List[Any]:
+        folded = self._folded_tokens(plan.summary) + self.count(old)
+        summary = SystemMessage(
+            content=f"Summary of the earlier conversation:\n{text}",
+            name=SUMMARY_NAME,
+            response_metadata={"folded_tokens": folded},
+        )
+        return [*plan.head, summary, *plan.recent]
+
+    def _finish(self, original: List[Any], prepared: List[Any], turns_folded: int, elided: int = 0):
+        summary = next((m for m in prepared if self.is_summary(m)), None)
+        prompt_tokens = self.count(prepared)
+        verbatim = prompt_tokens
+        if summary is not None:
+            verbatim += self._folded_tokens(summary) - self.count([summary])
+        # stubs still in history keep saving what their payload would have cost
+        verbatim += sum(m.response_metadata["elided_tokens"] for m in prepared if is_tool_stub(m))
+        report = HistoryReport(
+            prompt_tokens=prompt_tokens,
+            verbatim_tokens=verbatim,
+            turns_folded=turns_folded,
+            tool_results_elided=elided,
+        )
+
+        with self._lock:
+            self._counters["turns"] += 1
+            self._counters["tokens_saved"] += report.tokens_saved
+            self._counters["tool_results_elided"] += elided
+            if turns_folded:
+                self._counters["compactions"] += 1
+                self._counters["turns_folded"] += turns_folded
+        if turns_folded or elided:
+            logger.info(
+                "history: folded %d turns, elided %d tool results; sending %d tokens instead of %d (saved %d)",
+                turns_folded, elided, report.prompt_tokens, report.verbatim_tokens, report.tokens_saved,
+            )
+        return prepared, report
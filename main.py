@@ -1,5 +1,5 @@
-from agent import agent
-
+import threading
+from concurrent.futures import Future
 from datetime import datetime
 from zoneinfo import ZoneInfo
 def current_datetime_str():
@@ -15,7 +15,33 @@ SYSTEM_HINT = (
     f"Current datetime: {current_datetime_str()}"
 )
 
+def _load():
+    """The agent, history manager and router: LangChain, the OpenAI client and the tools (slow to import)."""
+    from agent import agent, history_manager
+    from router import router
+    from tools.service import warm_up
+
+    warm_up()
+    return agent, history_manager, router
+
+
+def _load_in_background() -> Future:
+    # a daemon thread, so quitting before the first request doesn't wait for the imports
+    future: Future = Future()
+
+    def run():
+        try:
+            future.set_result(_load())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="stella-load", daemon=True).start()
+    return future
+
+
 def main():
+    # the prompt shows right away; imports and Google client setup happen while the user types
+    loading = _load_in_background()
     messages = [{"role": "system", "content": SYSTEM_HINT}]
 
     print("Stella (Calendar) — type a request, or 'help', or 'exit'.")
@@ -38,6 +64,17 @@ def main():
             continue
 
         messages.append({"role": "user", "content": user})
+        agent, history_manager, router = loading.result()
+
+        # formulaic requests ("what's on tomorrow", "mark all as read") skip the LLM
+        routed = router.handle(user)
+        if routed:
+            print(routed.reply)
+            messages = [*messages, *routed.messages]
+            continue
+
+        # stay under the token budget: old turns are folded into a summary
+        messages, _report = history_manager.prepare(messages)
 
         res = agent.invoke({"messages": messages})
         reply = res["messages"][-1].content
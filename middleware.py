@@ -0,0 +1,228 @@
+# middleware.py
+# Agent middleware (langchain AgentMiddleware hooks) used by agent.py.
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import weakref
+from contextlib import AsyncExitStack, ExitStack
+from typing import Any, Dict, List, Optional
+
+from langchain.agents.middleware import AgentMiddleware, hook_config
+from langchain_core.messages import ToolMessage
+from langgraph.config import get_config
+
+from history import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Read-only tools whose results the server shows as cards.
+READ_ONLY_CARD_TOOLS = {"list_events_for_day", "list_events_between", "find_events", "get_message", "get_messages"}
+
+# Tools that never change anything; every other tool counts as a write.
+READ_ONLY_TOOLS = READ_ONLY_CARD_TOOLS | {
+    "list_messages", "search_local_mail", "find_free_slots", "get_current_datetime", "recall_tool_result",
+}
+
+# Requests that mention these still need the model after a lookup (e.g. "delete my 3pm" lists
+# events first, then deletes), so they never take the card fast path.
+_WRITE_INTENT = re.compile(
+    r"\b(add|archive|block|book|cancel|change|create|delete|draft|edit|forward|label|mark|move|"
+    r"remove|rename|reply|reschedule|schedule|send|set|trash|update|write)\b",
+    re.IGNORECASE,
+)
+
+
+def _role(m) -> Optional[str]:
+    return getattr(m, "type", None) or (m.get("role") if isinstance(m, dict) else None)
+
+
+def _content(m) -> str:
+    content = getattr(m, "content", None)
+    if content is None and isinstance(m, dict):
+        content = m.get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _is_card_call(call: Dict[str, Any]) -> bool:
+    name = call.get("name")
+    if name == "list_messages":
+        # only hydrated lists carry what the email cards show
+        return bool((call.get("args") or {}).get("hydrate"))
+    return name in READ_ONLY_CARD_TOOLS
+
+
+class CardFastPathMiddleware(AgentMiddleware):
+    """
+    Ends the agent loop as soon as a step's tool calls were all read-only card tools
+    (event lists, get_message(s), list_messages with hydrate=true),
+    skipping the final LLM call whose text the server would discard anyway (it shows
+    cards with a one-line intro instead).
+
+    Opt-in per run: pass config={"configurable": {"card_fast_path": True}}.
+    main.py does not, since the terminal has no cards and needs the model's full reply.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        # each turn ended early is one skipped LLM call
+        self._counters = {"turns_ended_early": 0, "prompt_tokens_skipped": 0}
+
+    @staticmethod
+    def _enabled() -> bool:
+        try:
+            return bool(get_config().get("configurable", {}).get("card_fast_path"))
+        except RuntimeError:
+            # not running inside a graph
+            return False
+
+    @staticmethod
+    def should_end(messages: list) -> bool:
+        """True if the turn so far is: user request (no write intent) -> card tool calls -> their results."""
+        if not messages or not isinstance(messages[-1], ToolMessage):
+            return False
+
+        results = []
+        i = len(messages) - 1
+        while i >= 0 and isinstance(messages[i], ToolMessage):
+            results.append(messages[i])
+            i -= 1
+        if i < 0:
+            return False
+        calls = getattr(messages[i], "tool_calls", None) or []
+        if not calls or not all(_is_card_call(c) for c in calls):
+            return False
+        for r in results:
+            artifact = getattr(r, "artifact", None)
+            if getattr(r, "status", "success") == "error" or (isinstance(artifact, dict) and artifact.get("error")):
+                # let the model explain what went wrong
+                return False
+
+        user = next((m for m in reversed(messages[:i]) if _role(m) in ("human", "user")), None)
+        return user is not None and not _WRITE_INTENT.search(_content(user))
+
+    @hook_config(can_jump_to=["end"])
+    def before_model(self, state: Dict[str, Any], runtime) -> Optional[Dict[str, Any]]:
+        if not self._enabled() or not self.should_end(state["messages"]):
+            return None
+        skipped_tokens = count_tokens(state["messages"])
+        with self._lock:
+            self._counters["turns_ended_early"] += 1
+            self._counters["prompt_tokens_skipped"] += skipped_tokens
+        logger.info("card fast path: skipped final LLM call (~%d prompt tokens)", skipped_tokens)
+        return {"jump_to": "end"}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+class ToolConcurrencyMiddleware(AgentMiddleware):
+    """
+    Bounds the tool calls of an agent step. The graph already runs the calls of one
+    AIMessage as parallel tasks; this caps how many run at once:
+      - at most max_parallel tool calls in flight overall
+      - at most per_tool[name] (default_limit otherwise) for each read-only tool
+      - write tools (anything not in READ_ONLY_TOOLS) share one slot, so they run one at a time
+
+    Limits are process-wide: they bound the process's Google traffic across all accounts.
+    Sync runs (agent.invoke) use thread semaphores, async runs use asyncio ones.
+    """
+
+    WRITE_KEY = "<write>"
+    GLOBAL_KEY = "<all>"
+
+    def __init__(
+        self,
+        max_parallel: int = int(os.getenv("STELLA_TOOL_CONCURRENCY", "8")),
+        per_tool: Optional[Dict[str, int]] = None,
+        default_limit: int = 4,
+        read_only: frozenset = frozenset(READ_ONLY_TOOLS),
+    ):
+        super().__init__()
+        self.max_parallel = max_parallel
+        self.per_tool = {"get_message": 8} if per_tool is None else per_tool
+        self.default_limit = default_limit
+        self.read_only = read_only
+
+        self._lock = threading.Lock()
+        self._thread_slots: Dict[str, threading.BoundedSemaphore] = {}
+        # asyncio semaphores belong to one event loop
+        self._loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._in_flight = 0
+        self._counters = {"calls": 0, "write_calls": 0, "waited": 0, "peak_in_flight": 0}
+
+    def _keys(self, name: str) -> List[str]:
+        # Always acquired in this order (tool/write slot, then global) so waits can't deadlock
+        return [name if name in self.read_only else self.WRITE_KEY, self.GLOBAL_KEY]
+
+    def _limit(self, key: str) -> int:
+        if key == self.GLOBAL_KEY:
+            return self.max_parallel
+        if key == self.WRITE_KEY:
+            return 1
+        return self.per_tool.get(key, self.default_limit)
+
+    def _thread_slot(self, key: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if key not in self._thread_slots:
+                self._thread_slots[key] = threading.BoundedSemaphore(self._limit(key))
+            return self._thread_slots[key]
+
+    def _loop_slot(self, key: str) -> asyncio.Semaphore:
+        slots = self._loop_slots.setdefault(asyncio.get_running_loop(), {})
+        if key not in slots:
+            slots[key] = asyncio.Semaphore(self._limit(key))
+        return slots[key]
+
+    def _started(self, name: str, waited: bool) -> None:
+        with self._lock:
+            self._in_flight += 1
+            self._counters["calls"] += 1
+            self._counters["write_calls"] += name not in self.read_only
+            self._counters["waited"] += waited
+            self._counters["peak_in_flight"] = max(self._counters["peak_in_flight"], self._in_flight)
+
+    def _finished(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def wrap_tool_call(self, request, handler):
+        name = request.tool_call["name"]
+        waited = False
+        with ExitStack() as held:
+            for key in self._keys(name):
+                slot = self._thread_slot(key)
+                if not slot.acquire(blocking=False):
+                    waited = True
+                    slot.acquire()
+                held.callback(slot.release)
+            self._started(name, waited)
+            try:
+                return handler(request)
+            finally:
+                self._finished()
+
+    async def awrap_tool_call(self, request, handler):
+        name = request.tool_call["name"]
+        waited = False
+        async with AsyncExitStack() as held:
+            for key in self._keys(name):
+                slot = self._loop_slot(key)
+                waited = waited or slot.locked()
+                await slot.acquire()
+                held.callback(slot.release)
+            self._started(name, waited)
+            try:
+                return await handler(request)
+            finally:
+                self._finished()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counters, "in_flight": self._in_flight}
@@ -0,0 +1,343 @@
+# router.py
+# Deterministic intent router in front of the agent (used by main.py and server.py).
+# Formulaic requests ("what's on tomorrow", "mark all as read", "list unread emails")
+# are matched against a small set of anchored rules and run the tool directly:
+# no LLM call, no tokens. Anything the rules don't match exactly goes to the agent.
+
+import logging
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from tools.calendar import DEFAULT_TZ, get_current_datetime, list_events_between, list_events_for_day
+from tools.gmail import list_messages, mark_all_as_read
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Pieces shared by the rules below (applied to normalized text, see normalize())
+_DAY = r"(?P<day>today|tonight|tomorrow|yesterday|(?:on )?(?:this |next )?(?:%s)|(?:on )?\d{4}-\d{2}-\d{2})" % "|".join(WEEKDAYS)
+_MY_CAL = r"(?:(?:my|the) )?(?:calendar|schedule|agenda)"
+_MAIL = r"(?:e-?mails?|messages?|mail|inbox)"
+_WHATS = r"(?:what's|what is|whats)"
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop politeness and trailing punctuation, collapse whitespace."""
+    text = text.lower().replace("’", "'").strip()
+    text = re.sub(r"[?.!]+$", "", text)
+    text = re.sub(r"^(?:hey |hi )?(?:stella[, ]+)?(?:please |can you |could you )*", "", text)
+    text = re.sub(r"(?:,? please)$", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def resolve_day(phrase: str, today: date) -> Optional[date]:
+    """Turn 'today' / 'tomorrow' / '(on) (next) friday' / 'yyyy-mm-dd' into a date."""
+    phrase = re.sub(r"^on ", "", phrase)
+    if phrase in ("today", "tonight"):
+        return today
+    if phrase == "tomorrow":
+        return today + timedelta(days=1)
+    if phrase == "yesterday":
+        return today - timedelta(days=1)
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", phrase):
+        try:
+            return date.fromisoformat(phrase)
+        except ValueError:
+            return None
+
+    m = re.fullmatch(r"(?:(this|next) )?(\w+)", phrase)
+    if not m or m.group(2) not in WEEKDAYS:
+        return None
+    index = WEEKDAYS.index(m.group(2))
+    monday = today - timedelta(days=today.weekday())
+    if m.group(1) == "this":
+        return monday + timedelta(days=index)
+    if m.group(1) == "next":
+        return monday + timedelta(days=7 + index)
+    # bare weekday: the next one on or after today
+    return today + timedelta(days=(index - today.weekday()) % 7)
+
+
+def _week_bounds(today: date, which: str) -> Tuple[date, date]:
+    monday = today - timedelta(days=today.weekday())
+    if which == "next":
+        monday += timedelta(days=7)
+    return monday, monday + timedelta(days=6)
+
+
+# ---------------------------------------------------------------------------
+# Replies (full text; the server shows only the first line next to the cards)
+# ---------------------------------------------------------------------------
+
+def _event_time(d: Optional[Dict[str, str]]) -> str:
+    if not d:
+        return ""
+    if d.get("dateTime"):
+        return d["dateTime"][11:16]
+    return "all day"
+
+
+def _events_reply(result: Dict[str, Any], when: str) -> str:
+    events = result.get("events") or []
+    if not events:
+        return f"You have no events {when}."
+    noun = "event" if len(events) == 1 else "events"
+    lines = [f"You have {len(events)} {noun} {when}:"]
+    if result.get("truncated"):
+        lines = [f"You have more than {len(events)} {noun} {when}. The first {len(events)}:"]
+    for ev in events:
+        start, end = _event_time(ev.get("start")), _event_time(ev.get("end"))
+        span = start if start == "all day" or not end else f"{start}-{end}"
+        lines.append(f"- {span} {ev.get('summary') or '(No title)'}".rstrip())
+    return "\n".join(lines)
+
+
+def _day_phrase(d: date, today: date) -> str:
+    if d == today:
+        return "today"
+    if d == today + timedelta(days=1):
+        return "tomorrow"
+    if d == today - timedelta(days=1):
+        return "yesterday"
+    return f"on {d.strftime('%A')}, {d.isoformat()}"
+
+
+def _mail_reply(result: Dict[str, Any], what: str) -> str:
+    count = result.get("count") or 0
+    if not count:
+        return f"You have no {what}."
+    more = " (showing the first page)" if result.get("nextPageToken") else ""
+    lines = [f"You have {count} {what}{more}:"]
+    for m in result.get("messages") or []:
+        h = m.get("headers") or {}
+        if h:
+            lines.append(f"- {h.get('from') or '(unknown sender)'}: {h.get('subject') or '(No subject)'}")
+    return "\n".join(lines) if len(lines) > 1 else lines[0].rstrip(":") + "."
+
+
+def _mark_read_reply(result: Dict[str, Any]) -> str:
+    count = result.get("count") or 0
+    if not count:
+        return "No unread messages in your inbox."
+    return f"Marked {count} message{'s' if count != 1 else ''} as read."
+
+
+# ---------------------------------------------------------------------------
+# Rules
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Route:
+    """A matched intent: which tool to call with which args, and how to phrase the result."""
+    intent: str
+    tool: Any
+    args: Dict[str, Any]
+    reply: Callable[[Any], str]
+
+
+@dataclass
+class Rule:
+    intent: str
+    patterns: List[re.Pattern]
+    build: Callable[[re.Match, date], Optional[Route]]
+
+    def fullmatch(self, text: str) -> Optional[re.Match]:
+        for pattern in self.patterns:
+            m = pattern.fullmatch(text)
+            if m:
+                return m
+        return None
+
+
+def _day_route(m: re.Match, today: date) -> Optional[Route]:
+    d = resolve_day(m.groupdict().get("day") or "today", today)
+    if d is None:
+        return None
+    when = _day_phrase(d, today)
+    return Route("events_for_day", list_events_for_day, {"date_str": d.isoformat()},
+                 lambda r: _events_reply(r, when))
+
+
+def _week_route(m: re.Match, today: date) -> Optional[Route]:
+    which = m.group("which")
+    start, end = _week_bounds(today, which)
+    return Route("events_for_week", list_events_between,
+                 {"start_date": start.isoformat(), "end_date": end.isoformat()},
+                 lambda r: _events_reply(r, f"{which} week ({start.isoformat()} to {end.isoformat()})"))
+
+
+def _unread_route(m: re.Match, today: date) -> Route:
+    return Route("list_unread", list_messages, {"query": "is:unread", "label_ids": ["INBOX"], "hydrate": True},
+                 lambda r: _mail_reply(r, "unread messages in your inbox"))
+
+
+def _inbox_route(m: re.Match, today: date) -> Route:
+    return Route("list_inbox", list_messages, {"label_ids": ["INBOX"], "hydrate": True},
+                 lambda r: _mail_reply(r, "messages in your inbox"))
+
+
+def _mark_all_read_route(m: re.Match, today: date) -> Route:
+    return Route("mark_all_read", mark_all_as_read, {}, _mark_read_reply)
+
+
+def _now_route(m: re.Match, today: date) -> Route:
+    def reply(r):
+        now = datetime.fromisoformat(r)
+        return f"It's {now.strftime('%A, %Y-%m-%d %H:%M')}."
+    return Route("current_datetime", get_current_datetime, {}, reply)
+
+
+def _rule(intent: str, patterns: List[str], build) -> Rule:
+    return Rule(intent, [re.compile(p) for p in patterns], build)
+
+
+DEFAULT_RULES: List[Rule] = [
+    _rule("events_for_day", [
+        rf"{_WHATS} on {_MY_CAL}(?: for)?(?: {_DAY})?",
+        # needs "on"/"for": "what's today" asks for the date (current_datetime below)
+        rf"{_WHATS} (?:on |for |happening )(?:on |for )?{_DAY}",
+        rf"what (?:do i have|have i got|am i doing)(?: on)? {_DAY}",
+        rf"(?:(?:list|show)(?: me)? )?(?:my |the )?(?:events|meetings|{_MY_CAL})(?: for)? {_DAY}",
+        rf"(?:list|show)(?: me)? (?:my |the )?(?:events|meetings|{_MY_CAL})",
+    ], _day_route),
+    _rule("events_for_week", [
+        rf"(?:{_WHATS} on |(?:list|show)(?: me)? )?(?:my |the )?(?:(?:events|meetings|{_MY_CAL}) )?(?:for )?(?P<which>this|next) week",
+        rf"{_WHATS} (?:on )?(?:for )?(?P<which>this|next) week",
+    ], _week_route),
+    _rule("list_unread", [
+        rf"(?:(?:list|show|get|check)(?: me)? )?(?:my |all )?(?:new |unread )+{_MAIL}",
+        rf"(?:do i have )?any (?:new |unread )+{_MAIL}",
+        rf"do i have (?:new |unread )+{_MAIL}",
+    ], _unread_route),
+    _rule("list_inbox", [
+        rf"(?:list|show|check)(?: me)? (?:my |the )?{_MAIL}",
+    ], _inbox_route),
+    _rule("mark_all_read", [
+        rf"mark (?:all|everything)(?: (?:my |the )?(?:unread )?{_MAIL})?(?: in (?:my |the )?inbox)? (?:as )?read",
+    ], _mark_all_read_route),
+    _rule("current_datetime", [
+        r"what time is it(?: now)?",
+        r"what(?:'s| is) the time",
+        r"what(?:'s| is) (?:today's date|the date(?: today)?)",
+        rf"{_WHATS} today",
+        r"what day is (?:it|today)(?: today)?",
+    ], _now_route),
+]
+
+
+# ---------------------------------------------------------------------------
+# Router
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RouteResult:
+    """
+    A request the router handled. `messages` is what to append to the history after the
+    user's message: the tool call, its result (artifact included), and the reply, so the
+    turn looks like an agent turn to the server and to later LLM calls.
+    """
+    intent: str
+    reply: str
+    messages: List[Any] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+
+class IntentRouter:
+    def __init__(self, rules: Optional[List[Rule]] = None, timezone: str = DEFAULT_TZ):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        self.timezone = timezone
+        self._lock = threading.Lock()
+        self._counters = {"routed": 0, "passed_to_agent": 0, "tool_errors": 0}
+        self._by_intent: Dict[str, int] = {}
+
+    def match(self, text: str, today: Optional[date] = None) -> Optional[Route]:
+        """The route for text, or None when no rule matches the whole request."""
+        text = normalize(text)
+        today = today or datetime.now(ZoneInfo(self.timezone)).date()
+        for rule in self.rules:
+            m = rule.fullmatch(text)
+            if m:
+                return rule.build(m, today)
+        return None
+
+    def _finish(self, route: Route, tool_message: ToolMessage, call: Dict[str, Any], started: float) -> RouteResult:
+        result = tool_message.artifact if tool_message.artifact is not None else tool_message.content
+        reply = route.reply(result)
+        with self._lock:
+            self._counters["routed"] += 1
+            self._by_intent[route.intent] = self._by_intent.get(route.intent, 0) + 1
+        return RouteResult(
+            intent=route.intent,
+            reply=reply,
+            messages=[AIMessage(content="", tool_calls=[call]), tool_message, AIMessage(content=reply)],
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+        )
+
+    def _prepare(self, text: str) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        route = self.match(text)
+        if route is None:
+            with self._lock:
+                self._counters["passed_to_agent"] += 1
+            return None
+        call = {"name": route.tool.name, "args": route.args, "id": f"router_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+        return route, call
+
+    def _failed(self, route: Route, result: Any) -> bool:
+        if isinstance(result, dict) and result.get("error"):
+            logger.info("router: %s returned an error, passing to the agent", route.intent)
+        elif isinstance(result, Exception):
+            logger.warning("router: %s failed (%s), passing to the agent", route.intent, result)
+        else:
+            return False
+        with self._lock:
+            self._counters["tool_errors"] += 1
+            self._counters["passed_to_agent"] += 1
+        return True
+
+    def handle(self, text: str) -> Optional[RouteResult]:
+        """Run a matched request's tool directly. None means: hand the request to the agent."""
+        started = time.perf_counter()
+        prepared = self._prepare(text)
+        if prepared is None:
+            return None
+        route, call = prepared
+        try:
+            msg = route.tool.invoke(call)
+        except Exception as e:
+            self._failed(route, e)
+            return None
+        if self._failed(route, msg.artifact):
+            return None
+        return self._finish(route, msg, call, started)
+
+    async def ahandle(self, text: str) -> Optional[RouteResult]:
+        """Async variant of handle (tool coroutines run on the Google I/O executor)."""
+        started = time.perf_counter()
+        prepared = self._prepare(text)
+        if prepared is None:
+            return None
+        route, call = prepared
+        try:
+            msg = await route.tool.ainvoke(call)
+        except Exception as e:
+            self._failed(route, e)
+            return None
+        if self._failed(route, msg.artifact):
+            return None
+        return self._finish(route, msg, call, started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, "by_intent": dict(self._by_intent)}
+
+
+router = IntentRouter()
@@ -1,19 +1,56 @@
 # server.py
-import ast
+import asyncio
+import contextlib
+import hmac
 import json
 import logging
+import os
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
 
-from agent import agent
+from agent import agent, card_fast_path, history_manager, tool_concurrency
+from history import tool_result_scope
 from main import SYSTEM_HINT
+from router import router
+from sessions import SessionStore, is_valid_session_id, new_session_id
+from tools.aio import run_blocking
+from tools.auth import DEFAULT_ACCOUNT, account_scope, has_token, is_valid_account
+from tools.eventstore import get_cache as calendar_cache
+from tools.fields import response_stats as google_response_stats
+from tools.mailstore import get_mirror as gmail_mirror
+from tools.quota import stats as google_quota_stats
+from tools.retry import stats as google_retry_stats
+from tools.service import stats as google_http_stats
+from tools.service import warm_up as google_warm_up
+
+# Filled in by the startup warm-up (see _lifespan); shown under "startup" in /stats
+startup_report: dict = {}
+
+
+def _warm_up() -> None:
+    try:
+        startup_report.update(google_warm_up())
+    except Exception as e:
+        logger.exception("startup warm-up failed; Google clients will be built on first use")
+        startup_report["error"] = str(e)
+
+
+@contextlib.asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Google clients are built in the background: the worker takes requests right away
+    # and the first tool call finds them ready (or builds them itself if it gets there first)
+    warm = asyncio.ensure_future(run_blocking(_warm_up))
+    yield
+    warm.cancel()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=_lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
 # Tool names that return a list of calendar events (we use the last one in the turn)
@@ -28,8 +66,11 @@ EVENT_LIST_TOOLS = {"list_events_for_day", "list_events_between", "find_events"}
 # Tools that return a single event (create/update) — we show it as one event card
 EVENT_SINGLE_TOOLS = {"create_event", "update_event"}
 
-# Tool names that return individual email details
-EMAIL_DETAIL_TOOLS = {"get_message"}
+# Tool names that return email details (one message, or {"messages": [...]} for get_messages)
+EMAIL_DETAIL_TOOLS = {"get_message", "get_messages"}
+
+# Tool names whose "messages" list may hold email details (list_messages with hydrate=true)
+EMAIL_LIST_TOOLS = {"list_messages", "search_local_mail"}
 
 
 def _format_event_time(d: dict) -> str:
@@ -92,6 +133,23 @@ def _get_tool_message_content(m):
     return None
 
 
+def _get_tool_message_data(m) -> dict | list | None:
+    """
+    Structured result of a tool message. Tools return their dict as the ToolMessage
+    artifact, so this is normally a plain attribute read; content is only parsed for
+    messages without one (e.g. dict-format history).
+    """
+    artifact = getattr(m, "artifact", None)
+    if artifact is None and isinstance(m, dict):
+        artifact = m.get("artifact")
+    if artifact is not None:
+        return artifact
+    content = _get_tool_message_content(m)
+    if content is None:
+        return None
+    return _parse_tool_content(content)
+
+
 def _is_email_detail_tool_message(m) -> bool:
     """True if this message is a tool result from get_message."""
     return _get_tool_message_name(m) in EMAIL_DETAIL_TOOLS
@@ -103,17 +161,13 @@ def _is_human_message(m) -> bool:
     return role in ("human", "user")
 
 
-def _tool_message_to_email(m) -> dict | None:
-    """Convert a get_message tool result to EmailCard shape."""
-    content = _get_tool_message_content(m)
-    if content is None:
-        return None
-    data = _parse_tool_content(content)
+def _summary_to_email(data) -> dict | None:
+    """Convert one message summary (get_message result / hydrated list entry) to EmailCard shape."""
     if not isinstance(data, dict):
         return None
 
     message_id = data.get("message_id") or ""
-    if not message_id:
+    if not message_id or data.get("error"):
         return None
 
     headers = data.get("headers") or {}
@@ -127,27 +181,44 @@ def _tool_message_to_email(m) -> dict | None:
     }
 
 
+def _tool_message_to_email(m) -> dict | None:
+    """Convert a get_message tool result to EmailCard shape."""
+    return _summary_to_email(_get_tool_message_data(m))
+
+
+def _tool_message_to_emails(m) -> list:
+    """EmailCards for one tool message: a get_message result, or each entry of a get_messages / hydrated list result."""
+    if not _is_email_detail_tool_message(m) and _get_tool_message_name(m) not in EMAIL_LIST_TOOLS:
+        return []
+    data = _get_tool_message_data(m)
+    if isinstance(data, dict) and isinstance(data.get("messages"), list):
+        # un-hydrated list entries (ids only) have no headers and don't make cards
+        entries = [e for e in data["messages"] if isinstance(e, dict) and "headers" in e]
+    elif _is_email_detail_tool_message(m):
+        entries = [data]
+    else:
+        entries = []
+    cards = [_summary_to_email(e) for e in entries]
+    return [c for c in cards if c]
+
+
 def _extract_emails_from_messages(messages: list) -> list:
-    """Collect all get_message tool results from the most recent agent turn."""
-    emails = []
+    """Collect all email tool results (get_message, hydrated list_messages) from the most recent agent turn."""
+    batches = []
     for m in reversed(messages):
         if _is_human_message(m):
             break
-        if _is_email_detail_tool_message(m):
-            email = _tool_message_to_email(m)
-            if email:
-                emails.append(email)
-    return list(reversed(emails))
+        emails = _tool_message_to_emails(m)
+        if emails:
+            batches.append(emails)
+    return [email for batch in reversed(batches) for email in batch]
 
 
 def _parse_tool_content(raw) -> dict | list | None:
     """Parse tool message content (str, dict, or list) to a structured value. Returns None on failure."""
     try:
         if isinstance(raw, str):
-            try:
-                return json.loads(raw)
-            except json.JSONDecodeError:
-                return ast.literal_eval(raw)
+            return json.loads(raw)
         if isinstance(raw, dict):
             return raw
         if isinstance(raw, list):
@@ -155,55 +226,54 @@ def _parse_tool_content(raw) -> dict | list | None:
             return raw
         logger.warning("_parse_tool_content: unexpected type %s, dropping", type(raw).__name__)
         return None
-    except (json.JSONDecodeError, TypeError, ValueError, SyntaxError):
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return None
+
+
+def _tool_message_to_events(m) -> list | None:
+    """
+    Convert one event-producing tool result to frontend events.
+    Returns None if the message is not a usable event result (so callers can keep looking).
+    """
+    name = _get_tool_message_name(m)
+    if name not in EVENT_LIST_TOOLS and name not in EVENT_SINGLE_TOOLS:
+        return None
+    data = _get_tool_message_data(m)
+    if data is None:
         return None
 
+    if name in EVENT_LIST_TOOLS:
+        if isinstance(data, list):
+            raw_events = data
+        else:
+            raw_events = data.get("events") if isinstance(data, dict) else []
+        return _tool_events_to_frontend(raw_events)
+
+    if name in EVENT_SINGLE_TOOLS:
+        if not isinstance(data, dict):
+            return None
+        if data.get("error") or data.get("updated") is False:
+            return None
+        if data.get("event_id") or data.get("summary") is not None:
+            return _tool_events_to_frontend([data])
+
+    return None
+
 
 def _extract_events_from_messages(messages: list) -> list:
     """Find the last event-producing tool result (list or single) and return frontend events."""
     for m in reversed(messages):
         if _is_human_message(m):
             break
-        name = _get_tool_message_name(m)
-        content = _get_tool_message_content(m)
-        if content is None:
-            continue
-
-        if name in EVENT_LIST_TOOLS:
-            data = _parse_tool_content(content)
-            if data is not None:
-                if isinstance(data, list):
-                    raw_events = data
-                else:
-                    raw_events = data.get("events") if isinstance(data, dict) else []
-                return _tool_events_to_frontend(raw_events)
-
-        if name in EVENT_SINGLE_TOOLS:
-            data = _parse_tool_content(content)
-            if not isinstance(data, dict):
-                continue
-            if data.get("error") or data.get("updated") is False:
-                continue
-            if data.get("event_id") or data.get("summary") is not None:
-                return _tool_events_to_frontend([data])
+        events = _tool_message_to_events(m)
+        if events is not None:
+            return events
 
     return []
 
 
-# keep chat state in memory (single-user, simple)
-messages = [{"role": "system", "content": SYSTEM_HINT}]
-
-class ChatRequest(BaseModel):
-    message: str
-
-@app.post("/chat")
-def chat(req: ChatRequest):
-    global messages
-
-    messages.append({"role": "user", "content": req.message})
-    res = agent.invoke({"messages": messages})
-
-    messages = res["messages"]
+def _build_chat_response(messages: list) -> dict:
+    """Build the /chat response body (reply + cards) from the messages of a finished turn."""
     last = messages[-1]
     reply = last.content if hasattr(last, "content") and isinstance(last.content, str) else ""
     events = _extract_events_from_messages(messages)
@@ -216,3 +286,284 @@ def chat(req: ChatRequest):
             reply = first_line
 
     return {"reply": reply, "events": events, "emails": emails}
+
+
+# End the turn right after read-only card tools (see middleware.CardFastPathMiddleware)
+# and reply with a template intro instead of a final LLM call.
+CARD_FAST_PATH = os.getenv("STELLA_CARD_FAST_PATH", "1") != "0"
+
+
+# Formulaic requests are answered by router.IntentRouter without the agent
+INTENT_ROUTER = os.getenv("STELLA_INTENT_ROUTER", "1") != "0"
+
+
+async def _route(message: str):
+    """router.RouteResult when the intent router handled the message, else None (use the agent)."""
+    if not INTENT_ROUTER:
+        return None
+    return await router.ahandle(message)
+
+
+def _agent_config() -> dict:
+    return {"configurable": {"card_fast_path": CARD_FAST_PATH}}
+
+
+def _plural(n: int, word: str) -> str:
+    return f"{n} {word}" if n == 1 else f"{n} {word}s"
+
+
+def _card_intro(messages: list) -> str:
+    """One-line reply for a turn that ended on card tool results (no final model message)."""
+    events = _extract_events_from_messages(messages)
+    emails = _extract_emails_from_messages(messages)
+    if emails and not events:
+        return "Here's the email." if len(emails) == 1 else f"Here are {_plural(len(emails), 'email')}."
+
+    last = next((m for m in reversed(messages) if _tool_message_to_events(m) is not None), None)
+    data = _get_tool_message_data(last) if last is not None else None
+    data = data if isinstance(data, dict) else {}
+    what = _plural(len(events), "event") if events else "no events"
+    more = ""
+    if data.get("truncated"):
+        what, more = f"more than {what}", f" Showing the first {len(events)}."
+    if data.get("date"):
+        return f"You have {what} on {data['date']}.{more}"
+    rng = data.get("range") or {}
+    if data.get("query"):
+        return f"Found {what} matching \"{data['query']}\".{more}"
+    if rng.get("start_date") and rng.get("end_date"):
+        return f"You have {what} between {rng['start_date']} and {rng['end_date']}.{more}"
+    return f"You have {what}.{more}"
+
+
+def _finish_turn(messages: list) -> tuple[list, bool]:
+    """
+    Returns (messages, fast_path). A turn the card fast path ended on tool results gets
+    a template AIMessage appended, so the saved history still alternates user/assistant.
+    """
+    if messages and isinstance(messages[-1], ToolMessage):
+        return [*messages, AIMessage(content=_card_intro(messages))], True
+    return messages, False
+
+
+def _ndjson(event: dict) -> str:
+    """Serialize one stream event as a single NDJSON line."""
+    return json.dumps(event, default=str) + "\n"
+
+
+def _stream_events_for_update(update: dict):
+    """
+    Yield stream events for one `updates` chunk from agent.stream.
+    Model steps with tool calls become tool_start events; tool results become
+    tool_end events, followed by any EventCard/EmailCard payloads they produce.
+    """
+    for node_update in update.values():
+        if not isinstance(node_update, dict):
+            continue
+        for m in node_update.get("messages") or []:
+            for call in getattr(m, "tool_calls", None) or []:
+                yield {"type": "tool_start", "name": call.get("name"), "args": call.get("args") or {}}
+
+            if not isinstance(m, ToolMessage):
+                continue
+            yield {"type": "tool_end", "name": m.name, "ok": getattr(m, "status", "success") != "error"}
+
+            events = _tool_message_to_events(m)
+            if events is not None:
+                # Last event result in a turn wins, so the client replaces its event list
+                yield {"type": "events", "events": events}
+            for email in _tool_message_to_emails(m):
+                yield {"type": "email", "email": email}
+
+
+# Chat state lives in per-session histories (session id from header or cookie)
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "stella_session"
+# Google account a request acts for (see tools/auth.py); without it, the default account.
+# Set by whatever authenticates users in front of this server, and only believed when that
+# proxy also sends PROXY_SECRET_HEADER matching STELLA_ACCOUNT_SECRET. With no secret
+# configured the account header is refused and everything runs as the default account.
+ACCOUNT_HEADER = "X-Stella-Account"
+PROXY_SECRET_HEADER = "X-Stella-Proxy-Secret"
+ACCOUNT_SECRET = os.getenv("STELLA_ACCOUNT_SECRET", "")
+
+sessions = SessionStore(
+    system_prompt=SYSTEM_HINT,
+    max_sessions=int(os.getenv("STELLA_MAX_SESSIONS", "1000")),
+    max_bytes=int(os.getenv("STELLA_SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+    idle_ttl_seconds=float(os.getenv("STELLA_SESSION_IDLE_TTL", "3600")),
+)
+
+
+def _resolve_session_id(request: Request) -> tuple[str, bool]:
+    """Return (session_id, is_new). Header wins over cookie; a missing or malformed id gets a fresh one."""
+    for candidate in (request.headers.get(SESSION_HEADER), request.cookies.get(SESSION_COOKIE)):
+        if is_valid_session_id(candidate):
+            return candidate, False
+    return new_session_id(), True
+
+
+def _attach_session_id(response: Response, session_id: str, is_new: bool) -> None:
+    response.headers[SESSION_HEADER] = session_id
+    if is_new:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+
+
+def _from_trusted_proxy(request: Request) -> bool:
+    supplied = request.headers.get(PROXY_SECRET_HEADER, "")
+    return bool(ACCOUNT_SECRET) and hmac.compare_digest(supplied.encode(), ACCOUNT_SECRET.encode())
+
+
+def _resolve_account(request: Request, session) -> str:
+    """
+    The Google account for this request. A session is bound to the account of its first
+    request, so one conversation's history never reaches another account's tools.
+    """
+    account = request.headers.get(ACCOUNT_HEADER) or DEFAULT_ACCOUNT
+    if account != DEFAULT_ACCOUNT and not _from_trusted_proxy(request):
+        raise HTTPException(status_code=403, detail=f"{ACCOUNT_HEADER} is only accepted from the trusted proxy.")
+    if account != DEFAULT_ACCOUNT and not (is_valid_account(account) and has_token(account)):
+        raise HTTPException(status_code=403, detail="That Google account isn't connected.")
+    if session.account is None:
+        session.account = account
+    elif session.account != account:
+        raise HTTPException(status_code=409, detail="This session belongs to another account.")
+    return account
+
+
+@contextlib.asynccontextmanager
+async def _session_context(session, account: str):
+    """
+    account_scope and tool_result_scope for the rest of the request task (tool calls copy
+    its context), so tools act for the session's account and recall only its own results.
+    """
+    with account_scope(account), tool_result_scope(session.session_id, account):
+        yield
+
+
+class ChatRequest(BaseModel):
+    message: str
+
+@app.post("/chat")
+async def chat(req: ChatRequest, request: Request, response: Response):
+    session_id, is_new = _resolve_session_id(request)
+    _attach_session_id(response, session_id, is_new)
+    session = sessions.get(session_id)
+    account = _resolve_account(request, session)
+
+    # One turn at a time per session; other sessions run concurrently
+    async with session.lock, _session_context(session, account):
+        user_message = {"role": "user", "content": req.message}
+        routed = await _route(req.message)
+        if routed:
+            messages = [*session.messages, user_message, *routed.messages]
+            sessions.save(session, messages)
+            return {**_build_chat_response(messages), "handled_by": "router", "fast_path": False, "history": None}
+
+        history, report = await history_manager.aprepare([*session.messages, user_message])
+        res = await agent.ainvoke({"messages": history}, config=_agent_config())
+        messages, fast_path = _finish_turn(res["messages"])
+        sessions.save(session, messages)
+
+    return {
+        **_build_chat_response(messages),
+        "handled_by": "agent",
+        "fast_path": fast_path,
+        "history": report.as_dict(),
+    }
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request):
+    """
+    Streaming variant of /chat (built on agent.astream). Responds with NDJSON, one event per line:
+      {"type": "token", "content": ...}        LLM output tokens as they are generated
+      {"type": "tool_start", "name", "args"}   the model asked for a tool call
+      {"type": "tool_end", "name", "ok"}       a tool finished
+      {"type": "events", "events": [...]}      EventCards (replaces any earlier list in this turn)
+      {"type": "email", "email": {...}}        one EmailCard
+      {"type": "done", ...}                    same body /chat would have returned
+      {"type": "error", "message": ...}        the turn failed
+    """
+    session_id, is_new = _resolve_session_id(request)
+    session = sessions.get(session_id)
+    account = _resolve_account(request, session)
+
+    async def generate():
+        # The session lock is held for the whole stream so turns stay ordered
+        async with session.lock, _session_context(session, account):
+            user_message = {"role": "user", "content": req.message}
+            routed = await _route(req.message)
+            if routed:
+                messages = [*session.messages, user_message, *routed.messages]
+                sessions.save(session, messages)
+                for event in _stream_events_for_update({"router": {"messages": routed.messages}}):
+                    yield _ndjson(event)
+                body = _build_chat_response(messages)
+                yield _ndjson({"type": "token", "content": body["reply"]})
+                yield _ndjson({"type": "done", **body, "handled_by": "router", "fast_path": False, "history": None})
+                return
+
+            final_messages = None
+            try:
+                # inside the try: a failing summarizer ends the stream with an error event too
+                history, report = await history_manager.aprepare([*session.messages, user_message])
+                async for mode, payload in agent.astream(
+                    {"messages": history},
+                    config=_agent_config(),
+                    stream_mode=["messages", "updates", "values"],
+                ):
+                    if mode == "messages":
+                        chunk, _metadata = payload
+                        if isinstance(chunk, AIMessageChunk) and isinstance(chunk.content, str) and chunk.content:
+                            yield _ndjson({"type": "token", "content": chunk.content})
+                    elif mode == "updates":
+                        for event in _stream_events_for_update(payload):
+                            yield _ndjson(event)
+                    elif mode == "values":
+                        final_messages = payload.get("messages")
+            except Exception:
+                logger.exception("chat_stream: agent stream failed")
+                yield _ndjson({"type": "error", "message": "Agent failed while handling the request."})
+                return
+
+            if not final_messages:
+                yield _ndjson({"type": "error", "message": "Agent returned no messages."})
+                return
+
+            final_messages, fast_path = _finish_turn(final_messages)
+            sessions.save(session, final_messages)
+        body = _build_chat_response(final_messages)
+        if fast_path:
+            yield _ndjson({"type": "token", "content": body["reply"]})
+        yield _ndjson({
+            "type": "done", **body, "handled_by": "agent", "fast_path": fast_path, "history": report.as_dict(),
+        })
+
+    response = StreamingResponse(generate(), media_type="application/x-ndjson")
+    _attach_session_id(response, session_id, is_new)
+    return response
+
+
+@app.get("/stats")
+def stats():
+    """Runtime counters for capacity monitoring."""
+    body = {
+        "sessions": sessions.stats(),
+        "history": history_manager.stats(),
+        "card_fast_path": card_fast_path.stats(),
+        "tool_concurrency": tool_concurrency.stats(),
+        "router": router.stats(),
+        "google_http": google_http_stats(),
+        "google_response_bytes": google_response_stats(),
+        "google_quota": google_quota_stats(),
+        "google_retries": google_retry_stats(),
+        "startup": startup_report,
+    }
+    cache = calendar_cache()
+    if cache is not None:
+        body["calendar_cache"] = cache.stats()
+    mirror = gmail_mirror()
+    if mirror is not None:
+        body["gmail_mirror"] = mirror.stats()
+    return body
@@ -0,0 +1,182 @@
+# sessions.py
+# Per-session conversation state for the server.
+# Each session owns its message history and an asyncio.Lock so its turns run in order.
+# The store evicts least-recently-used and idle sessions to keep memory bounded.
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024   # across all sessions
+DEFAULT_IDLE_TTL_SECONDS = 60 * 60
+
+# Session ids are client-supplied; keep them short and boring.
+_MAX_SESSION_ID_LEN = 128
+_SESSION_ID_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and len(session_id) <= _MAX_SESSION_ID_LEN and set(session_id) <= _SESSION_ID_CHARS
+
+
+def estimate_message_bytes(m) -> int:
+    """Rough size of one message (content + tool calls + artifact). Cheap enough to run on every save."""
+    content = getattr(m, "content", None)
+    if content is None and isinstance(m, dict):
+        content = m.get("content")
+    if isinstance(content, str):
+        size = len(content.encode("utf-8"))
+    elif content is None:
+        size = 0
+    else:
+        size = len(json.dumps(content, default=str))
+
+    tool_calls = getattr(m, "tool_calls", None)
+    if tool_calls:
+        size += len(json.dumps(tool_calls, default=str))
+    artifact = getattr(m, "artifact", None)
+    if artifact is not None:
+        size += len(json.dumps(artifact, default=str))
+    return size
+
+
+@dataclass
+class Session:
+    session_id: str
+    messages: List[Any]
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    created_at: float = 0.0
+    last_seen: float = 0.0
+    size_bytes: int = 0
+    account: Optional[str] = None   # Google account the session acts for, fixed by its first request
+
+
+class SessionStore:
+    """
+    LRU map of session_id -> Session.
+    - get() creates sessions on first use and marks them most recently used
+    - save() replaces a session's history and re-measures it
+    - sessions idle longer than idle_ttl_seconds are dropped
+    - when over max_sessions or max_bytes, the least recently used idle sessions are dropped
+    Sessions whose lock is held (a turn is running) are never evicted.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        idle_ttl_seconds: float = DEFAULT_IDLE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.system_prompt = system_prompt
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._clock = clock
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes_held = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "created": 0,
+            "evicted_lru": 0,
+            "evicted_idle": 0,
+            "evicted_memory": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Session:
+        """Return the session for session_id, creating it if needed."""
+        with self._lock:
+            now = self._clock()
+            self._evict_idle(now)
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                initial = [{"role": "system", "content": self.system_prompt}]
+                session = Session(
+                    session_id=session_id,
+                    messages=initial,
+                    created_at=now,
+                    size_bytes=sum(estimate_message_bytes(m) for m in initial),
+                )
+                self._sessions[session_id] = session
+                self._bytes_held += session.size_bytes
+                self._counters["created"] += 1
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.last_seen = now
+            self._evict_over_limits(keep=session_id)
+            return session
+
+    def save(self, session: Session, messages: List[Any]) -> None:
+        """Store the history for a finished turn."""
+        with self._lock:
+            size = sum(estimate_message_bytes(m) for m in messages)
+            session.messages = messages
+            session.last_seen = self._clock()
+            if self._sessions.get(session.session_id) is session:
+                self._bytes_held += size - session.size_bytes
+                self._sessions.move_to_end(session.session_id)
+            session.size_bytes = size
+            self._evict_over_limits(keep=session.session_id)
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._bytes_held -= session.size_bytes
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "live_sessions": len(self._sessions),
+                "bytes_held": self._bytes_held,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                **self._counters,
+            }
+
+    # --- eviction (caller holds self._lock) ---
+
+    def _remove(self, session_id: str, reason: str) -> None:
+        session = self._sessions.pop(session_id)
+        self._bytes_held -= session.size_bytes
+        self._counters[reason] += 1
+
+    def _evict_idle(self, now: float) -> None:
+        cutoff = now - self.idle_ttl_seconds
+        # OrderedDict is in LRU order, so idle sessions are at the front
+        for session_id, session in list(self._sessions.items()):
+            if session.last_seen >= cutoff:
+                break
+            if not session.lock.locked():
+                self._remove(session_id, "evicted_idle")
+
+    def _evict_over_limits(self, keep: str) -> None:
+        for session_id, session in list(self._sessions.items()):
+            over_count = len(self._sessions) > self.max_sessions
+            over_bytes = self._bytes_held > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            if session_id == keep or session.lock.locked():
+                continue
+            self._remove(session_id, "evicted_lru" if over_count else "evicted_memory")
@@ -13,6 +13,15 @@ if _project_root not in sys.path:
 from unittest.mock import MagicMock, patch
 import pytest
 
+import tools.quota
+
+
+@pytest.fixture(autouse=True)
+def fresh_quota():
+    """Each test starts with full Google quota buckets."""
+    tools.quota.reset()
+    yield
+
 
 @pytest.fixture
 def mock_calendar_service():
@@ -0,0 +1,199 @@
+"""
+Tests for the credential manager and the per-account token store in tools/auth.py.
+
+FakeCreds stands in for google.oauth2 Credentials: refresh() hands out a new
+token valid for an hour after an optional delay, so tests can line requests up
+against a refresh in flight.
+"""
+import json
+import os
+import re
+import stat
+import threading
+import time
+from datetime import timedelta
+
+import httplib2
+import pytest
+from google.auth import _helpers
+
+import tools.auth as auth
+from tools.auth import AccountNotAuthorized, CredentialManager, get_creds, token_path, write_token
+
+
+class FakeCreds:
+    def __init__(self, expires_in, delay=0.0, fail=False):
+        self.token = "t0"
+        self.expiry = _helpers.utcnow() + timedelta(seconds=expires_in)
+        self.refresh_token = "r"
+        self.delay = delay
+        self.fail = fail
+        self.refreshes = []
+
+    @property
+    def valid(self):
+        return self.token is not None and self.expiry > _helpers.utcnow()
+
+    def refresh(self, request):
+        self.refreshes.append(request)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("invalid_grant")
+        self.token = f"t{len(self.refreshes)}"
+        self.expiry = _helpers.utcnow() + timedelta(hours=1)
+
+    def apply(self, headers, token=None):
+        headers["authorization"] = f"Bearer {token or self.token}"
+
+    def to_json(self):
+        return json.dumps({"token": self.token, "refresh_token": self.refresh_token})
+
+
+def _manager(creds, tmp_path, **kwargs):
+    return CredentialManager(creds, token_path=str(tmp_path / "token.json"), request_factory=object, **kwargs)
+
+
+def _authorize(manager):
+    headers = {}
+    manager.before_request(None, "GET", "https://www.googleapis.com/x", headers)
+    return headers["authorization"]
+
+
+class TestBackgroundRefresh:
+    def test_refreshes_before_expiry_and_saves_token(self, tmp_path):
+        creds = FakeCreds(expires_in=300.2)
+        manager = _manager(creds, tmp_path, margin=300).start()
+        try:
+            deadline = time.monotonic() + 5
+            while manager.token == "t0" and time.monotonic() < deadline:
+                time.sleep(0.02)
+        finally:
+            manager.close()
+
+        assert _authorize(manager) == "Bearer t1"
+        assert manager.stats()["background_refreshes"] == 1
+        assert json.loads((tmp_path / "token.json").read_text())["token"] == "t1"
+        assert os.listdir(tmp_path) == ["token.json"]
+
+    def test_requests_keep_the_old_token_while_refreshing(self, tmp_path):
+        manager = _manager(FakeCreds(expires_in=3600, delay=0.5), tmp_path)
+        refresher = threading.Thread(target=manager._refresh, args=("t0", "background_refreshes"))
+        refresher.start()
+        time.sleep(0.05)
+
+        started = time.perf_counter()
+        assert _authorize(manager) == "Bearer t0"
+        assert time.perf_counter() - started < 0.1
+
+        refresher.join()
+        assert _authorize(manager) == "Bearer t1"
+
+    def test_no_refresh_token_no_thread(self, tmp_path):
+        creds = FakeCreds(expires_in=3600)
+        creds.refresh_token = None
+        assert _manager(creds, tmp_path).start()._thread is None
+
+
+class TestInlineRefresh:
+    def test_expired_token_is_refreshed_once_for_concurrent_requests(self, tmp_path):
+        creds = FakeCreds(expires_in=-1, delay=0.1)
+        manager = _manager(creds, tmp_path)
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(_authorize(manager))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == ["Bearer t1"] * 8
+        assert manager.stats()["inline_refreshes"] == 1
+
+    def test_401_forces_a_refresh(self, tmp_path):
+        manager = _manager(FakeCreds(expires_in=3600), tmp_path)
+        manager.refresh(None)
+        assert _authorize(manager) == "Bearer t1"
+
+    def test_failed_refresh_is_counted_and_raised(self, tmp_path):
+        manager = _manager(FakeCreds(expires_in=-1, fail=True), tmp_path)
+        with pytest.raises(RuntimeError):
+            _authorize(manager)
+        assert manager.stats()["refresh_failures"] == 1
+        assert not (tmp_path / "token.json").exists()
+
+
+def test_write_token_replaces_file_privately(tmp_path):
+    path = tmp_path / "token.json"
+    path.write_text("old")
+
+    write_token(FakeCreds(expires_in=3600), str(path))
+
+    assert json.loads(path.read_text())["token"] == "t0"
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert os.listdir(tmp_path) == ["token.json"]
+
+
+class TestAccounts:
+    @pytest.fixture(autouse=True)
+    def _token_dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(auth, "TOKEN_DIR", str(tmp_path / "tokens"))
+        monkeypatch.setattr(auth, "TOKEN_PATH", str(tmp_path / "token.json"))
+
+    def test_token_paths(self, tmp_path):
+        assert token_path() == str(tmp_path / "token.json")
+        assert token_path("ann@example.com") == str(tmp_path / "tokens" / "ann@example.com.json")
+        for bad in ["../ann", ".hidden", "a/b", ""]:
+            with pytest.raises(ValueError):
+                token_path(bad)
+
+    def test_unconnected_account_never_prompts(self):
+        with pytest.raises(AccountNotAuthorized):
+            get_creds(account="ann@example.com")
+
+    def test_list_accounts(self, tmp_path):
+        (tmp_path / "tokens").mkdir()
+        (tmp_path / "tokens" / "ann@example.com.json").write_text("{}")
+        (tmp_path / "token.json").write_text("{}")
+
+        assert auth.list_accounts() == ["default", "ann@example.com"]
+        assert auth.has_token("ann@example.com") and not auth.has_token("bob@example.com")
+
+
+class BatchEndpoint:
+    """httplib2.Http stand-in answering a Gmail batch request with one 200 part per sub-request."""
+
+    def __init__(self):
+        self.connections = {}
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.requests.append((uri, method, dict(headers or {})))
+        parts = "".join(
+            f"--b\r\nContent-Type: application/http\r\nContent-ID: <response-{cid}>\r\n\r\n"
+            f'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{{"id": "{n}"}}\r\n'
+            for n, cid in enumerate(re.findall(r"Content-ID: <(.+?)>", body))
+        )
+        headers = {"status": "200", "content-type": "multipart/mixed; boundary=b"}
+        return httplib2.Response(headers), (parts + "--b--").encode()
+
+
+def test_batch_request_through_a_credential_manager_pool(tmp_path):
+    import google_auth_httplib2
+
+    from tools.service import PooledHttp, build
+
+    manager = _manager(FakeCreds(expires_in=3600), tmp_path)
+    endpoint = BatchEndpoint()
+    pool = PooledHttp(manager, transport_factory=lambda creds: google_auth_httplib2.AuthorizedHttp(creds, http=endpoint))
+    gmail = build("gmail", "v1", pool)
+    found = []
+
+    batch = gmail.new_batch_http_request(callback=lambda request_id, response, exception: found.append(response))
+    for message_id in ["a", "b"]:
+        batch.add(gmail.users().messages().get(userId="me", id=message_id))
+    batch.execute()
+
+    assert found == [{"id": "0"}, {"id": "1"}]
+    uri, method, headers = endpoint.requests[0]
+    assert (uri, method) == ("https://gmail.googleapis.com/batch", "POST")
+    assert headers["authorization"] == "Bearer t0"
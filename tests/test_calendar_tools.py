@@ -5,10 +5,14 @@ All Google Calendar API calls are intercepted by patching get_service().
 The underlying tool functions are called via tool.func() to bypass the
 LangChain tool wrapper and test the logic directly.
 """
+import time
 from unittest.mock import MagicMock, call, patch
 
+import httplib2
 import pytest
+from googleapiclient.errors import HttpError
 
+import tools.calendar as calendar_module
 from tools.calendar import (
     create_event,
     delete_event,
@@ -209,6 +213,156 @@ class TestListEventsBetween:
         assert "2026-03-06" in list_call.kwargs["timeMax"]
 
 
+# ---------------------------------------------------------------------------
+# pagination
+# ---------------------------------------------------------------------------
+
+def _paged_list(svc, pages):
+    """events().list(...).execute() returns `pages` in order, chained by nextPageToken."""
+    responses = []
+    for i, items in enumerate(pages):
+        resp = {"items": items}
+        if i < len(pages) - 1:
+            resp["nextPageToken"] = f"p{i + 1}"
+        responses.append(resp)
+    svc.events.return_value.list.return_value.execute.side_effect = responses
+    return svc.events.return_value.list
+
+
+class TestPagination:
+    def _events(self, n, offset=0):
+        return [_make_event(f"evt{offset + i}") for i in range(n)]
+
+    def test_follows_page_tokens_until_complete(self, mock_calendar_service):
+        list_call = _paged_list(mock_calendar_service, [self._events(3), self._events(3, 3), self._events(1, 6)])
+
+        result = list_events_between.func(start_date="2026-01-01", end_date="2026-03-31", max_results=100)
+
+        assert result["count"] == 7
+        assert result["truncated"] is False
+        assert [c.kwargs.get("pageToken") for c in list_call.call_args_list] == [None, "p1", "p2"]
+
+    def test_one_large_page_for_a_quarter(self, mock_calendar_service):
+        list_call = _paged_list(mock_calendar_service, [self._events(5)])
+
+        list_events_between.func(start_date="2026-01-01", end_date="2026-03-31")
+
+        assert list_call.call_count == 1
+        assert list_call.call_args.kwargs["maxResults"] == 251   # default limit + 1 to detect truncation
+
+    def test_limit_stops_paging_and_flags_truncation(self, mock_calendar_service):
+        list_call = _paged_list(mock_calendar_service, [self._events(3), self._events(3, 3), self._events(3, 6)])
+
+        result = list_events_for_day.func(date_str="2026-03-05", max_results=4)
+
+        assert result["count"] == 4
+        assert result["truncated"] is True
+        assert [e["event_id"] for e in result["events"]] == ["evt0", "evt1", "evt2", "evt3"]
+        assert list_call.call_count == 2   # third page never fetched
+
+    def test_exact_limit_is_not_truncated(self, mock_calendar_service):
+        _paged_list(mock_calendar_service, [self._events(4)])
+
+        result = find_events.func(query="x", start_date="2026-03-01", end_date="2026-03-31", max_results=4)
+
+        assert result["truncated"] is False
+
+
+# ---------------------------------------------------------------------------
+# all-calendars mode
+# ---------------------------------------------------------------------------
+
+def _at(hour, day="2026-03-05"):
+    return {"dateTime": f"{day}T{hour:02d}:00:00-05:00"}
+
+
+class TestAllCalendars:
+    calendars = [
+        {"id": "me@x.com", "summary": "Me", "primary": True, "selected": True},
+        {"id": "team@x.com", "summary": "Team", "selected": True},
+        {"id": "holidays", "summary": "Holidays", "selected": True},
+        {"id": "old@x.com", "summary": "Old", "selected": True, "hidden": True},
+        {"id": "off@x.com", "summary": "Unselected"},
+    ]
+
+    @pytest.fixture(autouse=True)
+    def _fresh_calendar_list(self):
+        calendar_module._calendar_lists.clear()
+        yield
+        calendar_module._calendar_lists.clear()
+
+    def _serve(self, svc, events_by_calendar, delay=0.0, failing=()):
+        svc.calendarList.return_value.list.return_value.execute.return_value = {"items": self.calendars}
+        calls = []
+
+        def _list(**params):
+            calls.append(params["calendarId"])
+            req = MagicMock()
+
+            def _execute():
+                time.sleep(delay)
+                if params["calendarId"] in failing:
+                    raise HttpError(httplib2.Response({"status": 404}), b"{}")
+                return {"items": events_by_calendar.get(params["calendarId"], [])}
+
+            req.execute.side_effect = _execute
+            return req
+
+        svc.events.return_value.list.side_effect = _list
+        return calls
+
+    def test_merges_visible_calendars_in_start_order(self, mock_calendar_service):
+        calls = self._serve(mock_calendar_service, {
+            "me@x.com": [_make_event("a", start=_at(9), end=_at(10)), _make_event("d", start=_at(15), end=_at(16))],
+            "team@x.com": [_make_event("b", start=_at(11), end=_at(12)), _make_event("c", start=_at(13), end=_at(14))],
+            "holidays": [_make_event("h", start={"date": "2026-03-05"}, end={"date": "2026-03-06"})],
+        })
+
+        result = list_events_for_day.func(date_str="2026-03-05", calendar_id="all")
+
+        assert sorted(calls) == ["holidays", "me@x.com", "team@x.com"]
+        assert [(e["event_id"], e["calendar_id"]) for e in result["events"]] == [
+            ("h", "holidays"), ("a", "me@x.com"), ("b", "team@x.com"), ("c", "team@x.com"), ("d", "me@x.com"),
+        ]
+        assert result["truncated"] is False
+
+    def test_limit_applies_to_the_merged_list(self, mock_calendar_service):
+        self._serve(mock_calendar_service, {
+            "me@x.com": [_make_event("a", start=_at(9), end=_at(10)), _make_event("c", start=_at(13), end=_at(14))],
+            "team@x.com": [_make_event("b", start=_at(11), end=_at(12))],
+        })
+
+        result = list_events_between.func(start_date="2026-03-05", end_date="2026-03-05",
+                                          calendar_id="all", max_results=2)
+
+        assert [e["event_id"] for e in result["events"]] == ["a", "b"]
+        assert result["truncated"] is True
+
+    def test_calendars_are_fetched_concurrently(self, mock_calendar_service):
+        self._serve(mock_calendar_service, {}, delay=0.2)
+
+        started = time.perf_counter()
+        list_events_for_day.func(date_str="2026-03-05", calendar_id="all")
+
+        assert time.perf_counter() - started < 0.5   # three calendars, not 3 x 0.2 s
+
+    def test_calendar_list_is_cached(self, mock_calendar_service):
+        self._serve(mock_calendar_service, {})
+
+        list_events_for_day.func(date_str="2026-03-05", calendar_id="all")
+        find_events.func(query="x", start_date="2026-03-05", end_date="2026-03-06", calendar_id="all")
+
+        assert mock_calendar_service.calendarList.return_value.list.call_count == 1
+
+    def test_unreadable_calendar_is_reported(self, mock_calendar_service):
+        self._serve(mock_calendar_service, {"me@x.com": [_make_event("a")]}, failing={"team@x.com"})
+
+        result = list_events_for_day.func(date_str="2026-03-05", calendar_id="all")
+
+        assert [e["event_id"] for e in result["events"]] == ["a"]
+        assert list(result["errors"]) == ["team@x.com"]
+
+
 # ---------------------------------------------------------------------------
 # find_events
 # ---------------------------------------------------------------------------
@@ -406,3 +560,57 @@ class TestGetCurrentDatetime:
         # Both should be valid ISO strings; offsets will differ
         assert "T" in result_ny
         assert "T" in result_utc
+
+
+# ---------------------------------------------------------------------------
+# async tool path (agent.ainvoke)
+# ---------------------------------------------------------------------------
+
+class TestAsyncCalendarTools:
+    def test_every_tool_has_a_coroutine(self):
+        tools = [create_event, delete_event, find_events, get_current_datetime,
+                 list_events_between, list_events_for_day, update_event]
+        assert all(t.coroutine is not None for t in tools)
+
+    def test_ainvoke_matches_sync_result(self, mock_calendar_service):
+        import asyncio
+
+        mock_calendar_service.events.return_value.list.return_value.execute.return_value = {
+            "items": [_make_event()]
+        }
+
+        msg = asyncio.run(list_events_for_day.ainvoke(
+            {"type": "tool_call", "id": "c1", "name": "list_events_for_day", "args": {"date_str": "2026-03-05"}}
+        ))
+
+        assert msg.artifact == list_events_for_day.func(date_str="2026-03-05")
+        assert msg.artifact["events"][0]["event_id"] == "evt1"
+
+
+# ---------------------------------------------------------------------------
+# LLM rendering / artifacts
+# ---------------------------------------------------------------------------
+
+class TestEventListRendering:
+    def test_tool_call_returns_compact_content_and_full_artifact(self, mock_calendar_service):
+        mock_calendar_service.events.return_value.list.return_value.execute.return_value = {
+            "items": [_make_event(location="Room A")]
+        }
+
+        msg = list_events_for_day.invoke(
+            {"type": "tool_call", "id": "c1", "name": "list_events_for_day", "args": {"date_str": "2026-03-05"}}
+        )
+
+        assert msg.artifact["events"][0]["htmlLink"] == "https://calendar.google.com/event/evt1"
+        assert "- evt1 | Team Meeting | 2026-03-05T14:00:00-05:00 -> 2026-03-05T15:00:00-05:00 | Room A" in msg.content
+        assert "htmlLink" not in msg.content
+
+    def test_all_day_events_rendered_as_dates(self):
+        from tools.calendar import render_event_list
+
+        text = render_event_list({"count": 1, "events": [
+            {"event_id": "e1", "summary": None, "start": {"date": "2026-03-05"}, "end": {"date": "2026-03-06"}}
+        ]})
+
+        assert "(No title)" in text
+        assert "2026-03-05 (all day)" in text
@@ -0,0 +1,287 @@
+"""
+Tests for tools/eventstore.py.
+
+The cache runs on an in-memory SQLite database against a fake Calendar: a
+MagicMock service whose events().list serves full-sync pages and sync-token deltas
+from plain lists.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from zoneinfo import ZoneInfo
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import tools.eventstore as eventstore
+from tools.eventstore import EventCache
+
+NY = ZoneInfo("America/New_York")
+PRIMARY = "me@example.com"   # what calendarList.get("primary") answers
+
+
+def _event(event_id, start, end, summary=None, **extra):
+    def _t(v):
+        return {"date": v} if len(v) == 10 else {"dateTime": v, "timeZone": "America/New_York"}
+    return {"id": event_id, "summary": summary or event_id, "start": _t(start), "end": _t(end), **extra}
+
+
+def _day(d):
+    start = datetime.fromisoformat(d).replace(tzinfo=NY)
+    return start, start + timedelta(days=1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCalendar:
+    """events.list: full sync in pages of `page_size`, then `deltas` per sync token."""
+
+    def __init__(self, events, page_size=2):
+        self.events = list(events)
+        self.page_size = page_size
+        self.deltas = {}          # sync token -> (changed items, next token)
+        self.expired = set()      # sync tokens that answer 410
+        self.calls = []
+        self.service = MagicMock()
+        self.service.events.return_value.list.side_effect = self._list
+        self.service.calendarList.return_value.get.return_value.execute.return_value = {"id": PRIMARY}
+
+    def _list(self, **params):
+        self.calls.append(params)
+        req = MagicMock()
+        token = params.get("syncToken")
+        if token in self.expired:
+            req.execute.side_effect = HttpError(httplib2.Response({"status": 410}), b"{}")
+        elif token:
+            items, next_token = self.deltas[token]
+            req.execute.return_value = {"items": items, "nextSyncToken": next_token}
+        else:
+            start = int(params.get("pageToken") or 0)
+            page = {"items": self.events[start:start + self.page_size]}
+            if start + self.page_size < len(self.events):
+                page["nextPageToken"] = str(start + self.page_size)
+            else:
+                page["nextSyncToken"] = "t1"
+            req.execute.return_value = page
+        return req
+
+
+@pytest.fixture
+def calendar():
+    return FakeCalendar([
+        _event("standup", "2026-03-05T09:00:00-05:00", "2026-03-05T09:15:00-05:00"),
+        _event("lunch", "2026-03-05T12:00:00-05:00", "2026-03-05T13:00:00-05:00", location="Cafe"),
+        _event("holiday", "2026-03-05", "2026-03-06"),
+        _event("late", "2026-03-05T23:30:00-05:00", "2026-03-06T00:30:00-05:00"),
+        _event("next-week", "2026-03-12T10:00:00-05:00", "2026-03-12T11:00:00-05:00"),
+    ])
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _cache(calendar, clock, **kwargs):
+    return EventCache(path=":memory:", service_factory=lambda: calendar.service, clock=clock, **kwargs)
+
+
+@pytest.fixture
+def cache(calendar, clock):
+    c = _cache(calendar, clock, max_age=30, stale_limit=600)
+    c.sync("primary")
+    calendar.calls.clear()
+    return c
+
+
+def _ids(events):
+    return [e["id"] for e in events]
+
+
+# ---------------------------------------------------------------------------
+# full sync + interval reads
+# ---------------------------------------------------------------------------
+
+class TestFullSync:
+    def test_pages_through_and_keeps_sync_token(self, calendar, clock):
+        c = _cache(calendar, clock)
+
+        assert c.sync("primary") == 5
+        assert c.ready("primary")
+        assert len(calendar.calls) == 3
+        assert all(p["singleEvents"] and "syncToken" not in p for p in calendar.calls)
+        assert c.stats()["calendars"][PRIMARY]["events"] == 5
+
+
+class TestEventsBetween:
+    def test_day_view_in_start_order(self, cache, calendar):
+        events = cache.events_between("primary", *_day("2026-03-05"))
+
+        assert _ids(events) == ["holiday", "standup", "lunch", "late"]
+        assert calendar.calls == []
+
+    def test_overlapping_events_included(self, cache):
+        assert _ids(cache.events_between("primary", *_day("2026-03-06"))) == ["late"]
+
+    def test_all_day_events_use_the_viewer_timezone(self, cache):
+        tokyo = ZoneInfo("Asia/Tokyo")
+        start = datetime(2026, 3, 6, tzinfo=tokyo)
+        assert "holiday" not in _ids(cache.events_between("primary", start, start + timedelta(days=1)))
+        start = datetime(2026, 3, 5, tzinfo=tokyo)
+        assert "holiday" in _ids(cache.events_between("primary", start, start + timedelta(days=1)))
+
+    def test_week_range_and_limit(self, cache):
+        start, _ = _day("2026-03-02")
+        week = cache.events_between("primary", start, start + timedelta(days=14))
+
+        assert _ids(week)[-1] == "next-week"
+        assert len(cache.events_between("primary", start, start + timedelta(days=14), max_results=2)) == 2
+
+    def test_query_matches_text_fields(self, cache):
+        assert _ids(cache.events_between("primary", *_day("2026-03-05"), query="cafe")) == ["lunch"]
+        assert cache.events_between("primary", *_day("2026-03-05"), query="dentist") == []
+
+    def test_primary_alias_and_real_id_share_one_copy(self, cache, calendar):
+        assert _ids(cache.events_between(PRIMARY, *_day("2026-03-05"))) == ["holiday", "standup", "lunch", "late"]
+        cache.put(PRIMARY, _event("new", "2026-03-05T17:00:00-05:00", "2026-03-05T18:00:00-05:00"))
+
+        assert "new" in _ids(cache.events_between("primary", *_day("2026-03-05")))
+        assert calendar.calls == []
+        assert list(cache.stats()["calendars"]) == [PRIMARY]
+        calendar.service.calendarList.return_value.get.assert_called_once()
+
+    def test_other_calendars_not_mixed_in(self, cache):
+        cache.sync("work")
+        cache.put("work", _event("x", "2026-03-05T10:00:00-05:00", "2026-03-05T11:00:00-05:00"))
+        assert "x" not in _ids(cache.events_between("primary", *_day("2026-03-05")))
+
+
+# ---------------------------------------------------------------------------
+# incremental sync + freshness
+# ---------------------------------------------------------------------------
+
+class TestIncrementalSync:
+    def test_applies_changes_with_sync_token(self, cache, calendar):
+        calendar.deltas["t1"] = ([
+            _event("lunch", "2026-03-06T12:00:00-05:00", "2026-03-06T13:00:00-05:00"),
+            {"id": "standup", "status": "cancelled"},
+            _event("dentist", "2026-03-05T15:00:00-05:00", "2026-03-05T16:00:00-05:00"),
+        ], "t2")
+
+        assert cache.sync("primary") == 3
+
+        assert calendar.calls[0]["syncToken"] == "t1"
+        assert _ids(cache.events_between("primary", *_day("2026-03-05"))) == ["holiday", "dentist", "late"]
+        assert "lunch" in _ids(cache.events_between("primary", *_day("2026-03-06")))
+
+    def test_expired_token_falls_back_to_full_sync(self, cache, calendar):
+        calendar.expired.add("t1")
+        calendar.events = calendar.events[:2]
+
+        cache.sync("primary")
+
+        assert cache.stats()["full_syncs"] == 2
+        assert cache.stats()["calendars"][PRIMARY]["events"] == 2
+
+    def test_fresh_cache_makes_no_request(self, cache, calendar, clock):
+        clock.now += 10
+        cache.events_between("primary", *_day("2026-03-05"))
+        assert calendar.calls == []
+
+    def test_stale_cache_serves_and_syncs_in_background(self, cache, calendar, clock):
+        calendar.deltas["t1"] = ([], "t2")
+        clock.now += 60
+
+        assert cache.events_between("primary", *_day("2026-03-05")) is not None
+        cache._sync_threads[PRIMARY].join(timeout=5)
+
+        assert calendar.calls[0]["syncToken"] == "t1"
+        assert cache.stats()["background_syncs"] == 1
+
+    def test_parallel_stale_reads_start_one_sync(self, cache, calendar, clock):
+        calendar.deltas["t1"] = ([], "t2")
+        clock.now += 60
+        list_changes = cache._list_changes
+
+        def _slow(*args):
+            time.sleep(0.05)
+            return list_changes(*args)
+
+        with patch.object(cache, "_list_changes", side_effect=_slow), ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(lambda _: cache.events_between("primary", *_day("2026-03-05")), range(8)))
+            cache._sync_threads[PRIMARY].join(timeout=5)
+
+        assert cache.stats()["background_syncs"] == 1
+        assert len(calendar.calls) == 1
+
+    def test_very_stale_cache_syncs_before_reading(self, cache, calendar, clock):
+        calendar.deltas["t1"] = ([{"id": "lunch", "status": "cancelled"}], "t2")
+        clock.now += 3600
+
+        assert "lunch" not in _ids(cache.events_between("primary", *_day("2026-03-05")))
+
+    def test_unsynced_calendar_falls_back(self, calendar, clock):
+        c = _cache(calendar, clock)
+
+        assert c.events_between("primary", *_day("2026-03-05")) is None
+        c._sync_threads[PRIMARY].join(timeout=5)
+        assert c.ready("primary")
+
+
+# ---------------------------------------------------------------------------
+# write-through
+# ---------------------------------------------------------------------------
+
+class TestWriteThrough:
+    def test_put_and_remove(self, cache):
+        cache.put("primary", _event("new", "2026-03-05T17:00:00-05:00", "2026-03-05T18:00:00-05:00"))
+        cache.put("primary", _event("lunch", "2026-03-05T12:30:00-05:00", "2026-03-05T13:30:00-05:00", summary="Lunch"))
+        cache.remove("primary", "standup")
+
+        events = cache.events_between("primary", *_day("2026-03-05"))
+        assert _ids(events) == ["holiday", "lunch", "new", "late"]
+        assert events[1]["summary"] == "Lunch"
+
+    def test_recurring_series_invalidates(self, cache, clock):
+        cache.put("primary", _event("series", "2026-03-05T08:00:00-05:00", "2026-03-05T08:30:00-05:00",
+                                    recurrence=["RRULE:FREQ=DAILY"]))
+        assert cache.age("primary") > cache.stale_limit
+
+    def test_removing_a_series_removes_its_instances(self, cache):
+        cache.put("primary", _event("series_20260305", "2026-03-05T08:00:00-05:00", "2026-03-05T08:30:00-05:00",
+                                    recurringEventId="series"))
+        cache.remove("primary", "series")
+        assert "series_20260305" not in _ids(cache.events_between("primary", *_day("2026-03-05")))
+
+
+class TestCalendarToolsUseCache:
+    def test_day_view_and_write_through(self, cache, calendar, mock_calendar_service):
+        from tools.calendar import create_event, list_events_for_day
+
+        created = _event("gym", "2026-03-05T18:00:00-05:00", "2026-03-05T19:00:00-05:00")
+        mock_calendar_service.events.return_value.insert.return_value.execute.return_value = created
+        with patch.object(eventstore, "get_cache", return_value=cache):
+            create_event.func(event_name="gym", start=created["start"], end=created["end"])
+            result = list_events_for_day.func(date_str="2026-03-05")
+
+        assert result["source"] == "cache"
+        assert [e["event_id"] for e in result["events"]] == ["holiday", "standup", "lunch", "gym", "late"]
+        mock_calendar_service.events.return_value.list.assert_not_called()
+
+    def test_delete_by_query_resolves_locally(self, cache, mock_calendar_service):
+        from tools.calendar import delete_event
+
+        with patch.object(eventstore, "get_cache", return_value=cache):
+            result = delete_event.func(query="lunch", start_date="2026-03-05", end_date="2026-03-05")
+
+        assert result == {"deleted": True, "event_id": "lunch", "calendar_id": "primary"}
+        mock_calendar_service.events.return_value.list.assert_not_called()
+        assert "lunch" not in _ids(cache.events_between("primary", *_day("2026-03-05")))
@@ -0,0 +1,187 @@
+"""
+Tests for tools/fields.py.
+
+The masks are checked against the code that reads the responses: a recording dict
+notes every key a reader touches, and each path must be covered by the mask sent
+with that call. Byte accounting is checked through PooledHttp and the tool wrapper.
+"""
+import re
+from unittest.mock import MagicMock
+
+import httplib2
+import pytest
+
+from tools.eventstore import _index_span, _matches
+from tools.fields import (
+    FIELDS,
+    event_card,
+    record_response,
+    reset_response_stats,
+    response_stats,
+    tool_scope,
+)
+from tools.gmail import _batch_get_messages, _message_summary, get_message, list_messages
+from tools.service import PooledHttp
+
+
+def _mask_paths(mask, prefix=""):
+    """'a,b(c,d/e),f/g' -> {'a', 'b/c', 'b/d/e', 'f/g'}"""
+    paths, depth, start = set(), 0, 0
+    parts = []
+    for i, ch in enumerate(mask + ","):
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append(mask[start:i])
+            start = i + 1
+    for part in parts:
+        m = re.fullmatch(r"([^(]+)\((.*)\)", part)
+        if m:
+            paths |= _mask_paths(m.group(2), f"{prefix}{m.group(1)}/")
+        else:
+            paths.add(prefix + part)
+    return paths
+
+
+class Recording(dict):
+    """dict that records the path of every key read through [] or get()."""
+
+    def __init__(self, data, reads, prefix=""):
+        super().__init__(data)
+        self._reads, self._prefix = reads, prefix
+
+    def _wrap(self, key, value):
+        path = self._prefix + key
+        self._reads.add(path)
+        if isinstance(value, dict):
+            return Recording(value, self._reads, path + "/")
+        if isinstance(value, list):
+            return [Recording(v, self._reads, path + "/") if isinstance(v, dict) else v for v in value]
+        return value
+
+    def __getitem__(self, key):
+        return self._wrap(key, super().__getitem__(key))
+
+    def get(self, key, default=None):
+        return self._wrap(key, super().get(key, default))
+
+
+def _uncovered(reads, mask):
+    """Reads outside the mask; containers on the way to a masked field count as covered."""
+    paths = _mask_paths(mask)
+    return {
+        r for r in reads
+        if not any(r == p or r.startswith(p + "/") or p.startswith(r + "/") for p in paths)
+    }
+
+
+FULL_MESSAGE = {
+    "id": "m1", "threadId": "t1", "labelIds": ["INBOX"], "snippet": "hi", "internalDate": "1",
+    "historyId": "9", "sizeEstimate": 100,
+    "payload": {"mimeType": "text/plain", "body": {"size": 2},
+                "headers": [{"name": "From", "value": "a@x.com"}, {"name": "Subject", "value": "Hi"}]},
+}
+
+FULL_EVENT = {
+    "id": "e1", "summary": "Lunch", "location": "Cafe", "htmlLink": "https://x", "status": "confirmed",
+    "description": "notes", "etag": "1", "creator": {"email": "a@x.com"}, "reminders": {"useDefault": True},
+    "start": {"dateTime": "2026-03-05T12:00:00-05:00"}, "end": {"dateTime": "2026-03-05T13:00:00-05:00"},
+    "organizer": {"email": "a@x.com", "displayName": "A"},
+    "attendees": [{"email": "b@x.com", "displayName": "B", "responseStatus": "accepted"}],
+}
+
+
+class TestMasksCoverReaders:
+    def test_message_summary(self):
+        reads = set()
+        _message_summary(Recording(FULL_MESSAGE, reads))
+        assert reads and not _uncovered(reads, FIELDS["gmail.messages.get"])
+
+    def test_event_card(self):
+        reads = set()
+        event_card(Recording(FULL_EVENT, reads))
+        assert reads and not _uncovered({f"items/{r}" for r in reads}, FIELDS["calendar.events.list"])
+
+    def test_event_cache(self):
+        reads = set()
+        event = Recording(FULL_EVENT, reads)
+        _index_span(event)
+        _matches(event, ["lunch"])
+        event_card(event)
+        assert not _uncovered({f"items/{r}" for r in reads}, FIELDS["calendar.events.sync"])
+        assert not _uncovered(reads, FIELDS["calendar.events.insert"])
+
+    def test_mask_parser(self):
+        assert _mask_paths("a,b(c,d/e),f/g") == {"a", "b/c", "b/d/e", "f/g"}
+
+
+class TestCallsSendMasks:
+    def test_list_and_get(self, mock_gmail_service):
+        messages = mock_gmail_service.users.return_value.messages.return_value
+        messages.list.return_value.execute.return_value = {"messages": []}
+        messages.get.return_value.execute.return_value = FULL_MESSAGE
+
+        list_messages.func(max_results=5)
+        get_message.func(message_id="m1")
+
+        assert messages.list.call_args.kwargs["fields"] == FIELDS["gmail.messages.list"]
+        assert messages.get.call_args.kwargs["fields"] == FIELDS["gmail.messages.get"]
+
+
+# ---------------------------------------------------------------------------
+# response bytes per tool
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(autouse=True)
+def _fresh_stats():
+    reset_response_stats()
+    yield
+    reset_response_stats()
+
+
+class FakeTransport:
+    def __init__(self, body):
+        self.body = body
+        self.connections = {}
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        return httplib2.Response({"status": "200"}), self.body
+
+
+class TestResponseBytes:
+    def test_pool_counts_bytes_against_current_tool(self):
+        pool = PooledHttp(credentials=object(), size=1, transport_factory=lambda creds: FakeTransport(b"x" * 40))
+
+        with tool_scope("list_events_for_day"):
+            pool.request("https://www.googleapis.com/calendar/v3/x")
+            pool.request("https://www.googleapis.com/calendar/v3/x")
+        pool.request("https://www.googleapis.com/calendar/v3/x")
+
+        assert response_stats() == {
+            "list_events_for_day": {"responses": 2, "bytes": 80},
+            "<other>": {"responses": 1, "bytes": 40},
+        }
+
+    def test_tool_invocation_sets_the_scope(self, mock_gmail_service):
+        def _execute():
+            record_response(123)
+            return {"messages": []}
+
+        messages = mock_gmail_service.users.return_value.messages.return_value
+        messages.list.return_value.execute.side_effect = _execute
+
+        list_messages.invoke({"max_results": 5})
+
+        assert response_stats() == {"list_messages": {"responses": 1, "bytes": 123}}
+
+    def test_batch_threads_inherit_the_scope(self):
+        service = MagicMock()
+        batch = service.new_batch_http_request.return_value
+        batch.execute.side_effect = lambda: record_response(10)
+
+        with tool_scope("get_messages"):
+            _batch_get_messages(service, ["a", "b", "c"], batch_size=1)
+
+        assert response_stats() == {"get_messages": {"responses": 3, "bytes": 30}}
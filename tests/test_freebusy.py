@@ -0,0 +1,173 @@
+"""
+Tests for tools/freebusy.py and the find_free_slots tool.
+
+freebusy.query is answered by a MagicMock service; the interval arithmetic is
+tested directly on epoch-second tuples.
+"""
+import random
+from datetime import date, datetime, time
+from unittest.mock import MagicMock, patch
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import tools.freebusy as freebusy
+from tools.calendar import find_free_slots
+from tools.freebusy import free_slots, merge_intervals, query_busy, working_windows
+
+NY = ZoneInfo("America/New_York")
+H = 3600
+
+
+def _ts(s):
+    return int(datetime.fromisoformat(s).replace(tzinfo=NY).timestamp())
+
+
+# ---------------------------------------------------------------------------
+# merging
+# ---------------------------------------------------------------------------
+
+class TestMergeIntervals:
+    def test_overlapping_touching_and_nested(self):
+        intervals = [(10, 20), (0, 5), (5, 8), (12, 15), (18, 25), (30, 31), (40, 40)]
+        assert merge_intervals(intervals) == [(0, 8), (10, 25), (30, 31)]
+
+    def test_empty(self):
+        assert merge_intervals([]) == []
+
+    def test_numpy_matches_sweep(self):
+        np = pytest.importorskip("numpy")
+        rng = random.Random(7)
+        intervals = []
+        for _ in range(5000):
+            start = rng.randrange(0, 10 ** 6)
+            intervals.append((start, start + rng.randrange(1, 500)))
+
+        with patch.object(freebusy, "np", np), patch.object(freebusy, "NUMPY_MIN_INTERVALS", 1):
+            vectorised = merge_intervals(intervals)
+        assert vectorised == freebusy._merge_sweep(intervals)
+
+
+# ---------------------------------------------------------------------------
+# working hours + slots
+# ---------------------------------------------------------------------------
+
+class TestWorkingWindows:
+    def test_weekdays_only_by_default(self):
+        # Fri 2026-03-06 .. Mon 2026-03-09
+        windows = working_windows(date(2026, 3, 6), date(2026, 3, 9), NY, time(9), time(17))
+        assert windows == [
+            (_ts("2026-03-06T09:00"), _ts("2026-03-06T17:00")),
+            (_ts("2026-03-09T09:00"), _ts("2026-03-09T17:00")),
+        ]
+        assert len(working_windows(date(2026, 3, 6), date(2026, 3, 9), NY, time(9), time(17), True)) == 4
+
+    def test_dst_change_keeps_local_hours(self):
+        # clocks go forward on Sun 2026-03-08
+        (fri_start, _), (mon_start, _) = working_windows(date(2026, 3, 6), date(2026, 3, 9), NY, time(9), time(17))
+        assert mon_start - fri_start == 3 * 24 * H - H
+
+    def test_rejects_inverted_hours(self):
+        with pytest.raises(ValueError):
+            working_windows(date(2026, 3, 6), date(2026, 3, 6), NY, time(17), time(9))
+
+
+class TestFreeSlots:
+    day = (_ts("2026-03-05T09:00"), _ts("2026-03-05T17:00"))
+
+    def test_gaps_between_busy_blocks(self):
+        busy = merge_intervals([
+            (_ts("2026-03-05T08:00"), _ts("2026-03-05T10:00")),
+            (_ts("2026-03-05T11:00"), _ts("2026-03-05T11:20")),
+            (_ts("2026-03-05T11:10"), _ts("2026-03-05T12:00")),
+            (_ts("2026-03-05T16:30"), _ts("2026-03-05T18:00")),
+        ])
+        slots, truncated = free_slots(busy, [self.day], duration=30 * 60)
+
+        assert slots == [
+            (_ts("2026-03-05T10:00"), _ts("2026-03-05T11:00")),
+            (_ts("2026-03-05T12:00"), _ts("2026-03-05T16:30")),
+        ]
+        assert not truncated
+
+    def test_duration_and_step(self):
+        busy = [(_ts("2026-03-05T09:00"), _ts("2026-03-05T10:05")),
+                (_ts("2026-03-05T10:50"), _ts("2026-03-05T17:00"))]
+
+        assert free_slots(busy, [self.day], duration=46 * 60)[0] == []
+        # 10:05 rounds up to 10:15, leaving 35 minutes
+        assert free_slots(busy, [self.day], duration=30 * 60, step=15 * 60)[0] == [
+            (_ts("2026-03-05T10:15"), _ts("2026-03-05T10:50")),
+        ]
+
+    def test_limit_and_not_before(self):
+        days = working_windows(date(2026, 3, 2), date(2026, 3, 6), NY, time(9), time(17))
+
+        slots, truncated = free_slots([], days, duration=H, limit=2, not_before=_ts("2026-03-03T12:07"))
+        assert truncated
+        assert slots == [(_ts("2026-03-03T12:07"), _ts("2026-03-03T17:00")), days[2]]
+
+        slots, _ = free_slots([], days, duration=H, step=30 * 60, not_before=_ts("2026-03-03T12:07"))
+        assert slots[0][0] == _ts("2026-03-03T12:30")
+
+
+# ---------------------------------------------------------------------------
+# freebusy.query + the tool
+# ---------------------------------------------------------------------------
+
+def _freebusy_service(calendars):
+    service = MagicMock()
+    service.freebusy.return_value.query.return_value.execute.return_value = {"calendars": calendars}
+    return service
+
+
+class TestQueryBusy:
+    def test_one_request_for_all_calendars(self):
+        service = _freebusy_service({
+            "me@x.com": {"busy": [{"start": "2026-03-05T15:00:00Z", "end": "2026-03-05T16:00:00Z"}]},
+            "bob@x.com": {"busy": [], "errors": [{"domain": "global", "reason": "notFound"}]},
+        })
+
+        busy, errors = query_busy(service, ["me@x.com", "bob@x.com", "eve@x.com"],
+                                  datetime(2026, 3, 5, tzinfo=NY), datetime(2026, 3, 6, tzinfo=NY))
+
+        assert service.freebusy.return_value.query.call_count == 1
+        body = service.freebusy.return_value.query.call_args.kwargs["body"]
+        assert [item["id"] for item in body["items"]] == ["me@x.com", "bob@x.com", "eve@x.com"]
+        assert busy == [(_ts("2026-03-05T10:00"), _ts("2026-03-05T11:00"))]
+        assert errors == {"bob@x.com": "notFound", "eve@x.com": "notReturned"}
+
+    def test_chunks_past_the_calendar_limit(self):
+        service = _freebusy_service({})
+        query_busy(service, [f"c{i}" for i in range(60)],
+                   datetime(2026, 3, 5, tzinfo=NY), datetime(2026, 3, 6, tzinfo=NY))
+        assert service.freebusy.return_value.query.call_count == 2
+
+
+class TestFindFreeSlotsTool:
+    def test_merges_calendars_into_shared_slots(self, mock_calendar_service):
+        mock_calendar_service.freebusy.return_value.query.return_value.execute.return_value = {"calendars": {
+            "primary": {"busy": [{"start": "2030-03-05T09:00:00-05:00", "end": "2030-03-05T12:00:00-05:00"}]},
+            "bob@x.com": {"busy": [{"start": "2030-03-05T11:30:00-05:00", "end": "2030-03-05T15:00:00-05:00"}]},
+        }}
+
+        result = find_free_slots.func(start_date="2030-03-05", end_date="2030-03-05", duration_minutes=60,
+                                      calendar_ids=["primary", "bob@x.com"])
+
+        assert result["count"] == 1
+        assert result["slots"] == [
+            {"start": "2030-03-05T15:00:00-05:00", "end": "2030-03-05T17:00:00-05:00", "minutes": 120},
+        ]
+        assert mock_calendar_service.freebusy.return_value.query.call_count == 1
+        assert "errors" not in result
+
+    def test_past_range_makes_no_request(self, mock_calendar_service):
+        result = find_free_slots.func(start_date="2020-01-06", end_date="2020-01-10")
+
+        assert result["slots"] == []
+        mock_calendar_service.freebusy.assert_not_called()
+
+    def test_bad_working_hours(self, mock_calendar_service):
+        result = find_free_slots.func(start_date="2030-03-05", end_date="2030-03-05",
+                                      working_hours_start="18:00", working_hours_end="09:00")
+        assert result["error"] == "working hours must end after they start"
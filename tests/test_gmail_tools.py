@@ -14,6 +14,7 @@ from tools.gmail import (
     create_reply_draft,
     delete_message_permanently,
     get_message,
+    get_messages,
     list_messages,
     mark_all_as_read,
     mark_as_read,
@@ -38,6 +39,40 @@ def _drafts_resource(svc):
     return svc.users.return_value.drafts.return_value
 
 
+class FakeBatch:
+    """
+    Stand-in for service.new_batch_http_request(): add() records request ids and
+    execute() invokes the callback per id from `responses` (an Exception = failure).
+    """
+
+    def __init__(self, responses, executed, callback=None):
+        self.responses = responses
+        self.executed = executed
+        self.callback = callback
+        self.ids = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.ids.append(request_id)
+
+    def execute(self, http=None):
+        self.executed.append(list(self.ids))
+        for request_id in self.ids:
+            response = self.responses.get(request_id)
+            if isinstance(response, Exception):
+                self.callback(request_id, None, response)
+            else:
+                self.callback(request_id, response, None)
+
+
+def _install_batch(svc, responses):
+    """Make svc.new_batch_http_request return FakeBatches; returns the list of executed id lists."""
+    executed = []
+    svc.new_batch_http_request.side_effect = (
+        lambda callback=None: FakeBatch(responses, executed, callback)
+    )
+    return executed
+
+
 def _make_message(
     msg_id="msg1",
     thread_id="thread1",
@@ -114,6 +149,62 @@ class TestListMessages:
         assert result["label_ids"] == ["UNREAD"]
 
 
+class TestListMessagesHydrated:
+    def _listing(self, svc, ids):
+        _msgs_resource(svc).list.return_value.execute.return_value = {
+            "messages": [{"id": i, "threadId": f"t-{i}"} for i in ids]
+        }
+
+    def test_hydrate_fetches_all_details_in_one_batch(self, mock_gmail_service):
+        ids = [f"msg{i}" for i in range(20)]
+        self._listing(mock_gmail_service, ids)
+        executed = _install_batch(mock_gmail_service, {i: _make_message(msg_id=i, subject=f"S {i}") for i in ids})
+
+        result = list_messages.func(query="is:unread", max_results=20, hydrate=True)
+
+        assert executed == [ids]   # one HTTP request for 20 messages
+        assert [m["message_id"] for m in result["messages"]] == ids
+        assert result["messages"][3]["headers"]["subject"] == "S msg3"
+        _msgs_resource(mock_gmail_service).get.return_value.execute.assert_not_called()
+
+    def test_more_than_100_ids_split_into_batches(self, mock_gmail_service):
+        ids = [f"m{i}" for i in range(150)]
+        self._listing(mock_gmail_service, ids)
+        executed = _install_batch(mock_gmail_service, {i: _make_message(msg_id=i) for i in ids})
+
+        list_messages.func(max_results=150, hydrate=True)
+
+        assert sorted(len(b) for b in executed) == [50, 100]
+
+    def test_partial_failure_keeps_other_messages(self, mock_gmail_service):
+        self._listing(mock_gmail_service, ["ok", "gone"])
+        _install_batch(mock_gmail_service, {"ok": _make_message(msg_id="ok"), "gone": RuntimeError("404 Not Found")})
+
+        result = list_messages.func(hydrate=True)
+
+        assert result["messages"][0]["headers"]["subject"] == "Test Subject"
+        assert result["messages"][1] == {"message_id": "gone", "thread_id": "t-gone", "error": "404 Not Found"}
+
+    def test_not_hydrated_by_default(self, mock_gmail_service):
+        self._listing(mock_gmail_service, ["msg1"])
+
+        result = list_messages.func()
+
+        mock_gmail_service.new_batch_http_request.assert_not_called()
+        assert result["messages"] == [{"message_id": "msg1", "thread_id": "t-msg1"}]
+
+    def test_hydrated_list_renders_one_line_per_message(self, mock_gmail_service):
+        self._listing(mock_gmail_service, ["msg1"])
+        _install_batch(mock_gmail_service, {"msg1": _make_message()})
+
+        msg = list_messages.invoke({
+            "type": "tool_call", "id": "c1", "name": "list_messages", "args": {"hydrate": True},
+        })
+
+        assert "- msg1 [unread] | Alice <alice@example.com> | Test Subject |" in msg.content
+        assert msg.artifact["messages"][0]["snippet"] == "Hello there"
+
+
 # ---------------------------------------------------------------------------
 # get_message
 # ---------------------------------------------------------------------------
@@ -164,6 +255,80 @@ class TestGetMessage:
         assert get_call.kwargs["id"] == "abc123"
 
 
+# ---------------------------------------------------------------------------
+# get_messages
+# ---------------------------------------------------------------------------
+
+class TestGetMessages:
+    def test_fetches_in_request_order(self, mock_gmail_service):
+        ids = ["b", "a", "c"]
+        executed = _install_batch(mock_gmail_service, {i: _make_message(msg_id=i) for i in ids})
+
+        result = get_messages.func(message_ids=ids)
+
+        assert executed == [ids]
+        assert [m["message_id"] for m in result["messages"]] == ids
+        assert result["count"] == 3 and result["errors"] == []
+
+    def test_duplicate_ids_fetched_once(self, mock_gmail_service):
+        executed = _install_batch(mock_gmail_service, {"a": _make_message(msg_id="a")})
+
+        result = get_messages.func(message_ids=["a", "a"])
+
+        assert executed == [["a"]]
+        assert result["requested"] == 1
+
+    def test_partial_failures_reported(self, mock_gmail_service):
+        import httplib2
+        from googleapiclient.errors import HttpError
+
+        not_found = HttpError(httplib2.Response({"status": 404}), b'{"error": {"message": "Not Found"}}')
+        _install_batch(mock_gmail_service, {"a": _make_message(msg_id="a"), "b": not_found})
+
+        result = get_messages.func(message_ids=["a", "b"])
+
+        assert [m["message_id"] for m in result["messages"]] == ["a"]
+        assert result["errors"] == [{"message_id": "b", "error": "404 Not Found"}]
+
+    def test_failed_batch_request_marks_its_ids(self, mock_gmail_service):
+        def _broken_batch(callback=None):
+            batch = MagicMock()
+            batch.execute.side_effect = OSError("connection reset")
+            return batch
+
+        mock_gmail_service.new_batch_http_request.side_effect = _broken_batch
+
+        result = get_messages.func(message_ids=["a", "b"])
+
+        assert result["count"] == 0
+        assert {e["message_id"] for e in result["errors"]} == {"a", "b"}
+
+    def test_many_ids_use_concurrent_batches_of_50(self, mock_gmail_service):
+        import threading
+        import time
+
+        ids = [f"m{i}" for i in range(200)]
+        threads = set()
+        executed = []
+
+        class SlowBatch(FakeBatch):
+            def execute(self, http=None):
+                threads.add(threading.current_thread().name)
+                time.sleep(0.05)
+                super().execute(http)
+
+        responses = {i: _make_message(msg_id=i) for i in ids}
+        mock_gmail_service.new_batch_http_request.side_effect = (
+            lambda callback=None: SlowBatch(responses, executed, callback)
+        )
+
+        result = get_messages.func(message_ids=ids)
+
+        assert sorted(len(b) for b in executed) == [50, 50, 50, 50]
+        assert len(threads) > 1
+        assert result["count"] == 200
+
+
 # ---------------------------------------------------------------------------
 # trash_message
 # ---------------------------------------------------------------------------
@@ -258,6 +423,51 @@ class TestBatchModifyLabels:
         assert result["remove_label_ids"] == []
 
 
+class TestBatchModifyChunking:
+    def test_splits_into_1000_id_chunks(self, mock_gmail_service):
+        ids = [f"m{i}" for i in range(2500)]
+
+        result = batch_modify_labels.func(message_ids=ids, remove_label_ids=["INBOX"])
+
+        sent = [c.kwargs["body"]["ids"] for c in _msgs_resource(mock_gmail_service).batchModify.call_args_list]
+        assert sorted(len(b) for b in sent) == [500, 1000, 1000]
+        assert sorted(i for b in sent for i in b) == sorted(ids)
+        assert result["count"] == 2500
+        assert [c["ids"] for c in result["chunks"]] == [1000, 1000, 500]
+
+    def test_chunks_pipelined_with_bounded_concurrency(self, mock_gmail_service):
+        import threading
+        import time
+        import tools.gmail as gmail
+
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def _slow_execute():
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.05)
+            with lock:
+                state["active"] -= 1
+
+        _msgs_resource(mock_gmail_service).batchModify.return_value.execute.side_effect = _slow_execute
+
+        batch_modify_labels.func(message_ids=[f"m{i}" for i in range(10_000)], add_label_ids=["STARRED"])
+
+        assert 1 < state["peak"] <= gmail.BATCH_CONCURRENCY
+
+    def test_rendered_summary_omits_chunk_details(self, mock_gmail_service):
+        msg = batch_modify_labels.invoke({
+            "type": "tool_call", "id": "c1", "name": "batch_modify_labels",
+            "args": {"message_ids": [f"m{i}" for i in range(1500)], "remove_label_ids": ["INBOX"]},
+        })
+
+        assert '"chunks":2' in msg.content
+        assert "slowest_chunk_ms" in msg.content
+        assert len(msg.artifact["chunks"]) == 2
+
+
 # ---------------------------------------------------------------------------
 # mark_as_read
 # ---------------------------------------------------------------------------
@@ -437,6 +647,85 @@ class TestMarkAllAsRead:
             mark_all_as_read.func()
 
 
+class TestMarkAllAsReadPagination:
+    def _pages(self, svc, pages_by_token):
+        """list() returns pages_by_token[pageToken]; records the tokens requested."""
+        requested = []
+
+        def _list(**kwargs):
+            requested.append(kwargs.get("pageToken"))
+            req = MagicMock()
+            req.execute.return_value = pages_by_token[kwargs.get("pageToken")]
+            return req
+
+        _msgs_resource(svc).list.side_effect = _list
+        return requested
+
+    def _page(self, start, n, next_token=None):
+        page = {"messages": [{"id": f"m{i}"} for i in range(start, start + n)]}
+        if next_token:
+            page["nextPageToken"] = next_token
+        return page
+
+    def test_pages_through_everything(self, mock_gmail_service):
+        requested = self._pages(mock_gmail_service, {
+            None: self._page(0, 500, "p2"),
+            "p2": self._page(500, 500, "p3"),
+            "p3": self._page(1000, 200),
+        })
+
+        result = mark_all_as_read.func()
+
+        sent = [c.kwargs["body"]["ids"] for c in _msgs_resource(mock_gmail_service).batchModify.call_args_list]
+        assert sorted(len(b) for b in sent) == [200, 1000]
+        assert result["count"] == 1200
+        assert len(result["message_ids"]) == 100 and result["message_ids_truncated"] is True
+        # second pass re-lists from the start, finds nothing new and stops
+        assert result["passes"] == 2
+        assert requested == [None, "p2", "p3", None, "p2", "p3"]
+
+    def test_second_pass_catches_skipped_messages(self, mock_gmail_service):
+        pages = {None: self._page(0, 500, "p2"), "p2": self._page(500, 100)}
+        calls = {"n": 0}
+
+        def _list(**kwargs):
+            calls["n"] += 1
+            req = MagicMock()
+            if calls["n"] == 3:   # re-list: a message the first pass missed shows up
+                req.execute.return_value = {"messages": [{"id": "late"}]}
+            else:
+                req.execute.return_value = pages[kwargs.get("pageToken")]
+            return req
+
+        _msgs_resource(mock_gmail_service).list.side_effect = _list
+
+        result = mark_all_as_read.func()
+
+        assert result["count"] == 601
+        assert result["passes"] == 2
+
+    def test_max_results_caps_total(self, mock_gmail_service):
+        self._pages(mock_gmail_service, {
+            None: self._page(0, 500, "p2"),
+            "p2": self._page(500, 500),
+        })
+
+        result = mark_all_as_read.func(max_results=700)
+
+        assert result["count"] == 700
+        assert result["pages"] == 2
+        assert result["passes"] == 1
+
+    def test_reports_timing(self, mock_gmail_service):
+        self._pages(mock_gmail_service, {None: self._page(0, 3)})
+
+        result = mark_all_as_read.func()
+
+        assert result["chunks"][0]["ids"] == 3
+        assert result["chunks"][0]["ms"] >= 0
+        assert result["elapsed_ms"] >= 0
+
+
 # ---------------------------------------------------------------------------
 # create_draft
 # ---------------------------------------------------------------------------
@@ -636,3 +925,64 @@ class TestCreateReplyDraft:
         # get_message must be called first
         _msgs_resource(mock_gmail_service).get.assert_called_once()
         _drafts_resource(mock_gmail_service).create.assert_called_once()
+
+
+# ---------------------------------------------------------------------------
+# async tool path (agent.ainvoke)
+# ---------------------------------------------------------------------------
+
+class TestAsyncGmailTools:
+    def test_every_tool_has_a_coroutine(self):
+        tools = [batch_modify_labels, create_draft, create_reply_draft, delete_message_permanently,
+                 get_message, get_messages, list_messages, mark_all_as_read, mark_as_read, mark_as_unread,
+                 send_draft, trash_message, update_draft]
+        assert all(t.coroutine is not None for t in tools)
+
+    def test_ainvoke_runs_tool_off_the_event_loop(self, mock_gmail_service):
+        import asyncio
+        import threading
+
+        seen_threads = []
+
+        def _execute():
+            seen_threads.append(threading.current_thread().name)
+            return _make_message()
+
+        _msgs_resource(mock_gmail_service).get.return_value.execute.side_effect = _execute
+
+        msg = asyncio.run(get_message.ainvoke(
+            {"type": "tool_call", "id": "c1", "name": "get_message", "args": {"message_id": "msg1"}}
+        ))
+
+        assert msg.artifact["message_id"] == "msg1"
+        assert seen_threads[0].startswith("google-io")
+
+
+# ---------------------------------------------------------------------------
+# LLM rendering / artifacts
+# ---------------------------------------------------------------------------
+
+class TestMessageRendering:
+    def test_get_message_content_is_compact_text(self, mock_gmail_service):
+        _msgs_resource(mock_gmail_service).get.return_value.execute.return_value = _make_message()
+
+        msg = get_message.invoke(
+            {"type": "tool_call", "id": "c1", "name": "get_message", "args": {"message_id": "msg1"}}
+        )
+
+        assert msg.artifact["headers"]["subject"] == "Test Subject"
+        assert msg.content.startswith("message_id=msg1 thread_id=thread1 labels=INBOX,UNREAD")
+        assert "subject: Test Subject" in msg.content
+        assert "cc:" not in msg.content   # empty headers are dropped
+
+    def test_write_tools_render_compact_json(self, mock_gmail_service):
+        _msgs_resource(mock_gmail_service).trash.return_value.execute.return_value = {
+            "id": "msg1", "threadId": "t1", "labelIds": []
+        }
+
+        msg = trash_message.invoke(
+            {"type": "tool_call", "id": "c1", "name": "trash_message", "args": {"message_id": "msg1"}}
+        )
+
+        assert msg.content == '{"trashed":true,"message_id":"msg1","thread_id":"t1"}'
+        assert msg.artifact["label_ids"] == []
@@ -0,0 +1,328 @@
+"""
+Tests for history.py.
+
+Token counting is replaced with a word counter and the summarizer with a fake,
+so the budget arithmetic is easy to follow and no LLM is called.
+"""
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from history import (
+    SUMMARY_NAME,
+    HistoryManager,
+    count_tokens,
+    render_transcript,
+)
+
+
+def word_count(messages):
+    """1 token per word, no per-message overhead."""
+    total = 0
+    for m in messages:
+        content = getattr(m, "content", None)
+        if content is None and isinstance(m, dict):
+            content = m.get("content")
+        total += len((content or "").split())
+    return total
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def summarize(self, summary, messages):
+        self.calls.append((summary, messages))
+        return f"summary#{len(self.calls)}"
+
+    async def asummarize(self, summary, messages):
+        return self.summarize(summary, messages)
+
+
+def _turn(i, words=10):
+    return [
+        HumanMessage(content=f"question {i} " + "w " * (words - 2)),
+        AIMessage(content=f"answer {i} " + "w " * (words - 2)),
+    ]
+
+
+def _history(turns, words=10):
+    msgs = [SystemMessage(content="system prompt")]
+    for i in range(turns):
+        msgs += _turn(i, words)
+    return msgs
+
+
+def _manager(summarizer=None, budget=50, min_recent_turns=2):
+    return HistoryManager(
+        summarizer=summarizer or FakeSummarizer(),
+        token_budget=budget,
+        min_recent_turns=min_recent_turns,
+        count=word_count,
+    )
+
+
+# ---------------------------------------------------------------------------
+# prepare
+# ---------------------------------------------------------------------------
+
+class TestPrepare:
+    def test_under_budget_is_unchanged(self):
+        summarizer = FakeSummarizer()
+        msgs = _history(2)
+
+        prepared, report = _manager(summarizer, budget=1000).prepare(msgs)
+
+        assert prepared == msgs
+        assert report.tokens_saved == 0
+        assert summarizer.calls == []
+
+    def test_over_budget_folds_old_turns_into_summary(self):
+        summarizer = FakeSummarizer()
+        msgs = _history(6)   # 6 turns x 20 words + system
+
+        prepared, report = _manager(summarizer, budget=50).prepare(msgs)
+
+        assert prepared[0].content == "system prompt"
+        assert prepared[1].name == SUMMARY_NAME
+        assert "summary#1" in prepared[1].content
+        # the last turn's question and answer are kept verbatim
+        assert prepared[-1].content.startswith("answer 5")
+        assert report.turns_folded > 0
+        assert report.prompt_tokens <= 50 + 10  # budget + summary header words
+
+    def test_keeps_min_recent_turns_even_when_over_budget(self):
+        msgs = _history(4, words=40)
+
+        prepared, _ = _manager(budget=10, min_recent_turns=2).prepare(msgs)
+
+        humans = [m for m in prepared if isinstance(m, HumanMessage)]
+        assert [h.content.split()[1] for h in humans] == ["2", "3"]
+
+    def test_tool_results_stay_with_their_turn(self):
+        msgs = [SystemMessage(content="system")]
+        for i in range(4):
+            msgs += [
+                HumanMessage(content=f"q{i} " + "w " * 10),
+                AIMessage(content="", tool_calls=[{"name": "get_message", "args": {}, "id": f"c{i}"}]),
+                ToolMessage(content="w " * 10, name="get_message", tool_call_id=f"c{i}"),
+                AIMessage(content=f"a{i}"),
+            ]
+
+        prepared, _ = _manager(budget=30, min_recent_turns=1).prepare(msgs)
+
+        call_ids = {m.tool_call_id for m in prepared if isinstance(m, ToolMessage)}
+        ai_call_ids = {c["id"] for m in prepared if isinstance(m, AIMessage) for c in m.tool_calls}
+        assert call_ids == ai_call_ids
+
+    def test_rolling_summary_is_updated_not_duplicated(self):
+        summarizer = FakeSummarizer()
+        manager = _manager(summarizer, budget=50)
+
+        prepared, _ = manager.prepare(_history(6))
+        prepared += _turn(6) + _turn(7)
+        prepared, report = manager.prepare(prepared)
+
+        summaries = [m for m in prepared if getattr(m, "name", None) == SUMMARY_NAME]
+        assert len(summaries) == 1
+        assert summarizer.calls[1][0].endswith("summary#1")
+        assert "summary#2" in summaries[0].content
+
+    def test_savings_include_previously_folded_turns(self):
+        manager = _manager(budget=50)
+        prepared, first = manager.prepare(_history(6))
+        prepared.append(HumanMessage(content="short"))
+
+        _, second = manager.prepare(prepared)
+
+        # nothing new folded, but the earlier summary keeps saving tokens
+        assert second.turns_folded == 0
+        assert second.tokens_saved > 0
+
+    def test_summarizer_failure_falls_back(self):
+        class Broken:
+            def summarize(self, summary, messages):
+                raise RuntimeError("model down")
+
+        prepared, report = _manager(Broken(), budget=50).prepare(_history(6))
+
+        assert prepared[1].name == SUMMARY_NAME
+        assert "User asked: question 0" in prepared[1].content
+
+    def test_dict_messages_supported(self):
+        msgs = [{"role": "system", "content": "system"}]
+        for i in range(6):
+            msgs += [{"role": "user", "content": f"q{i} " + "w " * 10},
+                     {"role": "assistant", "content": f"a{i} " + "w " * 10}]
+
+        prepared, report = _manager(budget=50).prepare(msgs)
+
+        assert prepared[0] == {"role": "system", "content": "system"}
+        assert report.turns_folded > 0
+
+    def test_aprepare_matches_prepare(self):
+        msgs = _history(6)
+        sync_prepared, _ = _manager(budget=50).prepare(msgs)
+        async_prepared, _ = asyncio.run(_manager(budget=50).aprepare(msgs))
+
+        assert [m.content for m in sync_prepared] == [m.content for m in async_prepared]
+
+    def test_stats_accumulate(self):
+        manager = _manager(budget=50)
+        manager.prepare(_history(6))
+        manager.prepare(_history(1))
+
+        stats = manager.stats()
+        assert stats["turns"] == 2
+        assert stats["compactions"] == 1
+        assert stats["tokens_saved"] > 0
+
+
+# ---------------------------------------------------------------------------
+# helpers
+# ---------------------------------------------------------------------------
+
+class TestHelpers:
+    def test_count_tokens_grows_with_content(self):
+        short = count_tokens([{"role": "user", "content": "hi"}])
+        long = count_tokens([{"role": "user", "content": "hi " * 200}])
+        assert long > short > 0
+
+    def test_transcript_truncates_tool_output(self):
+        text = render_transcript([
+            HumanMessage(content="list my mail"),
+            ToolMessage(content="x" * 5000, name="list_messages", tool_call_id="c1"),
+        ])
+        assert "User: list my mail" in text
+        assert "Tool list_messages returned:" in text
+        assert len(text) < 1000
+
+
+# ---------------------------------------------------------------------------
+# stale tool result elision
+# ---------------------------------------------------------------------------
+
+class TestElideToolResults:
+    def _events_payload(self, n=5):
+        import json
+        return json.dumps({
+            "count": n,
+            "events": [{"event_id": f"evt{i}", "summary": "Meeting " + "x" * 100} for i in range(n)],
+        })
+
+    def _history_with_tool_turn(self, store):
+        return [
+            SystemMessage(content="system"),
+            HumanMessage(content="what's on today?"),
+            AIMessage(content="", tool_calls=[
+                {"name": "list_events_for_day", "args": {"date_str": "2026-03-05"}, "id": "call1"}
+            ]),
+            ToolMessage(content=self._events_payload(), name="list_events_for_day", tool_call_id="call1"),
+            AIMessage(content="You have 5 events."),
+            HumanMessage(content="thanks, and tomorrow?"),
+        ]
+
+    def _manager(self, store):
+        return HistoryManager(token_budget=100000, count=count_tokens, tool_results=store)
+
+    def test_earlier_turn_tool_result_becomes_stub(self):
+        import json
+        from history import ToolResultStore
+
+        store = ToolResultStore()
+        prepared, report = self._manager(store).prepare(self._history_with_tool_turn(store))
+
+        stub = prepared[3]
+        data = json.loads(stub.content)
+        assert data["elided"] is True
+        assert data["tool"] == "list_events_for_day"
+        assert "2026-03-05" in data["args"]
+        assert data["ids"] == ["evt0", "evt1", "evt2", "evt3", "evt4"]
+        assert data["ref"] == "call1"
+        assert stub.tool_call_id == "call1"
+        assert report.tool_results_elided == 1
+        assert report.tokens_saved > 0
+
+    def test_full_payload_recallable(self):
+        from history import ToolResultStore, recall_tool_result
+        import history
+
+        store = ToolResultStore()
+        msgs = self._history_with_tool_turn(store)
+        self._manager(store).prepare(msgs)
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(history, "tool_results", store)
+            assert recall_tool_result.func(ref="call1") == msgs[3].content
+            assert "error" in recall_tool_result.func(ref="missing")
+
+    def test_other_sessions_cannot_recall(self):
+        from history import ToolResultStore, recall_tool_result, tool_result_scope
+        import history
+
+        store = ToolResultStore()
+        msgs = self._history_with_tool_turn(store)
+        with tool_result_scope("session-a", "ann@example.com"):
+            self._manager(store).prepare(msgs)
+
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(history, "tool_results", store)
+            with tool_result_scope("session-b", "bob@example.com"):
+                assert "error" in recall_tool_result.func(ref="call1")
+            with tool_result_scope("session-b", "ann@example.com"):
+                assert "error" in recall_tool_result.func(ref="call1")
+            assert "error" in recall_tool_result.func(ref="call1")   # no session
+            with tool_result_scope("session-a", "ann@example.com"):
+                assert recall_tool_result.func(ref="call1") == msgs[3].content
+
+    def test_current_turn_results_are_kept(self):
+        from history import ToolResultStore
+
+        store = ToolResultStore()
+        msgs = self._history_with_tool_turn(store)[:-1]   # the tool turn is the current one
+
+        prepared, report = self._manager(store).prepare(msgs)
+
+        assert prepared[3].content == msgs[3].content
+        assert report.tool_results_elided == 0
+
+    def test_small_results_are_kept(self):
+        from history import ToolResultStore
+
+        store = ToolResultStore()
+        msgs = [
+            HumanMessage(content="delete it"),
+            AIMessage(content="", tool_calls=[{"name": "delete_event", "args": {}, "id": "c1"}]),
+            ToolMessage(content='{"deleted": true}', name="delete_event", tool_call_id="c1"),
+            HumanMessage(content="next"),
+        ]
+
+        prepared, report = self._manager(store).prepare(msgs)
+
+        assert prepared[2].content == '{"deleted": true}'
+        assert report.tool_results_elided == 0
+
+    def test_stub_not_elided_twice_and_keeps_reporting_savings(self):
+        from history import ToolResultStore
+
+        store = ToolResultStore()
+        manager = self._manager(store)
+        prepared, first = manager.prepare(self._history_with_tool_turn(store))
+        prepared += [AIMessage(content="Nothing tomorrow."), HumanMessage(content="ok")]
+
+        _, second = manager.prepare(prepared)
+
+        assert second.tool_results_elided == 0
+        assert second.tokens_saved == first.tokens_saved
+
+    def test_store_evicts_oldest_over_capacity(self):
+        from history import ToolResultStore
+
+        store = ToolResultStore(max_entries=2)
+        for i in range(3):
+            store.put(f"c{i}", "get_message", {}, "payload")
+
+        assert store.get("c0") is None
+        assert store.get("c2")["content"] == "payload"
+        assert store.stats()["entries"] == 2
@@ -0,0 +1,481 @@
+"""
+Tests for tools/mailstore.py.
+
+The mirror runs on an in-memory SQLite database against a fake mailbox: a
+MagicMock service for messages.list / history.list / getProfile, and a patched
+batch fetch that reads from the same dict.
+"""
+from unittest.mock import MagicMock, patch
+
+import json
+import sqlite3
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import tools.mailstore as mailstore
+import tools.retry as retry
+from tools.mailstore import MailMirror, parse_query, parse_search
+
+
+def _summary(i, labels=("INBOX", "UNREAD"), subject=None):
+    return {
+        "message_id": f"m{i}",
+        "thread_id": f"t{i}",
+        "label_ids": list(labels),
+        "snippet": f"snippet {i}",
+        "internalDate": str(1_700_000_000_000 + i),
+        "headers": {"from": f"sender{i}@example.com", "subject": subject or f"Subject {i}", "date": "d"},
+    }
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeGmail:
+    """Mailbox dict + the handful of API calls the mirror makes."""
+
+    def __init__(self, summaries, page_size=2):
+        self.mailbox = {s["message_id"]: s for s in summaries}
+        self.page_size = page_size
+        self.history = []            # list of (history response pages)
+        self.history_error = None
+        self.part_errors = {}        # message id -> errors its next batch gets return, in order
+        self.list_kwargs = []
+        self.fetched = []            # ids of each batch get
+        self.service = MagicMock()
+        users = self.service.users.return_value
+        users.getProfile.return_value.execute.return_value = {"historyId": "100"}
+        users.messages.return_value.list.side_effect = self._list
+        users.history.return_value.list.side_effect = self._history
+
+    def _list(self, userId, maxResults, pageToken=None, includeSpamTrash=None, fields=None):
+        self.list_kwargs.append({"includeSpamTrash": includeSpamTrash})
+        ids = sorted(self.mailbox, key=lambda i: -int(self.mailbox[i]["internalDate"]))
+        start = int(pageToken or 0)
+        page = {"messages": [{"id": i} for i in ids[start:start + self.page_size]]}
+        if start + self.page_size < len(ids):
+            page["nextPageToken"] = str(start + self.page_size)
+        req = MagicMock()
+        req.execute.return_value = page
+        return req
+
+    def _history(self, userId, startHistoryId, maxResults, pageToken=None, fields=None):
+        req = MagicMock()
+        if self.history_error is not None:
+            req.execute.side_effect = self.history_error
+        else:
+            req.execute.return_value = self.history[int(pageToken or 0)]
+        return req
+
+    def batch_get(self, service, ids, user_id="me", **kwargs):
+        self.fetched.append(list(ids))
+        errors = {i: self.part_errors[i].pop(0) for i in ids if self.part_errors.get(i)}
+        found = {i: self.mailbox[i] for i in ids if i in self.mailbox and i not in errors}
+        errors.update({i: "404 Not Found" for i in ids if i not in self.mailbox})
+        return found, errors
+
+
+@pytest.fixture
+def gmail():
+    fake = FakeGmail([_summary(i) for i in range(5)])
+    with patch.object(mailstore, "_batch_get_messages", side_effect=fake.batch_get):
+        yield fake
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(retry, "BACKOFF_BASE", 0.001)
+
+
+def _mirror(gmail, clock, **kwargs):
+    return MailMirror(path=":memory:", service_factory=lambda: gmail.service, clock=clock, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# backfill
+# ---------------------------------------------------------------------------
+
+class TestBackfill:
+    def test_mirrors_every_page(self, gmail, clock):
+        mirror = _mirror(gmail, clock)
+
+        assert mirror.backfill() == 5
+        assert mirror.ready
+        assert mirror.history_id == "100"
+        assert mirror.stats()["messages"] == 5
+
+    def test_backfill_cap(self, gmail, clock):
+        mirror = _mirror(gmail, clock, backfill_max=3)
+        assert mirror.backfill() == 3
+
+    def test_lists_spam_and_trash(self, gmail, clock):
+        _mirror(gmail, clock).backfill()
+        assert all(kwargs["includeSpamTrash"] is True for kwargs in gmail.list_kwargs)
+
+    def test_failed_parts_are_retried(self, gmail, clock, fast_retries):
+        gmail.part_errors = {"m1": ["429 Too Many Requests", "503 Service Unavailable"],
+                             "m3": ["403 User-rate limit exceeded"]}
+        mirror = _mirror(gmail, clock)
+
+        assert mirror.backfill() == 5
+        assert mirror.ready
+        assert mirror.stats()["messages"] == 5
+        assert mirror.stats()["fetch_retries"] == 3
+
+    def test_transient_failures_resume_with_just_those_ids(self, gmail, clock, fast_retries):
+        gmail.part_errors = {"m2": ["500 Internal Server Error"] * retry.MAX_ATTEMPTS}
+        mirror = _mirror(gmail, clock)
+
+        assert mirror.backfill() == 4
+        assert not mirror.ready
+        assert mirror.stats()["fetch_missing"] == 1
+
+        assert mirror.list_messages("is:unread") is None
+        assert mirror._backfill_thread is None            # the retry isn't due yet
+        clock.now += mailstore.BACKFILL_RETRY_BASE
+        gmail.fetched.clear()
+        assert mirror.list_messages("is:unread") is None
+        mirror._backfill_thread.join(timeout=5)
+
+        assert gmail.fetched == [["m2"]]
+        assert mirror.ready
+        assert mirror.stats()["messages"] == 5
+
+    def test_gives_up_on_transient_failures_after_max_attempts(self, gmail, clock, fast_retries):
+        gmail.part_errors = {"m2": ["503 Service Unavailable"] * 100}
+        mirror = _mirror(gmail, clock)
+
+        for _ in range(mailstore.BACKFILL_MAX_ATTEMPTS):
+            mirror.backfill()
+
+        assert mirror.ready
+        assert mirror.stats()["unfetchable"] == 1
+
+    def test_permanent_failure_does_not_block_or_repeat_the_backfill(self, gmail, clock, fast_retries):
+        gmail.part_errors = {"m4": ["400 Bad Request"] * 100}
+        mirror = _mirror(gmail, clock, max_age=30)
+
+        assert mirror.list_messages("is:unread") is None
+        mirror._backfill_thread.join(timeout=5)
+        first = mirror._backfill_thread
+        fetched = len(gmail.fetched)
+        gmail.history = [{"history": [], "historyId": "100"}]
+
+        assert mirror.list_messages("is:unread") is not None
+        assert mirror._backfill_thread is first
+        assert len(gmail.fetched) == fetched
+        assert mirror.stats()["unfetchable"] == 1
+        assert json.loads(mirror._get_meta("failed_ids")) == {"m4": "400 Bad Request"}
+
+    def test_rebuild_keeps_rows_until_the_listing_is_done(self, gmail, clock):
+        mirror = _mirror(gmail, clock)
+        mirror.backfill()
+        del gmail.mailbox["m0"]
+        seen = []
+        fetch = gmail.batch_get
+
+        def _batch_get(*args, **kwargs):
+            seen.append(mirror.stats()["messages"])
+            return fetch(*args, **kwargs)
+
+        with patch.object(mailstore, "_batch_get_messages", side_effect=_batch_get):
+            mirror.backfill()
+
+        assert seen[0] == 5
+        assert mirror.stats()["messages"] == 4
+        assert mirror.get_message("m0") is None
+
+    def test_first_read_starts_backfill_and_falls_back(self, gmail, clock):
+        mirror = _mirror(gmail, clock)
+
+        assert mirror.list_messages("is:unread") is None
+        mirror._backfill_thread.join(timeout=5)
+        assert mirror.ready
+        assert mirror.stats()["fallbacks"] == 1
+
+
+# ---------------------------------------------------------------------------
+# reads
+# ---------------------------------------------------------------------------
+
+class TestReads:
+    @pytest.fixture
+    def mirror(self, gmail, clock):
+        m = _mirror(gmail, clock)
+        m.backfill()
+        return m
+
+    def test_lists_newest_first(self, mirror):
+        summaries, more = mirror.list_messages(max_results=3)
+        assert [s["message_id"] for s in summaries] == ["m4", "m3", "m2"]
+        assert more is True
+
+    def test_label_and_query_filters(self, mirror):
+        mirror.upsert([_summary(9, labels=("INBOX",)), _summary(8, labels=("INBOX", "TRASH"))])
+
+        unread, _ = mirror.list_messages("is:unread", ["INBOX"], max_results=50)
+        read, _ = mirror.list_messages("is:read", max_results=50)
+        trash, _ = mirror.list_messages("in:trash", max_results=50)
+
+        assert "m9" not in {s["message_id"] for s in unread}
+        assert [s["message_id"] for s in read] == ["m9"]          # trashed m8 hidden by default
+        assert [s["message_id"] for s in trash] == ["m8"]
+
+    def test_unsupported_query_falls_back(self, mirror):
+        assert mirror.list_messages("from:alice") is None
+
+    def test_get_message_matches_live_shape(self, mirror):
+        got = mirror.get_message("m2")
+        expected = _summary(2)
+        assert {k: v for k, v in got.items() if k != "headers"} == \
+            {k: v for k, v in expected.items() if k != "headers"}
+        assert {k: v for k, v in got["headers"].items() if v is not None} == expected["headers"]
+        assert mirror.get_message("missing") is None
+
+
+# ---------------------------------------------------------------------------
+# incremental sync
+# ---------------------------------------------------------------------------
+
+class TestSync:
+    @pytest.fixture
+    def mirror(self, gmail, clock):
+        m = _mirror(gmail, clock, max_age=30)
+        m.backfill()
+        return m
+
+    def test_applies_history(self, gmail, mirror):
+        gmail.mailbox["m10"] = _summary(10)
+        gmail.history = [{
+            "history": [
+                {"messagesAdded": [{"message": {"id": "m10"}}]},
+                {"labelsRemoved": [{"message": {"id": "m1"}, "labelIds": ["UNREAD"]}]},
+                {"labelsAdded": [{"message": {"id": "m2"}, "labelIds": ["STARRED"]}]},
+                {"messagesDeleted": [{"message": {"id": "m0"}}]},
+            ],
+            "historyId": "150",
+        }]
+
+        assert mirror.sync() == 4
+
+        assert mirror.get_message("m10")["headers"]["subject"] == "Subject 10"
+        assert mirror.get_message("m1")["label_ids"] == ["INBOX"]
+        assert "STARRED" in mirror.get_message("m2")["label_ids"]
+        assert mirror.get_message("m0") is None
+        assert mirror.history_id == "150"
+
+    def test_stale_read_syncs_first(self, gmail, mirror, clock):
+        gmail.history = [{"history": [], "historyId": "120"}]
+        clock.now += 31
+
+        mirror.list_messages("is:unread")
+
+        assert mirror.history_id == "120"
+        assert mirror.stats()["syncs"] == 1
+
+    def test_fresh_read_does_not_sync(self, gmail, mirror, clock):
+        clock.now += 5
+        mirror.list_messages("is:unread")
+        gmail.service.users.return_value.history.return_value.list.assert_not_called()
+
+    def test_invalidate_forces_sync(self, gmail, mirror):
+        gmail.history = [{"history": [], "historyId": "101"}]
+        mirror.invalidate()
+
+        mirror.get_message("m1")
+
+        assert mirror.stats()["syncs"] == 1
+
+    def test_expired_history_rebuilds_in_the_background(self, gmail, mirror, clock):
+        gmail.history_error = HttpError(httplib2.Response({"status": 404}), b"{}")
+        del gmail.mailbox["m4"]
+        clock.now += 31
+
+        assert mirror.list_messages("is:unread") is None  # not ready: Gmail answers meanwhile
+        mirror._backfill_thread.join(timeout=5)
+
+        assert mirror.ready
+        assert mirror.stats()["messages"] == 4
+        assert mirror.stats()["backfills"] == 2
+
+    def test_unfetched_additions_are_replayed(self, gmail, mirror, fast_retries):
+        gmail.mailbox["m10"] = _summary(10)
+        gmail.part_errors = {"m10": ["503 Service Unavailable"] * retry.MAX_ATTEMPTS}
+        gmail.history = [{"history": [{"messagesAdded": [{"message": {"id": "m10"}}]}], "historyId": "150"}]
+
+        mirror.sync()
+        assert mirror.history_id == "100"
+
+        mirror.sync()
+        assert mirror.history_id == "150"
+        assert mirror.get_message("m10") is not None
+
+
+class TestParseQuery:
+    def test_supported_terms(self):
+        assert parse_query("is:unread in:inbox") == (["UNREAD", "INBOX"], [])
+        assert parse_query("is:read -is:starred") == ([], ["UNREAD", "STARRED"])
+        assert parse_query(None) == ([], [])
+
+    def test_anything_else_is_unsupported(self):
+        assert parse_query("from:bob is:unread") is None
+        assert parse_query("invoice") is None
+
+
+# ---------------------------------------------------------------------------
+# full-text search
+# ---------------------------------------------------------------------------
+
+def _mail(i, subject, sender="someone@example.com", snippet="", labels=("INBOX",)):
+    s = _summary(i, labels=labels, subject=subject)
+    s["headers"]["from"] = sender
+    s["snippet"] = snippet
+    return s
+
+
+class TestSearch:
+    @pytest.fixture
+    def mirror(self, gmail, clock):
+        m = _mirror(gmail, clock)
+        m.backfill()
+        m.upsert([
+            _mail(20, "Quarterly invoice", "billing@acme.com", "Your invoice for Q3 is attached"),
+            _mail(21, "Lunch?", "alice@example.com", "we could talk about the invoice", labels=("INBOX", "UNREAD")),
+            _mail(22, "Team offsite agenda", "bob@example.com", "offsite team dinner on Friday"),
+            _mail(23, "Old invoice", "billing@acme.com", "", labels=("TRASH",)),
+        ])
+        return m
+
+    def _ids(self, hits):
+        return [h["message_id"] for h in hits]
+
+    def test_subject_match_outranks_snippet_match(self, mirror):
+        hits = mirror.search("invoice")
+        assert self._ids(hits) == ["m20", "m21"]          # m23 is in the trash
+        assert hits[0]["score"] > hits[1]["score"]
+        assert hits[0]["headers"]["subject"] == "Quarterly invoice"
+
+    def test_operators(self, mirror):
+        assert self._ids(mirror.search("from:alice")) == ["m21"]
+        assert self._ids(mirror.search("invoice -lunch")) == ["m20"]
+        assert self._ids(mirror.search('"team offsite"')) == ["m22"]
+        assert self._ids(mirror.search('"offsite agenda team"')) == []
+        assert self._ids(mirror.search("quart*")) == ["m20"]
+        assert self._ids(mirror.search("quart")) == []
+
+    def test_label_filters(self, mirror):
+        assert self._ids(mirror.search("invoice is:unread")) == ["m21"]
+        assert self._ids(mirror.search("invoice", label_ids=["UNREAD"])) == ["m21"]
+        assert self._ids(mirror.search("invoice in:trash")) == ["m23"]
+
+    def test_index_follows_changes(self, mirror):
+        mirror.upsert([_mail(24, "Invoice reminder", "billing@acme.com")])
+        mirror.change_labels("m21", remove=["UNREAD"])
+        mirror.upsert([_mail(20, "Quarterly statement", "billing@acme.com")])
+        mirror.delete(["m22"])
+
+        assert "m24" in self._ids(mirror.search("invoice"))
+        assert self._ids(mirror.search("invoice is:unread")) == []
+        assert self._ids(mirror.search("quarterly")) == ["m20"]
+        assert "m20" not in self._ids(mirror.search("invoice"))
+        assert self._ids(mirror.search("offsite")) == []
+
+    def test_colliding_rowids_keep_both_messages(self, mirror):
+        same_date = {"internalDate": "1700000000999"}
+        with patch.object(mailstore, "_doc_key", lambda internal_date, message_id: internal_date << 20):
+            mirror.upsert([{**_mail(30, "Imported invoice one", "a@example.com"), **same_date},
+                           {**_mail(31, "Imported invoice two", "b@example.com"), **same_date}])
+            mirror.upsert([{**_mail(30, "Imported invoice one, again", "a@example.com"), **same_date}])
+
+        assert mirror.get_message("m30")["headers"]["subject"] == "Imported invoice one, again"
+        assert mirror.get_message("m31")["headers"]["subject"] == "Imported invoice two"
+        assert {"m30", "m31"} <= set(self._ids(mirror.search("imported")))
+
+    def test_nothing_to_search_for(self, mirror):
+        with pytest.raises(ValueError):
+            mirror.search("-invoice")
+
+    def test_not_ready_falls_back(self, gmail, clock):
+        mirror = _mirror(gmail, clock)
+        assert mirror.search("invoice") is None
+        mirror._backfill_thread.join(timeout=5)
+
+    def test_user_text_is_never_fts_syntax(self):
+        expr, _, _ = parse_search('NEAR(a b) "unclosed OR col:x^')
+        assert expr.count('"') % 2 == 0
+        assert "NEAR(" not in expr
+
+    def test_older_schema_is_rebuilt(self, gmail, clock, tmp_path):
+        path = str(tmp_path / "mirror.db")
+        old = sqlite3.connect(path)
+        old.executescript("CREATE TABLE messages (id TEXT PRIMARY KEY, subject TEXT);"
+                          "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+                          "INSERT INTO meta VALUES ('backfill_complete', '1');")
+        old.close()
+
+        mirror = MailMirror(path=path, service_factory=lambda: gmail.service, clock=clock)
+
+        assert not mirror.ready
+        mirror.backfill()
+        assert mirror.search("subject") and mirror.stats()["search_index"] is True
+        mirror.close()
+
+
+# ---------------------------------------------------------------------------
+# list_messages / get_message integration
+# ---------------------------------------------------------------------------
+
+class TestGmailToolsUseMirror:
+    def test_list_messages_served_locally(self, gmail, clock, mock_gmail_service):
+        from tools.gmail import list_messages
+
+        mirror = _mirror(gmail, clock)
+        mirror.backfill()
+        with patch.object(mailstore, "get_mirror", return_value=mirror):
+            result = list_messages.func(query="is:unread", max_results=2, hydrate=True)
+
+        assert result["source"] == "mirror"
+        assert [m["message_id"] for m in result["messages"]] == ["m4", "m3"]
+        mock_gmail_service.users.return_value.messages.return_value.list.assert_not_called()
+
+    def test_write_tools_invalidate_mirror(self, mock_gmail_service):
+        from tools.gmail import mark_as_read
+
+        mirror = MagicMock()
+        mock_gmail_service.users.return_value.messages.return_value.modify.return_value.execute.return_value = {}
+        with patch.object(mailstore, "get_mirror", return_value=mirror):
+            mark_as_read.func(message_id="m1")
+
+        mirror.invalidate.assert_called_once()
+
+    def test_search_local_mail_tool(self, gmail, clock):
+        from tools.gmail import search_local_mail
+
+        mirror = _mirror(gmail, clock)
+        mirror.backfill()
+        with patch.object(mailstore, "get_mirror", return_value=mirror):
+            result = search_local_mail.func(query="subject 3")
+
+        assert result["source"] == "mirror"
+        assert result["messages"][0]["message_id"] == "m3"
+        assert "elapsed_ms" in result
+
+    def test_search_local_mail_without_mirror(self):
+        from tools.gmail import search_local_mail
+
+        with patch.object(mailstore, "get_mirror", return_value=None):
+            result = search_local_mail.func(query="invoice")
+
+        assert result["count"] == 0 and "list_messages" in result["error"]
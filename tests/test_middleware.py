@@ -0,0 +1,205 @@
+"""
+Tests for middleware.py.
+
+should_end is checked on hand-built message lists; the end-to-end tests run a
+real create_agent graph with a scripted fake model so the skipped call is visible.
+"""
+import asyncio
+from unittest.mock import MagicMock, patch
+
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from middleware import CardFastPathMiddleware
+
+
+def _turn(user="what's on today?", name="list_events_for_day", status="success", artifact=None):
+    return [
+        HumanMessage(content=user),
+        AIMessage(content="", tool_calls=[{"name": name, "args": {}, "id": "c1"}]),
+        ToolMessage(content="{}", name=name, tool_call_id="c1", status=status, artifact=artifact),
+    ]
+
+
+class ScriptedModel(GenericFakeChatModel):
+    """Fake chat model that accepts bind_tools (create_agent binds the tool list)."""
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+# ---------------------------------------------------------------------------
+# should_end
+# ---------------------------------------------------------------------------
+
+class TestShouldEnd:
+    def test_read_only_card_tool_result_ends_turn(self):
+        assert CardFastPathMiddleware.should_end(_turn())
+
+    def test_first_model_call_is_not_skipped(self):
+        assert not CardFastPathMiddleware.should_end([HumanMessage(content="what's on today?")])
+
+    def test_write_tool_needs_the_model(self):
+        assert not CardFastPathMiddleware.should_end(_turn(name="delete_event"))
+
+    def test_write_intent_in_request_needs_the_model(self):
+        assert not CardFastPathMiddleware.should_end(_turn(user="delete my 3pm meeting"))
+
+    def test_tool_errors_need_the_model(self):
+        assert not CardFastPathMiddleware.should_end(_turn(status="error"))
+        assert not CardFastPathMiddleware.should_end(_turn(artifact={"error": "not found"}))
+
+    def test_hydrated_list_messages_ends_turn(self):
+        msgs = _turn(name="list_messages")
+        assert not CardFastPathMiddleware.should_end(msgs)   # ids only, nothing to show
+        msgs[1].tool_calls[0]["args"] = {"hydrate": True}
+        assert CardFastPathMiddleware.should_end(msgs)
+
+    def test_mixed_tool_calls_need_the_model(self):
+        msgs = [
+            HumanMessage(content="what's on today?"),
+            AIMessage(content="", tool_calls=[
+                {"name": "list_events_for_day", "args": {}, "id": "c1"},
+                {"name": "get_current_datetime", "args": {}, "id": "c2"},
+            ]),
+            ToolMessage(content="{}", name="list_events_for_day", tool_call_id="c1"),
+            ToolMessage(content="{}", name="get_current_datetime", tool_call_id="c2"),
+        ]
+        assert not CardFastPathMiddleware.should_end(msgs)
+
+
+# ---------------------------------------------------------------------------
+# in a real agent graph
+# ---------------------------------------------------------------------------
+
+class TestInAgent:
+    def _run(self, enabled, use_async=False):
+        from tools.calendar import list_events_for_day
+
+        model = ScriptedModel(messages=iter([
+            AIMessage(content="", tool_calls=[
+                {"name": "list_events_for_day", "args": {"date_str": "2026-03-05"}, "id": "c1"}
+            ]),
+            AIMessage(content="You have no events."),
+        ]))
+        middleware = CardFastPathMiddleware()
+        agent = create_agent(model=model, tools=[list_events_for_day], middleware=[middleware])
+        payload = {"messages": [{"role": "user", "content": "what's on today?"}]}
+        config = {"configurable": {"card_fast_path": enabled}}
+
+        service = MagicMock()
+        service.events.return_value.list.return_value.execute.return_value = {"items": []}
+        with patch("tools.calendar.get_service", return_value=service):
+            if use_async:
+                res = asyncio.run(agent.ainvoke(payload, config=config))
+            else:
+                res = agent.invoke(payload, config=config)
+        return res["messages"], middleware.stats()
+
+    def test_enabled_skips_final_model_call(self):
+        messages, stats = self._run(enabled=True)
+
+        assert isinstance(messages[-1], ToolMessage)
+        assert stats["turns_ended_early"] == 1
+        assert stats["prompt_tokens_skipped"] > 0
+
+    def test_enabled_under_ainvoke(self):
+        messages, stats = self._run(enabled=True, use_async=True)
+
+        assert isinstance(messages[-1], ToolMessage)
+        assert stats["turns_ended_early"] == 1
+
+    def test_disabled_by_default(self):
+        messages, stats = self._run(enabled=False)
+
+        assert messages[-1].content == "You have no events."
+        assert stats["turns_ended_early"] == 0
+
+
+# ---------------------------------------------------------------------------
+# ToolConcurrencyMiddleware
+# ---------------------------------------------------------------------------
+
+class TestToolConcurrency:
+    """One model step emits several calls of a slow tool; we record how many overlap."""
+
+    def _tracked_tool(self, name, delay=0.2):
+        import threading
+        import time
+
+        from langchain_core.tools import StructuredTool
+
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def body(n: int) -> str:
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(delay)
+            with lock:
+                state["active"] -= 1
+            return str(n)
+
+        return StructuredTool.from_function(func=body, name=name, description=name), state
+
+    def _run(self, tool, calls, middleware, use_async=False):
+        import time
+
+        model = ScriptedModel(messages=iter([
+            AIMessage(content="", tool_calls=[
+                {"name": tool.name, "args": {"n": i}, "id": f"c{i}"} for i in range(calls)
+            ]),
+            AIMessage(content="done"),
+        ]))
+        agent = create_agent(model=model, tools=[tool], middleware=[middleware])
+        payload = {"messages": [{"role": "user", "content": "go"}]}
+        started = time.perf_counter()
+        if use_async:
+            res = asyncio.run(agent.ainvoke(payload))
+        else:
+            res = agent.invoke(payload)
+        return res["messages"], time.perf_counter() - started
+
+    def test_read_calls_run_concurrently(self):
+        from middleware import ToolConcurrencyMiddleware
+
+        tool, state = self._tracked_tool("get_message")
+        messages, elapsed = self._run(tool, 4, ToolConcurrencyMiddleware())
+
+        assert len([m for m in messages if isinstance(m, ToolMessage)]) == 4
+        assert state["peak"] == 4
+        assert elapsed < 0.2 * 3   # close to one call, not four
+
+    def test_per_tool_limit(self):
+        from middleware import ToolConcurrencyMiddleware
+
+        tool, state = self._tracked_tool("get_message", delay=0.1)
+        middleware = ToolConcurrencyMiddleware(per_tool={"get_message": 2})
+        self._run(tool, 5, middleware)
+
+        assert state["peak"] == 2
+        assert middleware.stats()["waited"] >= 3
+
+    def test_write_tools_run_one_at_a_time(self):
+        from middleware import ToolConcurrencyMiddleware
+
+        tool, state = self._tracked_tool("delete_event", delay=0.05)
+        middleware = ToolConcurrencyMiddleware()
+        self._run(tool, 3, middleware)
+
+        assert state["peak"] == 1
+        assert middleware.stats()["write_calls"] == 3
+
+    def test_async_limits(self):
+        from middleware import ToolConcurrencyMiddleware
+
+        tool, state = self._tracked_tool("get_message", delay=0.1)
+        tool.coroutine = None  # runs body in an executor thread
+        middleware = ToolConcurrencyMiddleware(max_parallel=3)
+        self._run(tool, 6, middleware, use_async=True)
+
+        assert state["peak"] == 3
+        assert middleware.stats()["peak_in_flight"] == 3
+        assert middleware.stats()["in_flight"] == 0
@@ -0,0 +1,164 @@
+"""
+Tests for tools/quota.py.
+
+Schedulers run on the real clock with small per-minute limits and a one-second
+burst, so waits are a fraction of a second. Requests go through PooledHttp with
+a fake transport; the batch test serialises a real googleapiclient batch.
+"""
+import threading
+import time
+from unittest.mock import MagicMock
+
+import httplib2
+import pytest
+from googleapiclient.errors import BatchError
+
+import tools.quota as quota
+import tools.retry as retry
+from tools.quota import BULK, INTERACTIVE, WRITE, QuotaScheduler, classify, lane_scope
+from tools.service import PooledHttp, build
+
+GMAIL = "https://gmail.googleapis.com/gmail/v1/users/me"
+CALENDAR = "https://www.googleapis.com/calendar/v3"
+
+
+class FakeTransport:
+    def __init__(self, status=200, body=b"{}"):
+        self.status = status
+        self.body = body
+        self.connections = {}
+        self.requests = []
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.requests.append((uri, method, body))
+        return httplib2.Response({"status": str(self.status), "content-type": "application/json"}), self.body
+
+
+def _pool(account="default", **transport_kwargs):
+    transport = FakeTransport(**transport_kwargs)
+    creds = MagicMock(universe_domain="googleapis.com")
+    return PooledHttp(credentials=creds, transport_factory=lambda c: transport, account=account), transport
+
+
+# ---------------------------------------------------------------------------
+# costs and lanes
+# ---------------------------------------------------------------------------
+
+class TestClassify:
+    @pytest.mark.parametrize("uri, method, expected", [
+        (f"{GMAIL}/messages/m1?fields=id&alt=json", "GET", ({"gmail": 5}, INTERACTIVE)),
+        (f"{GMAIL}/messages?q=x", "GET", ({"gmail": 5}, INTERACTIVE)),
+        (f"{GMAIL}/history", "GET", ({"gmail": 2}, INTERACTIVE)),
+        (f"{GMAIL}/messages/send", "POST", ({"gmail": 100}, WRITE)),
+        (f"{GMAIL}/messages/m1/trash", "POST", ({"gmail": 5}, WRITE)),
+        (f"{GMAIL}/messages/batchModify", "POST", ({"gmail": 50}, BULK)),
+        (f"{GMAIL}/settings/vacation", "GET", ({"gmail": 5}, INTERACTIVE)),
+        (f"{CALENDAR}/freeBusy?alt=json", "POST", ({"calendar": 1}, INTERACTIVE)),
+        (f"{CALENDAR}/calendars/primary/events/e1", "PATCH", ({"calendar": 1}, WRITE)),
+        ("https://oauth2.googleapis.com/token", "POST", ({}, INTERACTIVE)),
+    ])
+    def test_single_requests(self, uri, method, expected):
+        assert classify(uri, method) == expected
+
+    def test_batch_is_charged_per_part(self):
+        pool, transport = _pool()
+        gmail = build("gmail", "v1", pool)
+        batch = gmail.new_batch_http_request()
+        for i in range(3):
+            batch.add(gmail.users().messages().get(userId="me", id=f"m{i}", fields="id"))
+        batch.add(gmail.users().messages().trash(userId="me", id="m9"))
+
+        with pytest.raises(BatchError):  # the fake's reply isn't multipart
+            batch.execute()
+
+        uri, method, body = transport.requests[0]
+        assert classify(uri, method, body) == ({"gmail": 20}, BULK)
+        assert quota.stats()["buckets"]["gmail: default"]["units"] == 20
+
+
+# ---------------------------------------------------------------------------
+# buckets
+# ---------------------------------------------------------------------------
+
+def _scheduler(user=3000, project=10 ** 7):
+    # burst of one second: the user bucket holds ~49 units and refills at ~49 per second
+    return QuotaScheduler(limits={"gmail": (user, project)}, burst_seconds=1)
+
+
+class TestBuckets:
+    def test_waits_for_refill_when_empty(self):
+        scheduler = _scheduler()
+        assert scheduler.acquire({"gmail": 49}, "ann") < 0.01
+
+        waited = scheduler.acquire({"gmail": 10}, "ann")
+
+        assert 0.1 < waited < 0.5
+        assert scheduler.stats()["lanes"][INTERACTIVE]["waited"] == 1
+
+    def test_accounts_have_their_own_bucket(self):
+        scheduler = _scheduler()
+        scheduler.acquire({"gmail": 49}, "ann")
+        assert scheduler.acquire({"gmail": 10}, "bob") < 0.01
+
+    def test_project_bucket_is_shared(self):
+        scheduler = _scheduler(project=3000)
+        scheduler.acquire({"gmail": 49}, "ann")
+        assert scheduler.acquire({"gmail": 10}, "bob") > 0.1
+
+    def test_cost_above_capacity_waits_for_a_full_bucket(self):
+        scheduler = _scheduler()
+        assert scheduler.acquire({"gmail": 500}, "ann") < 0.01
+        assert scheduler.stats()["buckets"]["gmail: ann"]["level"] < 1
+
+    def test_interactive_goes_ahead_of_queued_bulk(self):
+        scheduler = _scheduler()
+        scheduler.acquire({"gmail": 49}, "ann")
+        order = []
+
+        def _request(lane):
+            scheduler.acquire({"gmail": 10}, "ann", lane)
+            order.append(lane)
+
+        bulk = [threading.Thread(target=_request, args=(BULK,)) for _ in range(2)]
+        for t in bulk:
+            t.start()
+        time.sleep(0.05)
+        assert scheduler.stats()["buckets"]["gmail: ann"]["queued"] == 2
+        interactive = threading.Thread(target=_request, args=(INTERACTIVE,))
+        interactive.start()
+        for t in bulk + [interactive]:
+            t.join()
+
+        assert order == [INTERACTIVE, BULK, BULK]
+        lanes = scheduler.stats()["lanes"]
+        assert lanes[BULK]["max_wait_ms"] > lanes[INTERACTIVE]["max_wait_ms"]
+
+
+# ---------------------------------------------------------------------------
+# through PooledHttp
+# ---------------------------------------------------------------------------
+
+class TestPooledHttp:
+    def test_requests_are_charged_to_the_pool_account(self):
+        pool, _ = _pool(account="ann@example.com")
+
+        pool.request(f"{GMAIL}/messages/m1")
+        pool.request(f"{GMAIL}/messages/send", "POST", body="{}")
+
+        stats = quota.stats()
+        assert stats["buckets"]["gmail: ann@example.com"]["units"] == 105
+        assert stats["buckets"]["gmail: project"]["units"] == 105
+        assert stats["lanes"][INTERACTIVE]["requests"] == 1
+        assert stats["lanes"][WRITE]["requests"] == 1
+
+    def test_lane_scope_overrides_the_default_lane(self):
+        pool, _ = _pool()
+        with lane_scope(BULK):
+            pool.request(f"{GMAIL}/messages/m1")
+        assert quota.stats()["lanes"][BULK]["requests"] == 1
+
+    def test_throttled_responses_are_counted(self, monkeypatch):
+        monkeypatch.setattr(retry, "BACKOFF_BASE", 0.001)
+        pool, _ = _pool(status=429)
+        pool.request(f"{GMAIL}/messages/m1")
+        assert quota.stats()["throttled_responses"] == retry.MAX_ATTEMPTS  # every attempt counts
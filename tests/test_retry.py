@@ -0,0 +1,181 @@
+"""
+Tests for tools/retry.py.
+
+Requests go through PooledHttp with a scripted transport: each call takes the next
+step from a list (a status code, an exception, or (status, delay)). Backoff is
+shrunk to milliseconds; Retry-After handling is tested on backoff() directly.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import tools.retry as retry
+from tools.fields import tool_scope
+from tools.retry import backoff, is_idempotent
+from tools.service import PooledHttp, build
+
+GMAIL = "https://gmail.googleapis.com/gmail/v1/users/me"
+
+
+@pytest.fixture(autouse=True)
+def _fast_retries(monkeypatch):
+    monkeypatch.setattr(retry, "BACKOFF_BASE", 0.001)
+    retry.reset_stats()
+    yield
+    retry.reset_stats()
+
+
+class ScriptedTransport:
+    def __init__(self, script):
+        self.script = script
+        self.connections = {}
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        with self.script["lock"]:
+            step = self.script["steps"].pop(0) if self.script["steps"] else 200
+            self.script["calls"] += 1
+        if isinstance(step, Exception):
+            raise step
+        status, delay = step if isinstance(step, tuple) else (step, 0)
+        time.sleep(delay)
+        headers = {"status": str(status), "content-type": "application/json"}
+        return httplib2.Response(headers), b'{"items": []}'
+
+
+def _pool(*steps):
+    script = {"steps": list(steps), "calls": 0, "lock": threading.Lock()}
+    return PooledHttp(credentials=object(), transport_factory=lambda creds: ScriptedTransport(script)), script
+
+
+class TestRetries:
+    def test_read_retried_through_server_errors(self):
+        pool, script = _pool(503, ConnectionResetError("reset"), 200)
+
+        with tool_scope("get_message"):
+            resp, _ = pool.request(f"{GMAIL}/messages/m1")
+
+        assert resp.status == 200
+        assert script["calls"] == 3
+        stats = retry.stats()["get_message"]
+        assert stats["retries"] == 2 and stats["retried_requests"] == 1 and stats["gave_up"] == 0
+        assert stats["added_ms"] > 0
+
+    def test_send_not_retried_on_server_error_or_reset(self):
+        pool, script = _pool(503)
+        assert pool.request(f"{GMAIL}/messages/send", "POST", body="{}")[0].status == 503
+        assert script["calls"] == 1
+
+        pool, script = _pool(ConnectionResetError("reset"))
+        with pytest.raises(ConnectionResetError):
+            pool.request(f"{GMAIL}/messages/send", "POST", body="{}")
+        assert script["calls"] == 1
+
+    def test_send_retried_on_429(self):
+        pool, script = _pool(429, 200)
+        assert pool.request(f"{GMAIL}/messages/send", "POST", body="{}")[0].status == 200
+        assert script["calls"] == 2
+
+    def test_gives_up_after_max_attempts(self):
+        pool, script = _pool(*[500] * 10)
+        assert pool.request(f"{GMAIL}/messages/m1")[0].status == 500
+        assert script["calls"] == retry.MAX_ATTEMPTS
+        assert retry.stats()["<other>"]["gave_up"] == 1
+
+    def test_resource_sees_only_the_final_answer(self):
+        pool, _ = _pool(502, 503, 200)
+        calendar = build("calendar", "v3", pool)
+        assert calendar.events().list(calendarId="primary").execute() == {"items": []}
+
+        pool, _ = _pool(*[503] * 10)
+        calendar = build("calendar", "v3", pool)
+        with pytest.raises(HttpError):
+            calendar.events().list(calendarId="primary").execute()
+
+
+class TestPolicy:
+    @pytest.mark.parametrize("uri, method, expected", [
+        (f"{GMAIL}/messages/m1", "GET", True),
+        (f"{GMAIL}/messages/m1", "DELETE", True),
+        (f"{GMAIL}/messages/m1/modify", "POST", True),
+        ("https://www.googleapis.com/calendar/v3/freeBusy", "POST", True),
+        (f"{GMAIL}/messages/send", "POST", False),
+        (f"{GMAIL}/drafts", "POST", False),
+        ("https://www.googleapis.com/calendar/v3/calendars/primary/events/e1", "PATCH", False),
+    ])
+    def test_idempotent(self, uri, method, expected):
+        assert is_idempotent(uri, method) is expected
+
+    def test_batch_is_idempotent_only_if_every_part_is(self):
+        reads = "GET /gmail/v1/users/me/messages/a HTTP/1.1\n\nGET /gmail/v1/users/me/messages/b HTTP/1.1\n"
+        assert is_idempotent("https://gmail.googleapis.com/batch", "POST", reads)
+        assert not is_idempotent("https://gmail.googleapis.com/batch", "POST",
+                                 reads + "POST /gmail/v1/users/me/drafts HTTP/1.1\n")
+
+    def test_retry_after_seconds_and_date(self):
+        assert backoff(0, (httplib2.Response({"status": "429", "retry-after": "3"}), b"")) >= 3
+        when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        assert 25 < backoff(0, (httplib2.Response({"status": "503", "retry-after": when}), b"")) <= 30
+        assert backoff(3, None) <= 0.008
+
+    def test_long_retry_after_fails_fast(self, monkeypatch):
+        monkeypatch.setattr(retry, "RETRY_BUDGET", 5)
+        script = {"calls": 0}
+
+        class SlowDown(ScriptedTransport):
+            def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+                script["calls"] += 1
+                return httplib2.Response({"status": "429", "retry-after": "60"}), b""
+
+        pool = PooledHttp(credentials=object(), transport_factory=lambda creds: SlowDown(script))
+        assert pool.request(f"{GMAIL}/messages/m1")[0].status == 429
+        assert script["calls"] == 1
+
+
+class TestHedgedReads:
+    @pytest.fixture(autouse=True)
+    def _hedging(self, monkeypatch):
+        monkeypatch.setattr(retry, "HEDGE_READS", True)
+        monkeypatch.setattr(retry, "HEDGE_MIN_DELAY", 0.02)
+        monkeypatch.setattr(retry, "_latencies", {})
+
+    def _prime(self, key, seconds=0.01):
+        for _ in range(retry.HEDGE_MIN_SAMPLES):
+            retry._note_latency(key, seconds)
+
+    def test_slow_read_is_duplicated_and_the_fast_copy_wins(self):
+        self._prime("gmail.users.messages.get")
+        pool, script = _pool((200, 1.0), 200)
+
+        started = time.monotonic()
+        with tool_scope("get_message"):
+            assert pool.request(f"{GMAIL}/messages/m1")[0].status == 200
+
+        assert time.monotonic() - started < 0.5
+        assert script["calls"] == 2
+        stats = retry.stats()["get_message"]
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+    def test_fast_read_and_unprimed_methods_are_not_duplicated(self):
+        self._prime("gmail.users.messages.get")
+        pool, script = _pool(200)
+        pool.request(f"{GMAIL}/messages/m1")
+        pool.request(f"{GMAIL}/messages")  # messages.list has no latencies yet
+        assert script["calls"] == 2
+        assert retry.stats()["<other>"]["hedges"] == 0
+
+    def test_writes_are_never_hedged(self):
+        self._prime("gmail.users.messages.send")
+        pool, script = _pool((200, 0.1))
+        pool.request(f"{GMAIL}/messages/send", "POST", body="{}")
+        assert script["calls"] == 1
+
+    def test_error_from_one_copy_waits_for_the_other(self):
+        self._prime("gmail.users.messages.get")
+        pool, script = _pool((200, 0.3), 503)
+        assert pool.request(f"{GMAIL}/messages/m1")[0].status == 200
+        assert script["calls"] == 2
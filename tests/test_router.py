@@ -0,0 +1,140 @@
+"""
+Tests for router.py.
+
+Matching is checked against a fixed "today" (Thursday 2026-03-05); handle() runs
+the real tools with the Google services mocked.
+"""
+import asyncio
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from router import IntentRouter, normalize, resolve_day
+
+TODAY = date(2026, 3, 5)  # a Thursday
+
+
+@pytest.fixture
+def router():
+    return IntentRouter()
+
+
+# ---------------------------------------------------------------------------
+# matching
+# ---------------------------------------------------------------------------
+
+class TestMatch:
+    @pytest.mark.parametrize("text, date_str", [
+        ("What's on my calendar tomorrow?", "2026-03-06"),
+        ("what's on today", "2026-03-05"),
+        ("whats on friday", "2026-03-06"),
+        ("what do I have on next monday", "2026-03-09"),
+        ("list my events for 2026-03-09", "2026-03-09"),
+        ("what's on my calendar", "2026-03-05"),
+        ("Hey Stella, what's on tomorrow please", "2026-03-06"),
+        ("what's for tomorrow", "2026-03-06"),
+        ("what is happening on friday", "2026-03-06"),
+    ])
+    def test_day_requests(self, router, text, date_str):
+        route = router.match(text, TODAY)
+        assert route.intent == "events_for_day"
+        assert route.args == {"date_str": date_str}
+
+    def test_week_request(self, router):
+        route = router.match("what's on next week", TODAY)
+        assert route.intent == "events_for_week"
+        assert route.args == {"start_date": "2026-03-09", "end_date": "2026-03-15"}
+
+    @pytest.mark.parametrize("text, intent", [
+        ("list unread emails", "list_unread"),
+        ("Any new emails?", "list_unread"),
+        ("show my inbox", "list_inbox"),
+        ("mark all as read", "mark_all_read"),
+        ("Please mark all emails as read", "mark_all_read"),
+        ("what time is it?", "current_datetime"),
+        ("what is today?", "current_datetime"),
+        ("what's today", "current_datetime"),
+        ("what day is it today", "current_datetime"),
+    ])
+    def test_mail_and_misc_requests(self, router, text, intent):
+        assert router.match(text, TODAY).intent == intent
+
+    @pytest.mark.parametrize("text", [
+        "what's on my calendar tomorrow after 3pm",
+        "delete my 3pm",
+        "mark all emails from bob as read",
+        "list emails from alice",
+        "create an event tomorrow called Gym",
+        "what's on 2026-02-30",
+    ])
+    def test_anything_else_goes_to_agent(self, router, text):
+        assert router.match(text, TODAY) is None
+
+
+class TestHelpers:
+    def test_normalize(self):
+        assert normalize("  Please  what's ON today?! ") == "what's on today"
+
+    def test_resolve_weekdays(self):
+        assert resolve_day("thursday", TODAY) == TODAY
+        assert resolve_day("on monday", TODAY) == date(2026, 3, 9)
+        assert resolve_day("this monday", TODAY) == date(2026, 3, 2)
+        assert resolve_day("next thursday", TODAY) == date(2026, 3, 12)
+
+
+# ---------------------------------------------------------------------------
+# handle / ahandle
+# ---------------------------------------------------------------------------
+
+class TestHandle:
+    def _calendar(self, items):
+        service = MagicMock()
+        service.events.return_value.list.return_value.execute.return_value = {"items": items}
+        return patch("tools.calendar.get_service", return_value=service)
+
+    def test_runs_tool_and_builds_turn(self, router):
+        event = {
+            "id": "e1", "summary": "Standup",
+            "start": {"dateTime": "2026-03-05T09:00:00-05:00"},
+            "end": {"dateTime": "2026-03-05T09:30:00-05:00"},
+        }
+        with self._calendar([event]):
+            result = router.handle("list my events for 2026-03-05")
+
+        assert result.intent == "events_for_day"
+        assert result.reply == "You have 1 event on Thursday, 2026-03-05:\n- 09:00-09:30 Standup"
+        call_msg, tool_msg, reply_msg = result.messages
+        assert call_msg.tool_calls[0]["args"] == {"date_str": "2026-03-05"}
+        assert tool_msg.artifact["events"][0]["event_id"] == "e1"
+        assert reply_msg.content == result.reply
+
+    def test_mark_all_as_read(self, router):
+        service = MagicMock()
+        service.users.return_value.messages.return_value.list.return_value.execute.return_value = {
+            "messages": [{"id": "m1"}, {"id": "m2"}]
+        }
+        with patch("tools.gmail.get_service", return_value=service):
+            result = asyncio.run(router.ahandle("mark all as read"))
+
+        assert result.reply == "Marked 2 messages as read."
+        service.users.return_value.messages.return_value.batchModify.assert_called_once()
+
+    def test_unmatched_returns_none_and_counts(self, router):
+        assert router.handle("reschedule my dentist appointment") is None
+        assert router.stats()["passed_to_agent"] == 1
+
+    def test_tool_error_returns_none(self, router):
+        with patch("tools.calendar.get_service", side_effect=RuntimeError("no token")):
+            assert router.handle("what's on today") is None
+
+        stats = router.stats()
+        assert stats["tool_errors"] == 1
+        assert stats["routed"] == 0
+
+    def test_stats_by_intent(self, router):
+        with self._calendar([]):
+            router.handle("what's on today")
+            router.handle("what's on tomorrow")
+
+        assert router.stats()["by_intent"] == {"events_for_day": 2}
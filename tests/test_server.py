@@ -9,7 +9,7 @@ Tests cover:
   - POST /chat endpoint behaviour
 """
 import json
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
@@ -19,6 +19,8 @@ from fastapi.testclient import TestClient
 # Import the app (agent module will initialize with the fake key from conftest)
 # ---------------------------------------------------------------------------
 import server
+from router import IntentRouter
+from sessions import SessionStore
 from server import (
     _extract_emails_from_messages,
     _extract_events_from_messages,
@@ -33,13 +35,13 @@ from server import (
 # ---------------------------------------------------------------------------
 
 @pytest.fixture(autouse=True)
-def reset_server_state():
+def reset_server_state(monkeypatch):
     """
-    Reset the in-memory message list between tests so tests don't bleed state.
+    Give each test a fresh session store so tests don't bleed state, and a router with
+    no rules so every request reaches the mocked agent (TestIntentRouting opts back in).
     """
-    original = server.messages[:]
-    yield
-    server.messages = original[:]
+    monkeypatch.setattr(server, "sessions", SessionStore(system_prompt=server.SYSTEM_HINT))
+    monkeypatch.setattr(server, "router", IntentRouter(rules=[]))
 
 
 @pytest.fixture
@@ -47,6 +49,18 @@ def client():
     return TestClient(server.app)
 
 
+def _patch_agent():
+    """Patch server.agent with a mock whose ainvoke is awaitable."""
+    mock_agent = MagicMock()
+    mock_agent.ainvoke = AsyncMock()
+    return patch("server.agent", mock_agent)
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
 # ---------------------------------------------------------------------------
 # Fake message objects (stand-ins for LangChain message objects)
 # ---------------------------------------------------------------------------
@@ -65,9 +79,10 @@ class FakeAIMessage:
 
 class FakeToolMessage:
     type = "tool"
-    def __init__(self, name, content):
+    def __init__(self, name, content, artifact=None):
         self.name = name
         self.content = content
+        self.artifact = artifact
 
 
 # ---------------------------------------------------------------------------
@@ -196,6 +211,25 @@ class TestExtractEventsFromMessages:
         result = _extract_events_from_messages(messages)
         assert len(result) == 1
 
+    def test_reads_artifact_without_parsing_content(self):
+        """Tools hand back their dict as the artifact; the text content is only for the LLM."""
+        artifact = {"events": [{
+            "summary": "From artifact",
+            "start": {"dateTime": "2026-03-05T10:00:00-05:00"},
+            "end": {"dateTime": "2026-03-05T11:00:00-05:00"},
+            "htmlLink": "https://cal.google.com/1",
+        }]}
+        messages = [
+            FakeHumanMessage("today?"),
+            FakeToolMessage("list_events_for_day", "- evt1 | From artifact | ...", artifact=artifact),
+            FakeAIMessage("ok"),
+        ]
+        with patch("server._parse_tool_content") as parse:
+            result = _extract_events_from_messages(messages)
+
+        parse.assert_not_called()
+        assert result[0]["title"] == "From artifact"
+
     def test_returns_empty_for_malformed_json(self):
         messages = [
             FakeToolMessage("list_events_for_day", "not valid json {{ "),
@@ -261,6 +295,13 @@ class TestToolMessageToEmail:
         msg = FakeToolMessage("get_message", "this is not json }{")
         assert _tool_message_to_email(msg) is None
 
+    def test_reads_artifact(self):
+        artifact = {"message_id": "m9", "label_ids": [], "headers": {"subject": "Artifact"}}
+        msg = FakeToolMessage("get_message", "message_id=m9\nsubject: Artifact", artifact=artifact)
+        result = _tool_message_to_email(msg)
+        assert result["messageId"] == "m9"
+        assert result["subject"] == "Artifact"
+
     def test_returns_none_for_non_dict_content(self):
         msg = FakeToolMessage("get_message", json.dumps([1, 2, 3]))
         assert _tool_message_to_email(msg) is None
@@ -338,6 +379,39 @@ class TestExtractEmailsFromMessages:
         result = _extract_emails_from_messages(messages)
         assert len(result) == 1
 
+    def test_hydrated_list_messages_becomes_cards(self):
+        listing = {
+            "count": 3,
+            "messages": [
+                {"message_id": "m1", "thread_id": "t1", "label_ids": ["UNREAD"], "snippet": "a",
+                 "headers": {"from": "Alice", "subject": "One"}},
+                {"message_id": "m2", "thread_id": "t2", "error": "404"},
+                {"message_id": "m3", "thread_id": "t3", "headers": {"from": "Bob", "subject": "Three"}},
+            ],
+        }
+        messages = [
+            FakeHumanMessage("show my unread emails"),
+            FakeToolMessage("list_messages", "...", artifact=listing),
+        ]
+        result = _extract_emails_from_messages(messages)
+        assert [e["messageId"] for e in result] == ["m1", "m3"]
+        assert result[0]["subject"] == "One"
+        assert result[0]["labels"] == ["UNREAD"]
+
+    def test_get_messages_results_become_cards(self):
+        result = {
+            "requested": 2, "count": 1,
+            "messages": [{"message_id": "m1", "thread_id": "t1", "headers": {"from": "Alice", "subject": "Hi"}}],
+            "errors": [{"message_id": "m2", "error": "404 Not Found"}],
+        }
+        messages = [FakeHumanMessage("triage"), FakeToolMessage("get_messages", "...", artifact=result)]
+        assert [e["messageId"] for e in _extract_emails_from_messages(messages)] == ["m1"]
+
+    def test_id_only_list_messages_makes_no_cards(self):
+        listing = {"count": 1, "messages": [{"message_id": "m1", "thread_id": "t1"}]}
+        messages = [FakeHumanMessage("list"), FakeToolMessage("list_messages", "...", artifact=listing)]
+        assert _extract_emails_from_messages(messages) == []
+
 
 # ---------------------------------------------------------------------------
 # POST /chat endpoint
@@ -355,16 +429,16 @@ class TestChatEndpoint:
         return {"messages": [*messages, self._ai_msg(reply)]}
 
     def test_returns_reply(self, client):
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = self._make_agent_response("Hello back!")
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = self._make_agent_response("Hello back!")
             resp = client.post("/chat", json={"message": "hi"})
 
         assert resp.status_code == 200
         assert resp.json()["reply"] == "Hello back!"
 
     def test_returns_empty_events_and_emails_by_default(self, client):
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = self._make_agent_response("No events today.")
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = self._make_agent_response("No events today.")
             resp = client.post("/chat", json={"message": "what's on today?"})
 
         data = resp.json()
@@ -383,8 +457,8 @@ class TestChatEndpoint:
         })
         tool_msg = FakeToolMessage("list_events_for_day", event_payload)
 
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = {
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {
                 "messages": [
                     FakeHumanMessage("what's on today?"),
                     tool_msg,
@@ -412,8 +486,8 @@ class TestChatEndpoint:
         }
         tool_msg = FakeToolMessage("get_message", json.dumps(email_data))
 
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = {
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {
                 "messages": [
                     FakeHumanMessage("show my emails"),
                     tool_msg,
@@ -441,8 +515,8 @@ class TestChatEndpoint:
         })
         tool_msg = FakeToolMessage("list_events_for_day", event_payload)
 
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = {
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {
                 "messages": [
                     FakeHumanMessage("schedule?"),
                     tool_msg,
@@ -455,15 +529,434 @@ class TestChatEndpoint:
         assert "\n" not in data["reply"]
         assert data["reply"] == "Here are your events:"
 
+    def test_reports_history_token_usage(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = self._make_agent_response("Hello back!")
+            resp = client.post("/chat", json={"message": "hi"})
+
+        history = resp.json()["history"]
+        assert history["prompt_tokens"] > 0
+        assert history["tokens_saved"] == 0
+
     def test_message_history_is_updated_after_call(self, client):
         """Subsequent requests build on prior context."""
-        with patch("server.agent") as mock_agent:
-            mock_agent.invoke.return_value = self._make_agent_response("First reply")
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = self._make_agent_response("First reply")
             client.post("/chat", json={"message": "first"})
 
-            mock_agent.invoke.return_value = self._make_agent_response("Second reply")
+            mock_agent.ainvoke.return_value = self._make_agent_response("Second reply")
             resp = client.post("/chat", json={"message": "second"})
 
         assert resp.json()["reply"] == "Second reply"
-        # agent.invoke should have been called twice total
-        assert mock_agent.invoke.call_count == 2
+        # agent.ainvoke should have been called twice total
+        assert mock_agent.ainvoke.call_count == 2
+
+
+# ---------------------------------------------------------------------------
+# POST /chat/stream endpoint
+# ---------------------------------------------------------------------------
+
+class TestChatStreamEndpoint:
+    def _ai_msg(self, content, tool_calls=None):
+        m = MagicMock()
+        m.content = content
+        m.type = "ai"
+        m.tool_calls = tool_calls or []
+        return m
+
+    def _read_events(self, resp):
+        return [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+
+    def _event_tool_msg(self):
+        from langchain_core.messages import ToolMessage
+        payload = json.dumps({"events": [{
+            "summary": "Standup",
+            "start": {"dateTime": "2026-03-05T09:00:00-05:00"},
+            "end": {"dateTime": "2026-03-05T09:30:00-05:00"},
+            "htmlLink": "https://cal.google.com/1",
+        }]})
+        return ToolMessage(content=payload, name="list_events_for_day", tool_call_id="call1")
+
+    def _stream_chunks(self, tool_msg, final_reply):
+        from langchain_core.messages import AIMessageChunk
+        call_msg = self._ai_msg("", tool_calls=[
+            {"name": "list_events_for_day", "args": {"date_str": "2026-03-05"}, "id": "call1"}
+        ])
+        final_msg = self._ai_msg(final_reply)
+        human = FakeHumanMessage("what's on today?")
+        return [
+            ("updates", {"model": {"messages": [call_msg]}}),
+            ("updates", {"tools": {"messages": [tool_msg]}}),
+            ("messages", (AIMessageChunk(content="Here is "), {})),
+            ("messages", (AIMessageChunk(content="your day."), {})),
+            ("updates", {"model": {"messages": [final_msg]}}),
+            ("values", {"messages": [human, call_msg, tool_msg, final_msg]}),
+        ]
+
+    def test_streams_ndjson_events_in_order(self, client):
+        chunks = self._stream_chunks(self._event_tool_msg(), "Here is your day.\n- Standup")
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.return_value = _aiter(chunks)
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        types = [e["type"] for e in self._read_events(resp)]
+        assert types == ["tool_start", "tool_end", "events", "token", "token", "done"]
+
+    def test_event_cards_sent_when_tool_finishes(self, client):
+        chunks = self._stream_chunks(self._event_tool_msg(), "Here is your day.")
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.return_value = _aiter(chunks)
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        events = self._read_events(resp)
+        card_event = next(e for e in events if e["type"] == "events")
+        assert card_event["events"][0]["title"] == "Standup"
+        tool_start = next(e for e in events if e["type"] == "tool_start")
+        assert tool_start["name"] == "list_events_for_day"
+        assert tool_start["args"] == {"date_str": "2026-03-05"}
+
+    def test_done_event_matches_chat_response(self, client):
+        chunks = self._stream_chunks(self._event_tool_msg(), "Here is your day.\n- Standup at 9")
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.return_value = _aiter(chunks)
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        done = self._read_events(resp)[-1]
+        assert done["reply"] == "Here is your day."
+        assert len(done["events"]) == 1
+        assert done["emails"] == []
+
+    def test_history_updated_from_final_values(self, client):
+        chunks = self._stream_chunks(self._event_tool_msg(), "Here is your day.")
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.return_value = _aiter(chunks)
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        session = server.sessions.get(resp.headers["X-Session-Id"])
+        assert session.messages[-1].content == "Here is your day."
+
+    def test_agent_failure_emits_error_event(self, client):
+        async def _boom(*args, **kwargs):
+            yield ("messages", (MagicMock(content="partial"), {}))
+            raise RuntimeError("model down")
+
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.side_effect = _boom
+            resp = client.post("/chat/stream", json={"message": "hi"})
+
+        events = self._read_events(resp)
+        assert events[-1]["type"] == "error"
+
+    def test_history_failure_emits_error_event(self, client):
+        with _patch_agent() as mock_agent, \
+                patch.object(server.history_manager, "aprepare", side_effect=RuntimeError("summarizer down")):
+            resp = client.post("/chat/stream", json={"message": "hi"})
+
+        assert [e["type"] for e in self._read_events(resp)] == ["error"]
+        mock_agent.astream.assert_not_called()
+
+
+# ---------------------------------------------------------------------------
+# Per-session history
+# ---------------------------------------------------------------------------
+
+class TestChatSessions:
+    def _ai_msg(self, content):
+        m = MagicMock()
+        m.content = content
+        m.type = "ai"
+        return m
+
+    def _echo_history(self, payload, config=None):
+        """Fake agent: returns the history it was given plus one AI reply."""
+        history = payload["messages"]
+        return {"messages": [*history, self._ai_msg(f"turn {len(history)}")]}
+
+    def test_new_client_gets_session_cookie_and_header(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = self._echo_history
+            resp = client.post("/chat", json={"message": "hi"})
+
+        session_id = resp.headers["X-Session-Id"]
+        assert resp.cookies.get(server.SESSION_COOKIE) == session_id
+
+    def test_header_sessions_do_not_share_history(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = self._echo_history
+            client.post("/chat", json={"message": "a1"}, headers={"X-Session-Id": "alice"})
+            client.post("/chat", json={"message": "a2"}, headers={"X-Session-Id": "alice"})
+            client.post("/chat", json={"message": "b1"}, headers={"X-Session-Id": "bob"})
+
+            bob_history = mock_agent.ainvoke.call_args_list[2].args[0]["messages"]
+
+        # bob sees only the system prompt + his own message
+        assert len(bob_history) == 2
+        assert bob_history[-1]["content"] == "b1"
+        assert len(server.sessions.get("alice").messages) == 5
+
+    def test_cookie_session_is_reused(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = self._echo_history
+            first = client.post("/chat", json={"message": "one"})
+            second = client.post("/chat", json={"message": "two"})
+
+        assert first.headers["X-Session-Id"] == second.headers["X-Session-Id"]
+        second_history = mock_agent.ainvoke.call_args_list[1].args[0]["messages"]
+        assert [m["content"] for m in second_history if isinstance(m, dict)][-1] == "two"
+        assert len(second_history) == 4
+
+    def test_malformed_session_header_gets_fresh_id(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = self._echo_history
+            resp = client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "../etc/passwd"})
+
+        assert resp.headers["X-Session-Id"] != "../etc/passwd"
+
+    def test_failed_turn_does_not_change_history(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = RuntimeError("model down")
+            with pytest.raises(RuntimeError):
+                client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "s1"})
+
+        assert len(server.sessions.get("s1").messages) == 1
+
+    def test_stats_endpoint_reports_sessions(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.side_effect = self._echo_history
+            client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "s1"})
+
+        stats = client.get("/stats").json()["sessions"]
+        assert stats["live_sessions"] == 1
+        assert stats["bytes_held"] > 0
+
+
+class TestChatAccounts:
+    PROXY = {"X-Stella-Proxy-Secret": "s3cret"}
+
+    @pytest.fixture(autouse=True)
+    def _secret(self, monkeypatch):
+        monkeypatch.setattr(server, "ACCOUNT_SECRET", "s3cret")
+
+    def _capture_account(self, payload, config=None):
+        from tools.auth import current_account
+        self.seen.append(current_account())
+        return {"messages": [*payload["messages"], FakeAIMessage("ok")]}
+
+    def test_agent_runs_as_the_requested_account(self, client):
+        self.seen = []
+        ann = {**self.PROXY, "X-Stella-Account": "ann@example.com"}
+        with _patch_agent() as mock_agent, patch("server.has_token", return_value=True):
+            mock_agent.ainvoke.side_effect = self._capture_account
+            client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "s1", **ann})
+            client.post("/chat", json={"message": "again"}, headers={"X-Session-Id": "s1", **ann})
+            client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "s2"})
+
+        assert self.seen == ["ann@example.com", "ann@example.com", "default"]
+
+    @pytest.mark.parametrize("secret, proxy", [
+        ("s3cret", {}),                                   # no proxy secret
+        ("s3cret", {"X-Stella-Proxy-Secret": "guess"}),   # wrong proxy secret
+        ("", {"X-Stella-Proxy-Secret": ""}),              # account header not enabled
+    ])
+    def test_account_header_needs_the_trusted_proxy(self, client, monkeypatch, secret, proxy):
+        monkeypatch.setattr(server, "ACCOUNT_SECRET", secret)
+        with _patch_agent() as mock_agent, patch("server.has_token", return_value=True):
+            resp = client.post("/chat", json={"message": "hi"},
+                               headers={**proxy, "X-Stella-Account": "ann@example.com"})
+
+        assert resp.status_code == 403
+        mock_agent.ainvoke.assert_not_called()
+
+    def test_unconnected_account_is_refused(self, client):
+        with _patch_agent() as mock_agent:
+            resp = client.post("/chat", json={"message": "hi"},
+                               headers={**self.PROXY, "X-Stella-Account": "nobody@example.com"})
+
+        assert resp.status_code == 403
+        mock_agent.ainvoke.assert_not_called()
+
+    def test_session_cannot_switch_accounts(self, client):
+        self.seen = []
+        with _patch_agent() as mock_agent, patch("server.has_token", return_value=True):
+            mock_agent.ainvoke.side_effect = self._capture_account
+            client.post("/chat", json={"message": "hi"},
+                        headers={"X-Session-Id": "s1", **self.PROXY, "X-Stella-Account": "ann@example.com"})
+            resp = client.post("/chat", json={"message": "hi"}, headers={"X-Session-Id": "s1"})
+
+        assert resp.status_code == 409
+        assert self.seen == ["ann@example.com"]
+
+
+# ---------------------------------------------------------------------------
+# Card fast path (turn ends on tool results, intro comes from a template)
+# ---------------------------------------------------------------------------
+
+class TestCardFastPath:
+    def _turn(self, artifact, name="list_events_for_day", args=None):
+        from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+        return [
+            HumanMessage(content="what's on today?"),
+            AIMessage(content="", tool_calls=[{"name": name, "args": args or {}, "id": "call1"}]),
+            ToolMessage(content="...", name=name, tool_call_id="call1", artifact=artifact),
+        ]
+
+    def _day(self, n):
+        return {
+            "date": "2026-03-05",
+            "count": n,
+            "events": [{"event_id": f"e{i}", "summary": f"Meeting {i}",
+                        "start": {"dateTime": "2026-03-05T09:00:00-05:00"},
+                        "end": {"dateTime": "2026-03-05T10:00:00-05:00"}} for i in range(n)],
+        }
+
+    def test_chat_enables_fast_path_in_config(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn(self._day(1))}
+            client.post("/chat", json={"message": "what's on today?"})
+
+        config = mock_agent.ainvoke.call_args.kwargs["config"]
+        assert config["configurable"]["card_fast_path"] is True
+
+    def test_turn_ending_on_tool_result_gets_template_intro(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn(self._day(2))}
+            resp = client.post("/chat", json={"message": "what's on today?"})
+
+        data = resp.json()
+        assert data["fast_path"] is True
+        assert data["reply"] == "You have 2 events on 2026-03-05."
+        assert len(data["events"]) == 2
+
+    def test_truncated_listing_says_so(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn({**self._day(2), "truncated": True})}
+            resp = client.post("/chat", json={"message": "what's on today?"})
+
+        assert resp.json()["reply"] == "You have more than 2 events on 2026-03-05. Showing the first 2."
+
+    def test_intro_saved_to_history(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn(self._day(0))}
+            resp = client.post("/chat", json={"message": "what's on today?"})
+
+        session = server.sessions.get(resp.headers["X-Session-Id"])
+        assert session.messages[-1].type == "ai"
+        assert session.messages[-1].content == "You have no events on 2026-03-05."
+
+    def test_email_intro(self, client):
+        artifact = {"message_id": "m1", "headers": {"subject": "Hi", "from": "a@b.com"}, "snippet": "hello"}
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn(artifact, name="get_message")}
+            resp = client.post("/chat", json={"message": "open that email"})
+
+        assert resp.json()["reply"] == "Here's the email."
+
+    def test_find_events_intro_mentions_query(self, client):
+        artifact = {**self._day(1), "query": "dentist"}
+        artifact.pop("date")
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": self._turn(artifact, name="find_events")}
+            resp = client.post("/chat", json={"message": "when is the dentist?"})
+
+        assert resp.json()["reply"] == 'Found 1 event matching "dentist".'
+
+    def test_normal_turn_is_not_fast_path(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": [FakeHumanMessage("hi"), FakeAIMessage("Hello!")]}
+            resp = client.post("/chat", json={"message": "hi"})
+
+        assert resp.json()["fast_path"] is False
+        assert resp.json()["reply"] == "Hello!"
+
+    def test_stream_emits_intro_token_and_done(self, client):
+        msgs = self._turn(self._day(1))
+        chunks = [
+            ("updates", {"model": {"messages": [msgs[1]]}}),
+            ("updates", {"tools": {"messages": [msgs[2]]}}),
+            ("values", {"messages": msgs}),
+        ]
+        with _patch_agent() as mock_agent:
+            mock_agent.astream.return_value = _aiter(chunks)
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+        assert [e["type"] for e in events] == ["tool_start", "tool_end", "events", "token", "done"]
+        assert events[-1]["fast_path"] is True
+        assert events[-2]["content"] == events[-1]["reply"] == "You have 1 event on 2026-03-05."
+
+    def test_stats_report_fast_path(self, client):
+        stats = client.get("/stats").json()
+        assert "turns_ended_early" in stats["card_fast_path"]
+
+
+# ---------------------------------------------------------------------------
+# Intent router (formulaic requests answered without the agent)
+# ---------------------------------------------------------------------------
+
+class TestIntentRouting:
+    @pytest.fixture(autouse=True)
+    def real_router(self, monkeypatch):
+        monkeypatch.setattr(server, "router", IntentRouter())
+
+    def _calendar_service(self, items):
+        service = MagicMock()
+        service.events.return_value.list.return_value.execute.return_value = {"items": items}
+        return service
+
+    def _standup(self):
+        return {
+            "id": "e1",
+            "summary": "Standup",
+            "start": {"dateTime": "2026-03-05T09:00:00-05:00"},
+            "end": {"dateTime": "2026-03-05T09:30:00-05:00"},
+        }
+
+    def test_routed_request_skips_agent(self, client):
+        with _patch_agent() as mock_agent, \
+                patch("tools.calendar.get_service", return_value=self._calendar_service([self._standup()])):
+            resp = client.post("/chat", json={"message": "What's on my calendar today?"})
+
+        data = resp.json()
+        mock_agent.ainvoke.assert_not_called()
+        assert data["handled_by"] == "router"
+        assert data["reply"].startswith("You have 1 event today")
+        assert data["events"][0]["title"] == "Standup"
+
+    def test_routed_turn_saved_as_tool_call_and_reply(self, client):
+        with _patch_agent(), patch("tools.calendar.get_service", return_value=self._calendar_service([])):
+            resp = client.post("/chat", json={"message": "what's on tomorrow"})
+
+        messages = server.sessions.get(resp.headers["X-Session-Id"]).messages
+        assert messages[-4] == {"role": "user", "content": "what's on tomorrow"}
+        assert messages[-3].tool_calls[0]["name"] == "list_events_for_day"
+        assert messages[-2].tool_call_id == messages[-3].tool_calls[0]["id"]
+        assert messages[-1].content == "You have no events tomorrow."
+
+    def test_unmatched_request_goes_to_agent(self, client):
+        with _patch_agent() as mock_agent:
+            mock_agent.ainvoke.return_value = {"messages": [FakeHumanMessage("hi"), FakeAIMessage("Hello!")]}
+            resp = client.post("/chat", json={"message": "move my 3pm to 4pm"})
+
+        mock_agent.ainvoke.assert_called_once()
+        assert resp.json()["handled_by"] == "agent"
+
+    def test_tool_failure_falls_back_to_agent(self, client):
+        with _patch_agent() as mock_agent, \
+                patch("tools.calendar.get_service", side_effect=RuntimeError("no credentials")):
+            mock_agent.ainvoke.return_value = {"messages": [FakeHumanMessage("hi"), FakeAIMessage("Sorry")]}
+            resp = client.post("/chat", json={"message": "what's on today"})
+
+        assert resp.json()["handled_by"] == "agent"
+        assert server.router.stats()["tool_errors"] == 1
+
+    def test_stream_routed_request(self, client):
+        with _patch_agent() as mock_agent, \
+                patch("tools.calendar.get_service", return_value=self._calendar_service([self._standup()])):
+            resp = client.post("/chat/stream", json={"message": "what's on today?"})
+
+        events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+        mock_agent.astream.assert_not_called()
+        assert [e["type"] for e in events] == ["tool_start", "tool_end", "events", "token", "done"]
+        assert events[-1]["handled_by"] == "router"
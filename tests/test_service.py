@@ -0,0 +1,227 @@
+"""
+Tests for tools/service.py.
+
+Transports are fakes that record concurrency, so no network is used. One test
+builds a real googleapiclient Resource on a PooledHttp to check the wiring.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import httplib2
+import pytest
+
+import tools.retry as retry
+import tools.service as service_module
+from tools.service import PooledHttp
+
+
+class FakeTransport:
+    """Stands in for AuthorizedHttp: one connection per host, slow responses."""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, body=b"{}", delay=0.0, fail=False):
+        self.body = body
+        self.delay = delay
+        self.fail = fail
+        self.connections = {}
+        self.calls = 0
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        cls = FakeTransport
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            self.calls += 1
+            self.connections.setdefault(uri.split("/")[2], MagicMock())
+            time.sleep(self.delay)
+            if self.fail:
+                raise OSError("connection reset")
+            return httplib2.Response({"status": "200"}), self.body
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def reset_fake():
+    FakeTransport.active = 0
+    FakeTransport.peak = 0
+
+
+def _pool(size=2, **transport_kwargs):
+    return PooledHttp(credentials=object(), size=size,
+                      transport_factory=lambda creds: FakeTransport(**transport_kwargs))
+
+
+class TestPooledHttp:
+    def test_transport_reused_between_requests(self):
+        pool = _pool()
+        pool.request("https://gmail.googleapis.com/a")
+        pool.request("https://gmail.googleapis.com/b")
+
+        stats = pool.stats()
+        assert stats["transports_created"] == 1
+        assert stats["hits"] == 1
+        assert stats["connections_opened"] == 1   # keep-alive: second request reuses it
+
+    def test_concurrency_bounded_by_pool_size(self):
+        pool = _pool(size=2, delay=0.05)
+        with ThreadPoolExecutor(max_workers=6) as ex:
+            list(ex.map(lambda i: pool.request(f"https://www.googleapis.com/{i}"), range(6)))
+
+        stats = pool.stats()
+        assert FakeTransport.peak == 2
+        assert stats["transports_created"] == 2
+        assert stats["waits"] > 0
+        assert stats["in_use"] == 0 and stats["idle"] == 2
+
+    def test_parallel_requests_never_share_a_transport(self):
+        seen = []
+        lock = threading.Lock()
+
+        class Exclusive(FakeTransport):
+            def request(self, uri, method="GET", *args, **kwargs):
+                with lock:
+                    assert self not in seen
+                    seen.append(self)
+                try:
+                    return super().request(uri, method)
+                finally:
+                    with lock:
+                        seen.remove(self)
+
+        pool = PooledHttp(credentials=object(), size=4,
+                          transport_factory=lambda creds: Exclusive(delay=0.02))
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            list(ex.map(lambda i: pool.request("https://www.googleapis.com/x"), range(16)))
+
+        assert pool.stats()["requests"] == 16
+
+    def test_failed_transport_is_discarded(self, monkeypatch):
+        monkeypatch.setattr(retry, "BACKOFF_BASE", 0.001)
+        pool = _pool(fail=True)
+        with pytest.raises(OSError):
+            pool.request("https://www.googleapis.com/x")
+
+        stats = pool.stats()
+        assert stats["transports_discarded"] == retry.MAX_ATTEMPTS  # a GET is retried on a fresh transport
+        assert stats["idle"] == 0 and stats["in_use"] == 0
+
+    def test_transport_returned_after_close_is_closed(self):
+        pool = _pool(size=2, delay=0.1)
+        request = threading.Thread(target=pool.request, args=("https://www.googleapis.com/x",))
+        request.start()
+        time.sleep(0.03)
+        pool.close()
+        request.join()
+
+        stats = pool.stats()
+        assert stats["idle"] == 0 and stats["in_use"] == 0
+        assert stats["transports_discarded"] == 0
+        assert pool.request("https://www.googleapis.com/y")[0].status == 200  # still usable
+        assert pool.stats()["idle"] == 0
+
+    def test_exposes_credentials_for_batch_requests(self):
+        creds = object()
+        assert PooledHttp(credentials=creds).credentials is creds
+
+
+class TestGetService:
+    @pytest.fixture(autouse=True)
+    def clean_cache(self):
+        service_module.reset()
+        yield
+        service_module.reset()
+
+    def test_built_once_and_shares_pool(self):
+        with patch.object(service_module, "get_credential_manager", return_value=object()) as get_creds, \
+                patch.object(service_module, "build", side_effect=lambda api, v, http: (api, http)) as build:
+            cal1 = service_module.get_service("calendar", "v3")
+            cal2 = service_module.get_service("calendar", "v3")
+            gmail = service_module.get_service("gmail", "v1")
+
+        assert cal1 is cal2
+        assert build.call_count == 2
+        assert get_creds.call_count == 1
+        assert cal1[1] is gmail[1]
+
+    def test_accounts_get_their_own_pool_and_services(self):
+        from tools.auth import account_scope
+
+        with patch.object(service_module, "get_credential_manager", side_effect=lambda s, account: account), \
+                patch.object(service_module, "build", side_effect=lambda api, v, http: (api, http)):
+            default = service_module.get_service("calendar", "v3")
+            with account_scope("ann@example.com"):
+                ann = service_module.get_service("calendar", "v3")
+                ann_again = service_module.get_service("calendar", "v3")
+
+        assert ann is ann_again
+        assert default[1].credentials == "default"
+        assert ann[1].credentials == "ann@example.com"
+
+    def test_least_recently_used_account_is_closed(self):
+        from tools.auth import account_scope
+
+        managers = {}
+
+        def _manager(scopes, account):
+            managers[account] = MagicMock()
+            return managers[account]
+
+        with patch.object(service_module, "ACCOUNT_POOL_SIZE", 2), \
+                patch.object(service_module, "get_credential_manager", side_effect=_manager), \
+                patch.object(service_module, "build", side_effect=lambda api, v, http: (api, http)):
+            for account in ["a", "b", "a", "c"]:
+                with account_scope(account):
+                    service_module.get_service("gmail", "v1")
+            stats = service_module.stats()
+
+        deadline = time.monotonic() + 2
+        while not managers["b"].close.called and time.monotonic() < deadline:
+            time.sleep(0.01)  # closed on a background thread
+        managers["b"].close.assert_called_once()
+        managers["a"].close.assert_not_called()
+        assert [k.split(":")[0] for k in stats if k != "accounts_evicted"] == ["a", "c"]
+        assert stats["accounts_evicted"] == 1
+
+    def test_real_resource_executes_through_pool(self):
+        body = json.dumps({"items": [{"id": "e1"}]}).encode()
+        pool = PooledHttp(credentials=object(), transport_factory=lambda creds: FakeTransport(body=body))
+        with patch.object(service_module, "get_http", return_value=pool):
+            calendar = service_module.get_service("calendar", "v3")
+
+        result = calendar.events().list(calendarId="primary").execute()
+
+        assert result["items"][0]["id"] == "e1"
+        assert pool.stats()["requests"] == 1
+
+
+class TestWarmUp:
+    @pytest.fixture(autouse=True)
+    def clean_cache(self):
+        service_module.reset()
+        yield
+        service_module.reset()
+
+    def test_discovery_documents_parsed_once(self):
+        assert service_module.discovery_document("calendar", "v3") is service_module.discovery_document("calendar", "v3")
+        with pytest.raises(ValueError):
+            service_module.discovery_document("calendar", "v0")
+
+    def test_builds_services_only_with_a_complete_token(self):
+        with patch.object(service_module, "get_credential_manager", return_value=object()) as get_creds, \
+                patch.object(service_module, "has_token", return_value=False):
+            assert service_module.warm_up()["services_built"] == 0
+        get_creds.assert_not_called()
+
+        with patch.object(service_module, "get_credential_manager", return_value=object()), \
+                patch.object(service_module, "has_token", return_value=True):
+            assert service_module.warm_up()["services_built"] == 2
+            assert service_module.stats()
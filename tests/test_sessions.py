@@ -0,0 +1,136 @@
+"""
+Tests for sessions.py.
+
+The store is exercised directly with a fake clock so eviction is deterministic.
+"""
+import asyncio
+
+import pytest
+
+from sessions import SessionStore, estimate_message_bytes, is_valid_session_id
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def _store(clock, **kwargs):
+    return SessionStore(system_prompt="system", clock=clock, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# get / save
+# ---------------------------------------------------------------------------
+
+class TestSessionStoreBasics:
+    def test_new_session_starts_with_system_prompt(self, clock):
+        session = _store(clock).get("s1")
+        assert session.messages == [{"role": "system", "content": "system"}]
+
+    def test_same_id_returns_same_session(self, clock):
+        store = _store(clock)
+        assert store.get("s1") is store.get("s1")
+
+    def test_save_replaces_history_and_tracks_bytes(self, clock):
+        store = _store(clock)
+        session = store.get("s1")
+        before = store.stats()["bytes_held"]
+
+        store.save(session, [*session.messages, {"role": "user", "content": "x" * 100}])
+
+        assert len(store.get("s1").messages) == 2
+        assert store.stats()["bytes_held"] == before + 100
+
+    def test_each_session_has_its_own_lock(self, clock):
+        store = _store(clock)
+        assert store.get("a").lock is not store.get("b").lock
+
+    def test_drop_removes_session(self, clock):
+        store = _store(clock)
+        store.get("s1")
+        assert store.drop("s1") is True
+        assert "s1" not in store
+        assert store.stats()["bytes_held"] == 0
+
+
+# ---------------------------------------------------------------------------
+# eviction
+# ---------------------------------------------------------------------------
+
+class TestSessionStoreEviction:
+    def test_lru_session_evicted_over_max_sessions(self, clock):
+        store = _store(clock, max_sessions=2)
+        store.get("a")
+        store.get("b")
+        store.get("a")      # a is now most recent
+        store.get("c")
+
+        assert "b" not in store
+        assert "a" in store and "c" in store
+        assert store.stats()["evicted_lru"] == 1
+
+    def test_idle_sessions_evicted_after_ttl(self, clock):
+        store = _store(clock, idle_ttl_seconds=60)
+        store.get("old")
+        clock.now = 30
+        store.get("recent")
+        clock.now = 61
+        store.get("new")
+
+        assert "old" not in store
+        assert "recent" in store
+        assert store.stats()["evicted_idle"] == 1
+
+    def test_memory_cap_evicts_least_recent(self, clock):
+        store = _store(clock, max_bytes=250)
+        a = store.get("a")
+        store.save(a, [{"role": "user", "content": "x" * 100}])
+        b = store.get("b")
+        store.save(b, [{"role": "user", "content": "x" * 100}])
+        c = store.get("c")
+        store.save(c, [{"role": "user", "content": "x" * 100}])
+
+        assert "a" not in store
+        assert store.stats()["bytes_held"] <= 250
+        assert store.stats()["evicted_memory"] == 1
+
+    def test_locked_session_is_never_evicted(self, clock):
+        store = _store(clock, max_sessions=1)
+
+        async def _run():
+            busy = store.get("busy")
+            async with busy.lock:
+                store.get("other")
+                return "busy" in store
+
+        assert asyncio.run(_run()) is True
+
+
+# ---------------------------------------------------------------------------
+# helpers
+# ---------------------------------------------------------------------------
+
+class TestHelpers:
+    def test_valid_session_ids(self):
+        assert is_valid_session_id("abc-123_XYZ")
+        assert not is_valid_session_id("")
+        assert not is_valid_session_id(None)
+        assert not is_valid_session_id("has space")
+        assert not is_valid_session_id("x" * 500)
+
+    def test_estimate_counts_content_and_tool_calls(self):
+        class Msg:
+            content = "hello"
+            tool_calls = [{"name": "get_message", "args": {"message_id": "m1"}}]
+
+        assert estimate_message_bytes({"content": "hello"}) == 5
+        assert estimate_message_bytes(Msg()) > 5
@@ -0,0 +1,31 @@
+"""
+Start-up regressions: what a fresh interpreter imports for the CLI and the tools.
+
+Each check runs in a subprocess so modules already imported by the test session
+don't hide a heavy import creeping back in.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _imported_after(statement, modules):
+    code = f"import json, sys\n{statement}\nprint(json.dumps([m for m in {modules!r} if m in sys.modules]))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("statement, heavy", [
+    # the CLI shows its prompt while the agent loads in the background
+    ("import main", ["agent", "langchain_openai", "openai", "langgraph", "googleapiclient"]),
+    # tool modules don't pull in the agent framework or build Google clients at import
+    ("import tools.calendar, tools.gmail", ["langgraph.prebuilt", "langchain_openai", "googleapiclient.discovery"]),
+    ("import tools.auth", ["google_auth_oauthlib", "googleapiclient"]),
+])
+def test_heavy_modules_stay_lazy(statement, heavy):
+    assert _imported_after(statement, heavy) == []
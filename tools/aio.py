@@ -0,0 +1,59 @@
+# tools/aio.py
+# Async entry points for the Calendar and Gmail tools.
+# googleapiclient only has a blocking transport, so each tool coroutine runs the
+# sync tool body on a dedicated, bounded executor. The event loop (and FastAPI's
+# threadpool) is never held while a Google request is in flight.
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Max Google API calls in flight at once across all conversations.
+GOOGLE_IO_THREADS = int(os.getenv("STELLA_GOOGLE_IO_THREADS", "32"))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared executor for blocking Google I/O (created on first use)."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=GOOGLE_IO_THREADS,
+                    thread_name_prefix="google-io",
+                )
+    return _EXECUTOR
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Await a blocking call on the Google I/O executor.
+    Context variables are copied so per-request state follows the call into the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def with_coroutine(t):
+    """
+    Attach an async implementation to a sync @tool so agent.ainvoke awaits it
+    instead of falling back to the loop's default executor.
+    The sync path (tool.func / agent.invoke) is unchanged.
+    """
+    sync_fn = t.func
+
+    @functools.wraps(sync_fn)
+    async def _acall(*args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(sync_fn, *args, **kwargs)
+
+    t.coroutine = _acall
+    return t
@@ -0,0 +1,75 @@
+# tools/artifacts.py
+# Tools that return structured data to the server and compact text to the LLM.
+# The tool function still returns its dict; the agent's ToolMessage gets
+#   content  = render(dict)   (what the model reads)
+#   artifact = dict           (what server.py turns into EventCards/EmailCards)
+# so nothing downstream has to parse stringified tool output.
+
+import json
+from typing import Any, Callable
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import StructuredTool
+
+from tools.fields import tool_scope
+
+
+def _strip_empty(value: Any) -> Any:
+    """Drop None / empty containers so the LLM doesn't pay for them."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            v = _strip_empty(v)
+            if v is None or v == {} or v == []:
+                continue
+            out[k] = v
+        return out
+    if isinstance(value, list):
+        return [_strip_empty(v) for v in value]
+    return value
+
+
+def render_compact(result: Any) -> str:
+    """Default LLM rendering: JSON without empty fields or whitespace."""
+    if isinstance(result, str):
+        return result
+    return json.dumps(_strip_empty(result), separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+class ArtifactTool(StructuredTool):
+    """StructuredTool whose dict result becomes the ToolMessage artifact, with render(result) as content."""
+
+    response_format: str = "content_and_artifact"
+    render: Callable[[Any], str] = render_compact
+
+    # Signatures mirror StructuredTool: BaseTool only passes config/run_manager to
+    # _run/_arun when they are named parameters.
+    def _run(self, *args: Any, config: RunnableConfig, run_manager: Any = None, **kwargs: Any) -> Any:
+        with tool_scope(self.name):  # Google response bytes count against this tool
+            result = super()._run(*args, config=config, run_manager=run_manager, **kwargs)
+        return self.render(result), result
+
+    async def _arun(self, *args: Any, config: RunnableConfig, run_manager: Any = None, **kwargs: Any) -> Any:
+        if self.coroutine is None:
+            # StructuredTool falls back to running self._run in an executor, which already renders
+            return await super()._arun(*args, config=config, run_manager=run_manager, **kwargs)
+        with tool_scope(self.name):
+            result = await super()._arun(*args, config=config, run_manager=run_manager, **kwargs)
+        return self.render(result), result
+
+
+def artifact_tool(name: str, description: str, render: Callable[[Any], str] = render_compact):
+    """
+    Drop-in replacement for @tool(name, description=...) that produces an ArtifactTool.
+    tool.func still returns the plain dict.
+    """
+    def decorator(fn: Callable[..., Any]) -> ArtifactTool:
+        return ArtifactTool.from_function(
+            func=fn,
+            name=name,
+            description=description,
+            response_format="content_and_artifact",
+            render=render,
+        )
+
+    return decorator
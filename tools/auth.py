@@ -1,53 +1,368 @@
 # tools/auth.py
 # Shared Google OAuth configuration for Calendar and Gmail tools.
-# Both tools use the same token.json and the same scope set.
+# Both tools use the same token and the same scope set.
+#
+# Tokens are stored per account: the "default" account keeps the original
+# token.json, any other account lives in TOKEN_DIR/<account>.json (added with
+# `python -m tools.auth add <account>`). The account a tool call acts for is
+# carried in a ContextVar (account_scope), which the server sets per session.
+#
+# At runtime the credentials live in a CredentialManager: one in-memory copy per
+# scope set, refreshed under a lock by a background thread shortly before the access
+# token expires, so tool calls don't wait on a token round trip. token.json is
+# rewritten atomically after each refresh.
 
+import copy
+import contextlib
+import contextvars
+import json
+import logging
 import os
-from typing import Optional, Sequence
+import re
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Sequence
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth import _helpers
+from google.auth import credentials as google_credentials
+
+if TYPE_CHECKING:  # imported on first use: google.oauth2 pulls in the crypto stack
+    from google.oauth2.credentials import Credentials
 
 
 # Paths (relative to process cwd, typically project root)
 TOKEN_PATH = "token.json"
 CREDENTIALS_PATH = "credentials.json"
+# Tokens of accounts other than the default one
+TOKEN_DIR = os.getenv("STELLA_TOKEN_DIR", "tokens")
+
+DEFAULT_ACCOUNT = "default"
+# Account ids are client-supplied (e.g. an email address); keep them file-name safe
+_ACCOUNT_ID = re.compile(r"[A-Za-z0-9@+_-][A-Za-z0-9@.+_-]{0,127}")
+
+# Refresh this many seconds before the access token expires (tokens last an hour)
+REFRESH_MARGIN = float(os.getenv("STELLA_TOKEN_REFRESH_MARGIN", "300"))
+# After a failed background refresh, try again this many seconds later
+REFRESH_RETRY = 30.0
+
+logger = logging.getLogger(__name__)
 
 # Unified scopes for Calendar and Gmail so a single token covers both.
+# Adding a scope means every stored token has to be consented again (see get_creds).
 SCOPES = [
     "https://www.googleapis.com/auth/calendar.events",
+    "https://www.googleapis.com/auth/calendar.calendarlist.readonly",  # calendar_id="all"
+    "https://www.googleapis.com/auth/calendar.freebusy",  # find_free_slots
     "https://www.googleapis.com/auth/gmail.modify",
     "https://www.googleapis.com/auth/gmail.compose",
 ]
 
 
-def get_creds(scopes: Optional[Sequence[str]] = None) -> Credentials:
+class AccountNotAuthorized(RuntimeError):
+    """No usable token for an account (it was never added, or it lacks the scopes)."""
+
+    def __init__(self, account: str):
+        super().__init__(f"Google account {account!r} is not connected; run `python -m tools.auth add {account}`")
+        self.account = account
+
+
+_current_account: contextvars.ContextVar[str] = contextvars.ContextVar("google_account", default=DEFAULT_ACCOUNT)
+
+
+@contextlib.contextmanager
+def account_scope(account: str) -> Iterator[None]:
+    """Google calls made inside this block (and its copied contexts) act for `account`."""
+    token = _current_account.set(account)
+    try:
+        yield
+    finally:
+        _current_account.reset(token)
+
+
+def current_account() -> str:
+    return _current_account.get()
+
+
+def is_valid_account(account: Optional[str]) -> bool:
+    return bool(account) and _ACCOUNT_ID.fullmatch(account) is not None
+
+
+def token_path(account: str = DEFAULT_ACCOUNT) -> str:
+    if account == DEFAULT_ACCOUNT:
+        return TOKEN_PATH
+    if not is_valid_account(account):
+        raise ValueError(f"invalid account id: {account!r}")
+    return os.path.join(TOKEN_DIR, f"{account}.json")
+
+
+def has_token(account: str, scopes: Optional[Sequence[str]] = None) -> bool:
+    """A token is stored for account (covering `scopes`, if given)."""
+    if not (is_valid_account(account) and os.path.exists(token_path(account))):
+        return False
+    return scopes is None or set(scopes) <= _granted_scopes(token_path(account))
+
+
+def list_accounts() -> List[str]:
+    """Accounts with a stored token."""
+    accounts = [DEFAULT_ACCOUNT] if os.path.exists(TOKEN_PATH) else []
+    if os.path.isdir(TOKEN_DIR):
+        accounts += sorted(
+            name[:-5] for name in os.listdir(TOKEN_DIR)
+            if name.endswith(".json") and is_valid_account(name[:-5])
+        )
+    return accounts
+
+
+def _request() -> Any:
+    """An HTTP request object for token refreshes (google.auth's requests transport, imported on first use)."""
+    from google.auth.transport.requests import Request
+
+    return Request()
+
+
+def _granted_scopes(path: str) -> set:
+    """Scopes recorded in a token file (what the user consented to)."""
+    with open(path) as f:
+        return set(json.load(f).get("scopes") or [])
+
+
+def get_creds(
+    scopes: Optional[Sequence[str]] = None,
+    account: str = DEFAULT_ACCOUNT,
+    interactive: Optional[bool] = None,
+) -> "Credentials":
     """
-    Return valid OAuth Credentials for the given scopes.
-    - Loads token from TOKEN_PATH if present
+    Return valid OAuth Credentials for the given scopes and account.
+    - Loads the account's token (token_path) if present
     - Refreshes if expired (and refresh_token exists)
-    - Otherwise runs local-server OAuth flow using CREDENTIALS_PATH
-    - Writes token back to TOKEN_PATH
+    - Otherwise (or if the token lacks some of the scopes) runs local-server OAuth flow using
+      CREDENTIALS_PATH when interactive (by default only for the default account), else
+      raises AccountNotAuthorized
+    - Writes token back to the account's token file
     Uses the unified SCOPES by default so Calendar and Gmail share one token.
     """
+    from google.oauth2.credentials import Credentials
+
     scopes_list = list(scopes if scopes is not None else SCOPES)
+    path = token_path(account)
+    if interactive is None:
+        interactive = account == DEFAULT_ACCOUNT
 
-    creds: Optional[Credentials] = None
+    creds: Optional["Credentials"] = None
 
-    if os.path.exists(TOKEN_PATH):
-        creds = Credentials.from_authorized_user_file(TOKEN_PATH, scopes_list)
+    # a token from before scopes were added can't be refreshed into them: ask again
+    if os.path.exists(path) and set(scopes_list) <= _granted_scopes(path):
+        creds = Credentials.from_authorized_user_file(path, scopes_list)
 
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
+            creds.refresh(_request())
+        elif interactive:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+
             flow = InstalledAppFlow.from_client_secrets_file(
                 CREDENTIALS_PATH, scopes_list
             )
             creds = flow.run_local_server(port=0)
+        else:
+            raise AccountNotAuthorized(account)
 
-        with open(TOKEN_PATH, "w") as f:
-            f.write(creds.to_json())
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_token(creds, path)
 
     return creds
+
+
+def write_token(creds: "Credentials", path: str = TOKEN_PATH) -> None:
+    """Replace the token file atomically: readers see the old token or the new one, never half of one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".token-", suffix=".tmp", dir=directory)  # created 0600
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(creds.to_json())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class CredentialManager(google_credentials.Credentials):
+    """
+    Thread-safe holder for one set of OAuth Credentials, used in their place by every
+    AuthorizedHttp in a pool (it provides before_request / refresh / apply). It is a
+    google.auth Credentials itself, since googleapiclient's batch requests check the
+    pool's credentials with isinstance before using them.
+
+    A daemon thread refreshes the token REFRESH_MARGIN seconds before it expires and
+    writes it to token_path. The refresh runs on a copy that is swapped in when done, so
+    requests keep using the current (still valid) token meanwhile. Requests only refresh
+    inline if the token is invalid anyway (e.g. the background refresh kept failing) or
+    Google answers 401; one thread refreshes while the others wait for its token.
+    """
+
+    def __init__(
+        self,
+        creds: "Credentials",
+        token_path: Optional[str] = TOKEN_PATH,
+        margin: float = REFRESH_MARGIN,
+        request_factory: Callable[[], Any] = _request,
+        clock: Callable[[], datetime] = _helpers.utcnow,
+    ) -> None:
+        self._creds = creds
+        super().__init__()
+        self.token_path = token_path
+        self.margin = margin
+        self._request_factory = request_factory
+        self._clock = clock
+        self._lock = threading.Lock()          # guards self._creds; held only briefly
+        self._refresh_lock = threading.Lock()  # one refresh (and token write) at a time
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"background_refreshes": 0, "inline_refreshes": 0, "refresh_failures": 0}
+
+    # ---- the google.auth.credentials.Credentials surface AuthorizedHttp uses ----
+
+    @property
+    def token(self) -> Optional[str]:
+        with self._lock:
+            return self._creds.token
+
+    @token.setter
+    def token(self, value: Optional[str]) -> None:
+        # only google.auth's __init__ assigns this (None); the token lives in self._creds
+        if value is not None:
+            raise AttributeError("CredentialManager.token is read-only")
+
+    @property
+    def expiry(self) -> Optional[datetime]:
+        with self._lock:
+            return self._creds.expiry
+
+    @expiry.setter
+    def expiry(self, value: Optional[datetime]) -> None:
+        if value is not None:
+            raise AttributeError("CredentialManager.expiry is read-only")
+
+    @property
+    def valid(self) -> bool:
+        with self._lock:
+            return self._creds.valid
+
+    @property
+    def universe_domain(self) -> str:
+        return getattr(self._creds, "universe_domain", None) or google_credentials.DEFAULT_UNIVERSE_DOMAIN
+
+    @property
+    def quota_project_id(self) -> Optional[str]:
+        return getattr(self._creds, "quota_project_id", None)
+
+    def apply(self, headers: Dict[str, str], token: Optional[str] = None) -> None:
+        with self._lock:
+            self._creds.apply(headers, token=token)
+
+    def before_request(self, request: Any, method: str, url: str, headers: Dict[str, str]) -> None:
+        with self._lock:
+            if self._creds.valid:
+                self._creds.apply(headers)
+                return
+            stale = self._creds.token
+        self._refresh(stale, "inline_refreshes")
+        self.apply(headers)
+
+    def refresh(self, request: Any) -> None:
+        """Called by AuthorizedHttp after a 401."""
+        self._refresh(self.token, "inline_refreshes")
+
+    # ---- refreshing ----
+
+    def _refresh(self, stale_token: Optional[str], counter: str) -> None:
+        with self._refresh_lock:
+            with self._lock:
+                if self._creds.token != stale_token and self._creds.valid:
+                    return  # another thread refreshed while this one waited
+                fresh = copy.copy(self._creds)
+            try:
+                fresh.refresh(self._request_factory())
+            except Exception:
+                with self._lock:
+                    self._counters["refresh_failures"] += 1
+                raise
+            with self._lock:
+                self._creds = fresh
+                self._counters[counter] += 1
+            if self.token_path:
+                write_token(fresh, self.token_path)
+
+    def seconds_left(self) -> Optional[float]:
+        """Seconds until the access token expires (None if it has no expiry)."""
+        expiry = self.expiry
+        return None if expiry is None else (expiry - self._clock()).total_seconds()
+
+    def _run(self) -> None:
+        while True:
+            left = self.seconds_left()
+            wait = REFRESH_RETRY if left is None else max(0.0, left - self.margin)
+            if self._stop.wait(wait):
+                return
+            left = self.seconds_left()
+            if left is not None and left > self.margin:
+                continue  # refreshed inline in the meantime
+            try:
+                self._refresh(self.token, "background_refreshes")
+            except Exception:
+                logger.exception("token refresh failed, retrying in %.0f s", REFRESH_RETRY)
+                if self._stop.wait(REFRESH_RETRY):
+                    return
+
+    def start(self) -> "CredentialManager":
+        """Start background refreshing (no-op without a refresh token)."""
+        with self._lock:
+            if self._thread is None and self._creds.refresh_token:
+                self._thread = threading.Thread(target=self._run, name="oauth-refresh", daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        left = self.seconds_left()
+        with self._lock:
+            return {**self._counters, "expires_in": None if left is None else round(left)}
+
+
+def get_credential_manager(
+    scopes: Optional[Sequence[str]] = None,
+    account: str = DEFAULT_ACCOUNT,
+) -> CredentialManager:
+    """
+    Background-refreshed credentials for this account and scope set. Each call loads the
+    token again: callers keep the manager (tools.service holds one per pooled account)
+    and close() it when done.
+    """
+    creds = get_creds(scopes, account=account)
+    return CredentialManager(creds, token_path=token_path(account)).start()
+
+
+def main(argv: List[str]) -> None:
+    command = argv[0] if argv else "list"
+    if command == "add" and len(argv) == 2:
+        get_creds(account=argv[1], interactive=True)
+        print(f"connected {argv[1]} ({token_path(argv[1])})")
+    elif command == "list":
+        print("\n".join(list_accounts()) or "no accounts connected")
+    else:
+        print("usage: python -m tools.auth add <account> | list")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,52 +1,288 @@
 # Auth/service setup is plumbing; the agent shouldn’t call it directly. Your tools should call get_service() internally. ie don't make it a tool
-from langchain.tools import tool
+from langchain_core.tools import tool
 
+import contextvars
 import datetime
-from typing import Optional, Tuple, List, Dict, Any
+import heapq
+import os
+import threading
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Optional, Tuple, List, Dict, Any, Iterator
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from tools.auth import get_creds, SCOPES
+from tools.aio import with_coroutine
+from tools.auth import DEFAULT_ACCOUNT, current_account
+from tools.artifacts import artifact_tool, render_compact
+from tools.fields import FIELDS, event_card
+from tools.freebusy import free_slots, merge_intervals, query_busy, working_windows
+from tools.service import get_service as google_service
 
 DEFAULT_TZ = "America/New_York"
 
-# ---- simple in-process cache so we don't rebuild every tool call ----
-_SERVICE_CACHE = {
-    "scopes": None,      # type: Optional[Tuple[str, ...]]
-    "service": None      # type: Optional[object]
-}
+# events.list returns at most this many events per page
+EVENTS_PAGE_SIZE = 2500
+
+# calendar_id value that lists every calendar in the user's calendar list
+ALL_CALENDARS = "all"
+# How long the calendarList is reused before being fetched again (seconds)
+CALENDAR_LIST_TTL = float(os.getenv("STELLA_CALENDAR_LIST_TTL", "300"))
+# Calendars listed at once in all-calendars mode
+FANOUT_CONCURRENCY = int(os.getenv("STELLA_CALENDAR_FANOUT", "8"))
+
+_calendar_lists: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}  # by account
+_calendar_list_lock = threading.Lock()
+_FANOUT_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_FANOUT_EXECUTOR_LOCK = threading.Lock()
 
 
 def get_service():
     """
-    Return a Google Calendar API 'service' object:
-      service = build("calendar", "v3", credentials=creds)
+    Return the Google Calendar API service (calendar v3).
 
-    Caches the service in-process so repeated tool calls are fast.
+    Built once per process on a thread-safe pool of authorized HTTP transports
+    (tools.service), so tool calls can run in parallel.
     Uses shared OAuth credentials from tools.auth (same token as Gmail).
     """
-    scopes_tuple = tuple(SCOPES)
+    return google_service("calendar", "v3")
 
-    cached_scopes = _SERVICE_CACHE["scopes"]
-    cached_service = _SERVICE_CACHE["service"]
 
-    if cached_service is not None and cached_scopes == scopes_tuple:
-        return cached_service
+def _render_event_time(d: Optional[Dict[str, str]]) -> str:
+    if not d:
+        return "?"
+    if d.get("dateTime"):
+        return d["dateTime"]
+    return f"{d.get('date')} (all day)"
 
-    creds = get_creds()
-    service = build("calendar", "v3", credentials=creds)
 
-    _SERVICE_CACHE["scopes"] = scopes_tuple
-    _SERVICE_CACHE["service"] = service
-    return service
+def render_event_list(result: Dict[str, Any]) -> str:
+    """
+    Compact LLM view of an event listing: one header line, then one line per event.
+    Links are left out; the frontend shows them on the event cards.
+    """
+    header = {k: v for k, v in result.items() if k != "events"}
+    lines = [render_compact(header)]
+    for ev in result.get("events") or []:
+        parts = [
+            ev.get("event_id") or "",
+            ev.get("summary") or "(No title)",
+            f"{_render_event_time(ev.get('start'))} -> {_render_event_time(ev.get('end'))}",
+        ]
+        if ev.get("location"):
+            parts.append(ev["location"])
+        if ev.get("calendar_id"):
+            parts.append(f"calendar: {ev['calendar_id']}")
+        lines.append("- " + " | ".join(parts))
+    return "\n".join(lines)
+
+
+def render_free_slots(result: Dict[str, Any]) -> str:
+    """Compact LLM view of find_free_slots: one header line, then one line per slot."""
+    header = {k: v for k, v in result.items() if k != "slots"}
+    lines = [render_compact(header)]
+    for slot in result.get("slots") or []:
+        lines.append(f"- {slot['start']} -> {slot['end']} ({slot['minutes']} min)")
+    return "\n".join(lines)
+
+
+def _cache():
+    """The local event cache (tools.eventstore), or None when it's off (it mirrors the default account only)."""
+    if current_account() != DEFAULT_ACCOUNT:
+        return None
+    from tools.eventstore import get_cache  # imported here: eventstore builds on this module
+    return get_cache()
+
+
+def iter_event_pages(service, page_size: int = EVENTS_PAGE_SIZE, **params: Any) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Lazily yield events.list pages for params, following nextPageToken. Each page is
+    fetched only when the caller asks for it, so stopping early saves the requests.
+    """
+    page_token = None
+    while True:
+        page_params = {**params, "maxResults": page_size}
+        if page_token:
+            page_params["pageToken"] = page_token
+        resp = service.events().list(**page_params).execute()
+        yield resp.get("items", []) or []
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def _list_events(
+    service,
+    calendar_id: str,
+    start_dt: datetime.datetime,
+    end_dt: datetime.datetime,
+    limit: int,
+    query: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """
+    (first `limit` events overlapping [start_dt, end_dt) in start order, truncated?,
+    served locally?). Uses the event cache when it can answer, else events.list pages
+    as large as the limit needs (so a month or quarter is usually one request).
+    """
+    cache = _cache()
+    if cache is not None:
+        items = cache.events_between(calendar_id, start_dt, end_dt, query=query, max_results=limit + 1)
+        if items is not None:
+            return items[:limit], len(items) > limit, True
+
+    params: Dict[str, Any] = {
+        "calendarId": calendar_id,
+        "timeMin": start_dt.isoformat(),
+        "timeMax": end_dt.isoformat(),
+        "singleEvents": True,  # expands recurring events into instances
+        "orderBy": "startTime",
+        "fields": FIELDS["calendar.events.list"],
+    }
+    if query:
+        params["q"] = query
+    # one event past the limit tells us whether anything was left out
+    pages = iter_event_pages(service, page_size=min(limit + 1, EVENTS_PAGE_SIZE), **params)
+    items = list(islice((ev for page in pages for ev in page), limit + 1))
+    return items[:limit], len(items) > limit, False
+
+
+def list_calendars(service, refresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Calendars the user has on display (calendarList.list, minus hidden and unselected ones;
+    the primary calendar always counts), as {"id", "summary", "primary"}. Cached per account
+    for CALENDAR_LIST_TTL seconds.
+    """
+    account = current_account()
+    with _calendar_list_lock:
+        cached = _calendar_lists.get(account)
+        if not refresh and cached is not None and _time.monotonic() - cached[0] < CALENDAR_LIST_TTL:
+            return cached[1]
+
+    calendars: List[Dict[str, Any]] = []
+    page_token = None
+    while True:
+        params: Dict[str, Any] = {"fields": FIELDS["calendar.calendarList.list"]}
+        if page_token:
+            params["pageToken"] = page_token
+        resp = service.calendarList().list(**params).execute()
+        for entry in resp.get("items") or []:
+            if entry.get("primary") or (entry.get("selected") and not entry.get("hidden")):
+                calendars.append({
+                    "id": entry["id"],
+                    "summary": entry.get("summary"),
+                    "primary": bool(entry.get("primary")),
+                })
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+
+    with _calendar_list_lock:
+        _calendar_lists[account] = (_time.monotonic(), calendars)
+    return calendars
+
+
+def _fanout_executor() -> ThreadPoolExecutor:
+    """Shared pool for all-calendars listings; bounds how many calendars are fetched at once."""
+    global _FANOUT_EXECUTOR
+    if _FANOUT_EXECUTOR is None:
+        with _FANOUT_EXECUTOR_LOCK:
+            if _FANOUT_EXECUTOR is None:
+                _FANOUT_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=FANOUT_CONCURRENCY,
+                    thread_name_prefix="calendar-fanout",
+                )
+    return _FANOUT_EXECUTOR
+
+
+def _list_all_events(
+    service,
+    start_dt: datetime.datetime,
+    end_dt: datetime.datetime,
+    limit: int,
+    query: Optional[str] = None,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], bool, bool, Dict[str, str]]:
+    """
+    _list_events for every calendar in list_calendars(), fetched concurrently and merged
+    in start order with a k-way heap merge. Returns ((calendar id, event) pairs, truncated?,
+    all served locally?, error by calendar id); one unreadable calendar doesn't fail the rest.
+    """
+    from tools.eventstore import event_bounds  # imported here: eventstore builds on this module
+
+    calendar_ids = [c["id"] for c in list_calendars(service)]
+    executor = _fanout_executor()
+    # each calendar runs in a copy of the caller's context so its responses count against the calling tool
+    futures = [
+        executor.submit(contextvars.copy_context().run, _list_events, service, cid, start_dt, end_dt, limit, query)
+        for cid in calendar_ids
+    ]
+
+    runs: List[List[Tuple[datetime.datetime, str, Dict[str, Any]]]] = []
+    errors: Dict[str, str] = {}
+    truncated, local = False, True
+    for cid, future in zip(calendar_ids, futures):
+        try:
+            items, more, served = future.result()
+        except HttpError as e:
+            errors[cid] = f"{e.status_code} {e.reason}"
+            continue
+        truncated = truncated or more
+        local = local and served
+        # each calendar's events are already in start order, so a heap merge keeps the total order
+        runs.append([(event_bounds(ev, start_dt.tzinfo)[0], cid, ev) for ev in items])
+
+    merged = list(islice(heapq.merge(*runs, key=lambda run: run[0]), limit + 1))
+    truncated = truncated or len(merged) > limit
+    return [(cid, ev) for _, cid, ev in merged[:limit]], truncated, local, errors
+
+
+def _listing(
+    service,
+    calendar_id: str,
+    start_dt: datetime.datetime,
+    end_dt: datetime.datetime,
+    limit: int,
+    query: Optional[str] = None,
+) -> Dict[str, Any]:
+    """count / events / truncated (/ source, errors) for the listing tools; calendar_id may be ALL_CALENDARS."""
+    if calendar_id != ALL_CALENDARS:
+        items, truncated, local = _list_events(service, calendar_id, start_dt, end_dt, limit, query=query)
+        return {
+            "count": len(items),
+            "events": [event_card(ev) for ev in items],
+            "truncated": truncated,
+            **({"source": "cache"} if local else {}),
+        }
+
+    pairs, truncated, local, errors = _list_all_events(service, start_dt, end_dt, limit, query=query)
+    return {
+        "count": len(pairs),
+        # the calendar id is what update_event / delete_event need for events off the primary calendar
+        "events": [{**event_card(ev), "calendar_id": cid} for cid, ev in pairs],
+        "truncated": truncated,
+        **({"source": "cache"} if local else {}),
+        **({"errors": errors} if errors else {}),
+    }
+
+
+def _cache_put(calendar_id: str, event: Dict[str, Any]) -> None:
+    cache = _cache()
+    if cache is not None:
+        cache.put(calendar_id, event)
+
+
+def _cache_remove(calendar_id: str, event_id: str) -> None:
+    cache = _cache()
+    if cache is not None:
+        cache.remove(calendar_id, event_id)
 
 
 ###########
 ## TOOLS ##
 ###########
 
-@tool("create_event", description="Create a calendar event. start/end must be dicts like {'dateTime': ISO, 'timeZone': TZ} or {'date': 'yyyy-mm-dd'} (for full day events). ")
+@with_coroutine
+@artifact_tool("create_event", description="Create a calendar event. start/end must be dicts like {'dateTime': ISO, 'timeZone': TZ} or {'date': 'yyyy-mm-dd'} (for full day events). ")
 def create_event(
     event_name: str,
     start: Dict[str, str],
@@ -85,15 +321,12 @@ def create_event(
     if attendees:
         event["attendees"] = [{"email": e} for e in attendees]
 
-    created = service.events().insert(calendarId=calendar_id, body=event).execute()
+    created = service.events().insert(
+        calendarId=calendar_id, body=event, fields=FIELDS["calendar.events.insert"]
+    ).execute()
+    _cache_put(calendar_id, created)
 
-    return {
-        "event_id": created.get("id"),
-        "summary": created.get("summary"),
-        "start": created.get("start"),
-        "end": created.get("end"),
-        "htmlLink": created.get("htmlLink"),
-    }
+    return event_card(created)
 
 
 
@@ -101,9 +334,15 @@ def create_event(
 from datetime import datetime, date, time, timedelta
 from zoneinfo import ZoneInfo
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "list_events_for_day",
-    description="List events for a given day. date_str must be 'YYYY-MM-DD'. Returns events with ids."
+    render=render_event_list,
+    description=(
+        "List events for a given day. date_str must be 'YYYY-MM-DD'. Returns events with ids. "
+        "max_results caps the total; truncated=true means more events exist. "
+        "calendar_id='all' covers every calendar the user shows (shared, team, subscribed)."
+    ),
 )
 def list_events_for_day(
     date_str: str,
@@ -119,49 +358,29 @@ def list_events_for_day(
     start_dt = datetime.combine(d, time.min).replace(tzinfo=tz)
     end_dt = (start_dt + timedelta(days=1))
 
-    events_result = (
-        service.events()
-        .list(
-            calendarId=calendar_id,
-            timeMin=start_dt.isoformat(),
-            timeMax=end_dt.isoformat(),
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=max_results,
-        )
-        .execute()
-    )
-
-    items = events_result.get("items", [])
-
-    def _extract(ev):
-        return {
-            "event_id": ev.get("id"),
-            "summary": ev.get("summary"),
-            "start": ev.get("start"),
-            "end": ev.get("end"),
-            "htmlLink": ev.get("htmlLink"),
-            "location": ev.get("location"),
-        }
-
     return {
         "date": date_str,
         "timezone": timezone,
-        "count": len(items),
-        "events": [_extract(ev) for ev in items],
+        **_listing(service, calendar_id, start_dt, end_dt, max_results),
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "list_events_between",
-    description="List calendar events between two dates (inclusive). Dates are YYYY-MM-DD."
+    render=render_event_list,
+    description=(
+        "List calendar events between two dates (inclusive). Dates are YYYY-MM-DD. Whole months or "
+        "quarters come back complete up to max_results; truncated=true means more events exist. "
+        "calendar_id='all' covers every calendar the user shows (shared, team, subscribed)."
+    ),
 )
 def list_events_between(
     start_date: str,
     end_date: str,
     calendar_id: str = "primary",
     timezone: str = DEFAULT_TZ,
-    max_results: int = 50,
+    max_results: int = 250,
 ) -> Dict[str, Any]:
     service = get_service()
     tz = ZoneInfo(timezone)
@@ -177,39 +396,13 @@ def list_events_between(
         time.min
     ).replace(tzinfo=tz) + timedelta(days=1)
 
-    events_result = (
-        service.events()
-        .list(
-            calendarId=calendar_id,
-            timeMin=start_dt.isoformat(),
-            timeMax=end_dt.isoformat(),
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=max_results,
-        )
-        .execute()
-    )
-
-    items = events_result.get("items", [])
-
     return {
         "range": {
             "start_date": start_date,
             "end_date": end_date,
             "timezone": timezone,
         },
-        "count": len(items),
-        "events": [
-            {
-                "event_id": ev.get("id"),
-                "summary": ev.get("summary"),
-                "start": ev.get("start"),
-                "end": ev.get("end"),
-                "location": ev.get("location"),
-                "htmlLink": ev.get("htmlLink"),
-            }
-            for ev in items
-        ],
+        **_listing(service, calendar_id, start_dt, end_dt, max_results),
     }
 
 
@@ -217,11 +410,14 @@ from datetime import datetime, date, time, timedelta
 from zoneinfo import ZoneInfo
 from typing import Optional, Dict, Any, List
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "find_events",
+    render=render_event_list,
     description=(
         "Find events by free-text query within a date range (inclusive). "
-        "Dates are YYYY-MM-DD. Returns events with ids."
+        "Dates are YYYY-MM-DD. Returns events with ids; truncated=true means more matches exist. "
+        "calendar_id='all' searches every calendar the user shows."
     ),
 )
 def find_events(
@@ -238,41 +434,97 @@ def find_events(
     start_dt = datetime.combine(date.fromisoformat(start_date), time.min).replace(tzinfo=tz)
     end_dt = datetime.combine(date.fromisoformat(end_date), time.min).replace(tzinfo=tz) + timedelta(days=1)
 
-    events_result = (
-        service.events()
-        .list(
-            calendarId=calendar_id,
-            q=query,
-            timeMin=start_dt.isoformat(),
-            timeMax=end_dt.isoformat(),
-            singleEvents=True,     # expands recurring events into instances
-            orderBy="startTime",
-            maxResults=max_results,
-        )
-        .execute()
-    )
-
-    items = events_result.get("items", [])
-
     return {
         "query": query,
         "range": {"start_date": start_date, "end_date": end_date, "timezone": timezone},
-        "count": len(items),
-        "events": [
+        **_listing(service, calendar_id, start_dt, end_dt, max_results, query=query),
+    }
+
+
+@with_coroutine
+@artifact_tool(
+    "find_free_slots",
+    render=render_free_slots,
+    description=(
+        "Find free time shared by one or more calendars between two dates (inclusive, YYYY-MM-DD). "
+        "Returns slots of at least duration_minutes inside working hours (HH:MM in timezone), "
+        "weekdays only unless include_weekends, starting on granularity_minutes boundaries. "
+        "Use this for 'when am I / are we free' instead of listing events."
+    ),
+)
+def find_free_slots(
+    start_date: str,
+    end_date: str,
+    duration_minutes: int = 30,
+    calendar_ids: Optional[List[str]] = None,
+    timezone: str = DEFAULT_TZ,
+    working_hours_start: str = "09:00",
+    working_hours_end: str = "17:00",
+    include_weekends: bool = False,
+    granularity_minutes: int = 15,
+    max_results: int = 20,
+) -> Dict[str, Any]:
+    ids = list(dict.fromkeys(calendar_ids or ["primary"]))
+    result: Dict[str, Any] = {
+        "range": {"start_date": start_date, "end_date": end_date, "timezone": timezone},
+        "duration_minutes": duration_minutes,
+        "working_hours": f"{working_hours_start}-{working_hours_end}",
+        "calendars": ids,
+    }
+    try:
+        tz = ZoneInfo(timezone)
+        windows = working_windows(
+            date.fromisoformat(start_date),
+            date.fromisoformat(end_date),
+            tz,
+            time.fromisoformat(working_hours_start),
+            time.fromisoformat(working_hours_end),
+            include_weekends,
+        )
+        if duration_minutes <= 0:
+            raise ValueError("duration_minutes must be positive")
+    except ValueError as e:
+        return {**result, "count": 0, "slots": [], "error": str(e)}
+
+    # slots that have already started aren't offered
+    now = int(datetime.now(tz).timestamp())
+    windows = [(s, e) for s, e in windows if e > now]
+    busy, errors = [], {}
+    if windows:
+        busy, errors = query_busy(
+            get_service(),
+            ids,
+            datetime.fromtimestamp(max(windows[0][0], now), tz),
+            datetime.fromtimestamp(windows[-1][1], tz),
+        )
+
+    slots, truncated = free_slots(
+        merge_intervals(busy),
+        windows,
+        duration=duration_minutes * 60,
+        step=max(0, granularity_minutes) * 60,
+        limit=max_results,
+        not_before=now,
+    )
+    return {
+        **result,
+        "count": len(slots),
+        "slots": [
             {
-                "event_id": ev.get("id"),
-                "summary": ev.get("summary"),
-                "start": ev.get("start"),
-                "end": ev.get("end"),
-                "location": ev.get("location"),
-                "htmlLink": ev.get("htmlLink"),
+                "start": datetime.fromtimestamp(s, tz).isoformat(),
+                "end": datetime.fromtimestamp(e, tz).isoformat(),
+                "minutes": (e - s) // 60,
             }
-            for ev in items
+            for s, e in slots
         ],
+        "truncated": truncated,
+        # busy times of these calendars are unknown, so the slots may clash with them
+        **({"errors": errors} if errors else {}),
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "delete_event",
     description=(
         "Delete a calendar event. Prefer event_id. "
@@ -292,6 +544,7 @@ def delete_event(
     # If event_id provided, delete directly
     if event_id:
         service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        _cache_remove(calendar_id, event_id)
         return {"deleted": True, "event_id": event_id, "calendar_id": calendar_id}
 
     # Otherwise resolve by search (must have query + window)
@@ -306,17 +559,7 @@ def delete_event(
     start_dt = datetime.combine(date.fromisoformat(start_date), time.min).replace(tzinfo=tz)
     end_dt = datetime.combine(date.fromisoformat(end_date), time.min).replace(tzinfo=tz) + timedelta(days=1)
 
-    events_result = service.events().list(
-        calendarId=calendar_id,
-        q=query,
-        timeMin=start_dt.isoformat(),
-        timeMax=end_dt.isoformat(),
-        singleEvents=True,
-        orderBy="startTime",
-        maxResults=10,
-    ).execute()
-
-    items = events_result.get("items", [])
+    items, _, _ = _list_events(service, calendar_id, start_dt, end_dt, 10, query=query)
     if len(items) == 0:
         return {"deleted": False, "error": "No matching events found."}
     if len(items) > 1:
@@ -331,6 +574,7 @@ def delete_event(
 
     eid = items[0].get("id")
     service.events().delete(calendarId=calendar_id, eventId=eid).execute()
+    _cache_remove(calendar_id, eid)
     return {"deleted": True, "event_id": eid, "calendar_id": calendar_id}
 
 
@@ -338,7 +582,8 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime, date, time, timedelta
 from zoneinfo import ZoneInfo
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "update_event",
     description=(
         "Patch-update a calendar event. Prefer event_id. "
@@ -372,17 +617,7 @@ def update_event(
         start_dt = datetime.combine(date.fromisoformat(start_date), time.min).replace(tzinfo=tz)
         end_dt = datetime.combine(date.fromisoformat(end_date), time.min).replace(tzinfo=tz) + timedelta(days=1)
 
-        events_result = service.events().list(
-            calendarId=calendar_id,
-            q=query,
-            timeMin=start_dt.isoformat(),
-            timeMax=end_dt.isoformat(),
-            singleEvents=True,
-            orderBy="startTime",
-            maxResults=10,
-        ).execute()
-
-        items = events_result.get("items", [])
+        items, _, _ = _list_events(service, calendar_id, start_dt, end_dt, 10, query=query)
         if len(items) == 0:
             return {"ok": False, "error": "No matching events found."}
         if len(items) > 1:
@@ -414,20 +649,15 @@ def update_event(
         calendarId=calendar_id,
         eventId=target_id,
         body=patch,
+        fields=FIELDS["calendar.events.patch"],
     ).execute()
+    _cache_put(calendar_id, updated)
 
-    return {
-        "updated": True,
-        "event_id": updated.get("id"),
-        "summary": updated.get("summary"),
-        "start": updated.get("start"),
-        "end": updated.get("end"),
-        "location": updated.get("location"),
-        "htmlLink": updated.get("htmlLink"),
-    }
+    return {"updated": True, **event_card(updated)}
 
 
 
+@with_coroutine
 @tool(
     "get_current_datetime",
     description="Return the current datetime in ISO-8601 format for a given timezone."
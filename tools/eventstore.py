@@ -0,0 +1,427 @@
+# tools/eventstore.py
+# Local cache of Google Calendar events (opt-in: STELLA_CALENDAR_CACHE=1).
+#
+# One full events.list per calendar (singleEvents, so recurring events are stored as
+# their instances), then kept current with the nextSyncToken Calendar returns: each
+# incremental sync is one small events.list call that lists only what changed.
+# Events are indexed by [start, end) in an R*Tree, so a day or week view is a local
+# interval query. The calendar write tools update the cache write-through.
+#
+# "primary" is stored under the primary calendar's real id (one calendarList.get per
+# process), so it and the all-calendars fan-out share one copy and one sync token.
+#
+#   python -m tools.eventstore sync|stats [calendar_id]
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+from tools.calendar import DEFAULT_TZ, get_service
+from tools.fields import FIELDS, tool_scope
+from tools.quota import BULK, lane_scope
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("STELLA_CALENDAR_CACHE", "0") == "1"
+CACHE_PATH = os.getenv("STELLA_CALENDAR_CACHE_PATH", "calendar_cache.db")
+# Older than this, reads are still served locally while a background sync catches up...
+CACHE_MAX_AGE = float(os.getenv("STELLA_CALENDAR_CACHE_MAX_AGE", "30"))
+# ...and older than this, the read waits for the sync
+CACHE_STALE_LIMIT = float(os.getenv("STELLA_CALENDAR_CACHE_STALE_LIMIT", "600"))
+
+# events.list maximum page size
+SYNC_PAGE_SIZE = 2500
+
+# All-day events are dates in the calendar's own zone; they are indexed this much wider
+# so a day in any viewer timezone finds them (the exact overlap is checked per row)
+_ALL_DAY_PAD = 14 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, id)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS event_spans USING rtree(id, start_ts, end_ts);
+
+CREATE TRIGGER IF NOT EXISTS event_spans_insert AFTER INSERT ON events BEGIN
+    INSERT INTO event_spans (id, start_ts, end_ts) VALUES (new.rowid, new.start_ts, new.end_ts);
+END;
+CREATE TRIGGER IF NOT EXISTS event_spans_delete AFTER DELETE ON events BEGIN
+    DELETE FROM event_spans WHERE id = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS event_spans_update AFTER UPDATE OF start_ts, end_ts ON events BEGIN
+    UPDATE event_spans SET start_ts = new.start_ts, end_ts = new.end_ts WHERE id = new.rowid;
+END;
+
+CREATE TABLE IF NOT EXISTS calendars (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    last_sync REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _parse_time(t: Optional[Dict[str, str]], tz: ZoneInfo) -> Optional[datetime]:
+    """An event start/end dict as an aware datetime (all-day dates at midnight in tz)."""
+    if not t:
+        return None
+    if t.get("dateTime"):
+        dt = datetime.fromisoformat(t["dateTime"].replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=ZoneInfo(t.get("timeZone") or DEFAULT_TZ))
+    if t.get("date"):
+        return datetime.combine(date.fromisoformat(t["date"]), datetime.min.time()).replace(tzinfo=tz)
+    return None
+
+
+def event_bounds(event: Dict[str, Any], tz: ZoneInfo) -> Tuple[datetime, datetime]:
+    """[start, end) of an event, with all-day events read in tz."""
+    start = _parse_time(event.get("start"), tz)
+    end = _parse_time(event.get("end"), tz) or start
+    return start, end
+
+
+def _index_span(event: Dict[str, Any]) -> Tuple[int, int]:
+    utc = ZoneInfo("UTC")
+    start, end = event_bounds(event, utc)
+    pad = _ALL_DAY_PAD if "date" in (event.get("start") or {}) else 0
+    return int(start.timestamp()) - pad, int(end.timestamp()) + pad
+
+
+def _matches(event: Dict[str, Any], words: List[str]) -> bool:
+    """Local stand-in for events.list q=: every word appears in the event's text fields."""
+    fields = [event.get("summary"), event.get("description"), event.get("location")]
+    for person in [event.get("organizer") or {}, *(event.get("attendees") or [])]:
+        fields += [person.get("email"), person.get("displayName")]
+    text = " ".join(f for f in fields if f).lower()
+    return all(w in text for w in words)
+
+
+class EventCache:
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        service_factory: Callable[[], Any] = get_service,
+        max_age: float = CACHE_MAX_AGE,
+        stale_limit: float = CACHE_STALE_LIMIT,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_age = max_age
+        self.stale_limit = stale_limit
+        self._service_factory = service_factory
+        self._clock = clock
+
+        # one connection shared by all threads, serialized by _db_lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        # INSERT OR REPLACE must fire the delete trigger for the row it replaces
+        self._db.execute("PRAGMA recursive_triggers = ON")
+        self._db.executescript(_SCHEMA)
+        with self._db:
+            # written by versions that cached "primary" under that alias
+            self._db.execute("DELETE FROM events WHERE calendar_id = 'primary'")
+            self._db.execute("DELETE FROM calendars WHERE calendar_id = 'primary'")
+        self._db_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._threads_lock = threading.Lock()
+        self._sync_threads: Dict[str, threading.Thread] = {}
+        self._primary_id: Optional[str] = None
+        self._counters = {
+            "served_local": 0,
+            "fallbacks": 0,
+            "syncs": 0,
+            "full_syncs": 0,
+            "changes_applied": 0,
+            "background_syncs": 0,
+            "write_through": 0,
+        }
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._db_lock:
+            self._counters[key] += n
+
+    # ---- per-calendar sync state ----
+
+    def calendar_key(self, calendar_id: str) -> str:
+        """The id this calendar is cached under: "primary" becomes the primary calendar's real id."""
+        if calendar_id != "primary":
+            return calendar_id
+        if self._primary_id is None:
+            with tool_scope("calendar_cache"):
+                self._primary_id = self._service_factory().calendarList().get(
+                    calendarId="primary", fields=FIELDS["calendar.calendarList.get"]
+                ).execute()["id"]
+        return self._primary_id
+
+    def _state(self, calendar_id: str) -> Optional[sqlite3.Row]:
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT sync_token, last_sync FROM calendars WHERE calendar_id = ?", (calendar_id,)
+            ).fetchone()
+
+    def ready(self, calendar_id: str) -> bool:
+        """True once a full sync of this calendar has completed."""
+        state = self._state(self.calendar_key(calendar_id))
+        return state is not None and state["sync_token"] is not None
+
+    def age(self, calendar_id: str) -> Optional[float]:
+        state = self._state(self.calendar_key(calendar_id))
+        return None if state is None else max(0.0, self._clock() - state["last_sync"])
+
+    def invalidate(self, calendar_id: Optional[str]) -> None:
+        """Make the next read of this calendar (None: of every calendar) sync first."""
+        with self._db_lock, self._db:
+            if calendar_id is None:
+                self._db.execute("UPDATE calendars SET last_sync = 0")
+            else:
+                self._db.execute("UPDATE calendars SET last_sync = 0 WHERE calendar_id = ?",
+                                 (self.calendar_key(calendar_id),))
+
+    # ---- writes ----
+
+    def _upsert(self, calendar_id: str, events: List[Dict[str, Any]]) -> None:
+        rows = []
+        for ev in events:
+            start, end = _index_span(ev)
+            rows.append((calendar_id, ev["id"], start, end, json.dumps(ev)))
+        self._db.executemany("INSERT OR REPLACE INTO events VALUES (?,?,?,?,?)", rows)
+
+    def _delete(self, calendar_id: str, event_ids: List[str]) -> None:
+        # deleting a recurring event removes its instances too
+        self._db.executemany(
+            "DELETE FROM events WHERE calendar_id = ? AND "
+            "(id = ? OR json_extract(body, '$.recurringEventId') = ?)",
+            [(calendar_id, i, i) for i in event_ids],
+        )
+
+    def _write_key(self, calendar_id: str) -> Optional[str]:
+        """calendar_key for a write-through; None (every calendar made stale) if it can't be resolved."""
+        try:
+            return self.calendar_key(calendar_id)
+        except Exception:
+            logger.exception("calendar cache: can't resolve %s, invalidating every calendar", calendar_id)
+            self.invalidate(None)
+            return None
+
+    def put(self, calendar_id: str, event: Dict[str, Any]) -> None:
+        """Write-through for an event we just created or patched."""
+        calendar_id = self._write_key(calendar_id)
+        if calendar_id is None or not self.ready(calendar_id):
+            return
+        if event.get("recurrence") or event.get("status") == "cancelled":
+            # a recurring series is stored as instances; let the next sync expand it
+            self.invalidate(calendar_id)
+            return
+        with self._db_lock, self._db:
+            self._upsert(calendar_id, [event])
+        self._count("write_through")
+
+    def remove(self, calendar_id: str, event_id: str) -> None:
+        """Write-through for an event we just deleted."""
+        calendar_id = self._write_key(calendar_id)
+        if calendar_id is None or not self.ready(calendar_id):
+            return
+        with self._db_lock, self._db:
+            self._delete(calendar_id, [event_id])
+        self._count("write_through")
+
+    # ---- sync ----
+
+    def sync(self, calendar_id: str = "primary") -> int:
+        """
+        Bring one calendar up to date: incremental with its sync token, or a full sync the
+        first time (and when Calendar expires the token). Returns events changed.
+        """
+        calendar_id = self.calendar_key(calendar_id)
+        with self._sync_lock, tool_scope("calendar_cache"):
+            state = self._state(calendar_id)
+            token = state["sync_token"] if state is not None else None
+            try:
+                changed, next_token = self._list_changes(calendar_id, token)
+            except HttpError as e:
+                if token is None or getattr(e, "status_code", None) != 410:
+                    raise
+                logger.warning("calendar cache: sync token for %s expired, full sync", calendar_id)
+                token = None
+                changed, next_token = self._list_changes(calendar_id, None)
+
+            with self._db_lock, self._db:
+                if token is None:
+                    self._db.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+                self._delete(calendar_id, [ev["id"] for ev in changed if ev.get("status") == "cancelled"])
+                self._upsert(calendar_id, [ev for ev in changed if ev.get("status") != "cancelled"])
+                self._db.execute(
+                    "INSERT OR REPLACE INTO calendars VALUES (?, ?, ?)", (calendar_id, next_token, self._clock())
+                )
+            self._count("full_syncs" if token is None else "syncs")
+            self._count("changes_applied", len(changed))
+            return len(changed)
+
+    def _list_changes(self, calendar_id: str, token: Optional[str]) -> Tuple[List[Dict[str, Any]], str]:
+        service = self._service_factory()
+        params: Dict[str, Any] = {
+            "calendarId": calendar_id,
+            "singleEvents": True,
+            "maxResults": SYNC_PAGE_SIZE,
+            "fields": FIELDS["calendar.events.sync"],
+        }
+        if token:
+            params["syncToken"] = token
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            resp = service.events().list(**params, pageToken=page_token).execute()
+            items += resp.get("items") or []
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return items, resp.get("nextSyncToken")
+
+    def _start_sync(self, calendar_id: str) -> None:
+        def _run():
+            try:
+                with lane_scope(BULK):
+                    self.sync(calendar_id)
+            except Exception:
+                logger.exception("calendar cache: background sync of %s failed", calendar_id)
+
+        # parallel reads of one calendar must not start two syncs from the same token
+        with self._threads_lock:
+            thread = self._sync_threads.get(calendar_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=_run, name=f"calendar-sync-{calendar_id}", daemon=True)
+            self._sync_threads[calendar_id] = thread
+            thread.start()
+        self._count("background_syncs")
+
+    def ensure_fresh(self, calendar_id: str) -> bool:
+        """
+        True if the cache can answer reads of this calendar now. Slightly stale data is
+        served while a background sync runs; before the first full sync (or when very
+        stale and the sync fails) it returns False and the caller asks Calendar.
+        """
+        try:
+            calendar_id = self.calendar_key(calendar_id)
+        except Exception:
+            logger.exception("calendar cache: can't resolve %s, using Calendar directly", calendar_id)
+            return False
+        if not self.ready(calendar_id):
+            self._start_sync(calendar_id)
+            return False
+        age = self.age(calendar_id)
+        if age <= self.max_age:
+            return True
+        if age <= self.stale_limit:
+            self._start_sync(calendar_id)
+            return True
+        try:
+            self.sync(calendar_id)
+        except Exception:
+            logger.exception("calendar cache: sync of %s failed, using Calendar directly", calendar_id)
+            return False
+        return True
+
+    # ---- reads ----
+
+    def events_between(
+        self,
+        calendar_id: str,
+        start: datetime,
+        end: datetime,
+        query: Optional[str] = None,
+        max_results: Optional[int] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events overlapping [start, end) ordered by start time, like events.list with
+        timeMin/timeMax, singleEvents and orderBy=startTime; query matches like q=.
+        None when the cache can't answer yet.
+        """
+        if not self.ensure_fresh(calendar_id):
+            self._count("fallbacks")
+            return None
+        calendar_id = self.calendar_key(calendar_id)  # resolved by ensure_fresh
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT e.body FROM event_spans s JOIN events e ON e.rowid = s.id "
+                "WHERE s.end_ts > ? AND s.start_ts < ? AND e.calendar_id = ?",
+                (int(start.timestamp()), int(end.timestamp()) + 1, calendar_id),
+            ).fetchall()
+
+        tz = start.tzinfo if isinstance(start.tzinfo, ZoneInfo) else ZoneInfo(DEFAULT_TZ)
+        words = (query or "").lower().split()
+        hits = []
+        for row in rows:
+            ev = json.loads(row["body"])
+            ev_start, ev_end = event_bounds(ev, tz)
+            # zero-length events count if they start inside the range
+            overlaps = ev_start < end and (ev_end > start or ev_start >= start)
+            if overlaps and _matches(ev, words):
+                hits.append((ev_start, ev))
+        hits.sort(key=lambda h: h[0])
+        self._count("served_local")
+        return [ev for _, ev in hits[:max_results]] if max_results else [ev for _, ev in hits]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            counters = dict(self._counters)
+            calendars = {
+                r["calendar_id"]: {
+                    "events": r["events"],
+                    "age_seconds": round(max(0.0, self._clock() - r["last_sync"]), 1),
+                }
+                for r in self._db.execute(
+                    "SELECT c.calendar_id, c.last_sync, COUNT(e.id) AS events "
+                    "FROM calendars c LEFT JOIN events e ON e.calendar_id = c.calendar_id GROUP BY c.calendar_id"
+                )
+            }
+        return {**counters, "calendars": calendars}
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+_CACHE: Optional[EventCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> Optional[EventCache]:
+    """The process-wide event cache, or None when STELLA_CALENDAR_CACHE is off."""
+    global _CACHE
+    if not CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EventCache()
+    return _CACHE
+
+
+def main(argv: List[str]) -> None:
+    command = argv[0] if argv else "stats"
+    calendar_id = argv[1] if len(argv) > 1 else "primary"
+    cache = EventCache()
+    if command == "sync":
+        print(f"applied {cache.sync(calendar_id)} changes")
+    print(json.dumps(cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
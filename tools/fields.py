@@ -0,0 +1,105 @@
+# tools/fields.py
+# Partial responses: the `fields=` mask for every Google API call the tools make, kept
+# in one table, plus a per-tool count of the response bytes that actually come back.
+#
+# A mask lists exactly what the code reading that response uses. Event cards are
+# projected through EVENT_CARD, which the event masks are built from, so a new card
+# field is requested automatically; tests/test_fields.py checks the other readers
+# against their masks. Calls whose response body is empty (events.delete,
+# messages.delete, messages.batchModify) have no entry.
+
+import contextlib
+import contextvars
+import threading
+from typing import Any, Dict, Iterator, Optional
+
+# Event card key -> Calendar event field (what the calendar tools return per event)
+EVENT_CARD: Dict[str, str] = {
+    "event_id": "id",
+    "summary": "summary",
+    "start": "start",
+    "end": "end",
+    "location": "location",
+    "htmlLink": "htmlLink",
+}
+
+_EVENT = ",".join(EVENT_CARD.values())
+# ...plus what the local event cache reads (series, cancellations, local q= matching)
+_EVENT_CACHED = (
+    f"{_EVENT},status,recurringEventId,recurrence,description,"
+    "attendees(email,displayName),organizer(email,displayName)"
+)
+# users.messages.get as read by tools.gmail._message_summary / create_reply_draft
+_MESSAGE = "id,threadId,labelIds,snippet,internalDate,payload/headers"
+_MESSAGE_LABELS = "id,threadId,labelIds"
+_DRAFT = "id,message(id,threadId)"
+
+FIELDS: Dict[str, str] = {
+    # Calendar
+    "calendar.events.list": f"items({_EVENT}),nextPageToken",
+    "calendar.events.sync": f"items({_EVENT_CACHED}),nextPageToken,nextSyncToken",
+    "calendar.events.insert": _EVENT_CACHED,  # written through to the cache
+    "calendar.events.patch": _EVENT_CACHED,
+    "calendar.calendarList.list": "items(id,summary,primary,selected,hidden),nextPageToken",
+    "calendar.calendarList.get": "id",
+    "calendar.freebusy.query": "calendars(busy(start,end),errors/reason)",
+    # Gmail
+    "gmail.users.getProfile": "historyId",
+    "gmail.messages.list": "messages(id,threadId),nextPageToken",
+    "gmail.messages.get": _MESSAGE,
+    "gmail.messages.modify": _MESSAGE_LABELS,
+    "gmail.messages.trash": _MESSAGE_LABELS,
+    "gmail.drafts.create": _DRAFT,
+    "gmail.drafts.update": _DRAFT,
+    "gmail.drafts.send": _MESSAGE_LABELS,
+    "gmail.history.list": (
+        "history(messagesAdded/message/id,messagesDeleted/message/id,"
+        "labelsAdded(message/id,labelIds),labelsRemoved(message/id,labelIds)),historyId,nextPageToken"
+    ),
+}
+
+
+def event_card(event: Dict[str, Any]) -> Dict[str, Any]:
+    """The per-event dict the calendar tools return (and the frontend's EventCard reads)."""
+    return {key: event.get(field) for key, field in EVENT_CARD.items()}
+
+
+# ---- response bytes per tool ----
+
+_current_tool: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("google_tool", default=None)
+_usage_lock = threading.Lock()
+_usage: Dict[str, Dict[str, int]] = {}
+
+
+@contextlib.contextmanager
+def tool_scope(name: str) -> Iterator[None]:
+    """Attribute Google responses received inside this block (and its copied contexts) to `name`."""
+    token = _current_tool.set(name)
+    try:
+        yield
+    finally:
+        _current_tool.reset(token)
+
+
+def current_tool() -> str:
+    """The tool Google requests made here are attributed to ("<other>" outside any tool)."""
+    return _current_tool.get() or "<other>"
+
+
+def record_response(nbytes: int) -> None:
+    """Called by the HTTP layer once per response (a batch request counts once)."""
+    tool = current_tool()
+    with _usage_lock:
+        usage = _usage.setdefault(tool, {"responses": 0, "bytes": 0})
+        usage["responses"] += 1
+        usage["bytes"] += nbytes
+
+
+def response_stats() -> Dict[str, Dict[str, int]]:
+    with _usage_lock:
+        return {tool: dict(usage) for tool, usage in _usage.items()}
+
+
+def reset_response_stats() -> None:
+    with _usage_lock:
+        _usage.clear()
@@ -0,0 +1,158 @@
+# tools/freebusy.py
+# Free-slot finding behind find_free_slots (tools/calendar.py): one freebusy.query
+# for all the calendars involved, then local interval arithmetic, instead of the
+# model listing events and reasoning over them.
+#
+# Busy intervals from every calendar are merged with a sort-and-sweep (vectorised
+# with NumPy, when installed, for large inputs), then subtracted from the
+# working-hours windows of each day in the viewer's timezone. Times are epoch
+# seconds throughout; intervals are half-open [start, end).
+
+import bisect
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+try:
+    import numpy as np
+except ImportError:  # optional: the pure-Python sweep does the same job
+    np = None
+
+from tools.fields import FIELDS
+
+Interval = Tuple[int, int]
+
+# freebusy.query accepts at most this many calendars per request
+FREEBUSY_MAX_CALENDARS = 50
+# Below this many intervals converting to arrays costs more than the Python sweep saves
+NUMPY_MIN_INTERVALS = int(os.getenv("STELLA_FREEBUSY_NUMPY_MIN", "2000"))
+
+
+def _epoch(value: str) -> int:
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def query_busy(
+    service: Any,
+    calendar_ids: List[str],
+    time_min: datetime,
+    time_max: datetime,
+) -> Tuple[List[Interval], Dict[str, str]]:
+    """
+    Busy intervals of all calendar_ids between time_min and time_max (one freebusy.query
+    per FREEBUSY_MAX_CALENDARS calendars). Returns (unmerged intervals, error by calendar id);
+    a calendar that can't be read is reported rather than failing the rest.
+    """
+    busy: List[Interval] = []
+    errors: Dict[str, str] = {}
+    for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+        chunk = calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+        resp = service.freebusy().query(
+            body={
+                "timeMin": time_min.isoformat(),
+                "timeMax": time_max.isoformat(),
+                "items": [{"id": calendar_id} for calendar_id in chunk],
+            },
+            fields=FIELDS["calendar.freebusy.query"],
+        ).execute()
+        calendars = resp.get("calendars") or {}
+        for calendar_id in chunk:
+            cal = calendars.get(calendar_id)
+            if cal is None:
+                errors[calendar_id] = "notReturned"
+                continue
+            if cal.get("errors"):
+                errors[calendar_id] = ", ".join(e.get("reason") or "error" for e in cal["errors"])
+            busy.extend((_epoch(b["start"]), _epoch(b["end"])) for b in cal.get("busy") or [])
+    return busy, errors
+
+
+def _merge_sweep(intervals: List[Interval]) -> List[Interval]:
+    merged: List[List[int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _merge_numpy(intervals: List[Interval]) -> List[Interval]:
+    arr = np.asarray(intervals, dtype=np.int64)
+    arr = arr[np.argsort(arr[:, 0], kind="stable")]
+    starts = arr[:, 0]
+    reach = np.maximum.accumulate(arr[:, 1])  # furthest end seen so far
+    # a block starts wherever an interval begins after everything before it has ended
+    first = np.flatnonzero(np.concatenate(([True], starts[1:] > reach[:-1])))
+    last = np.append(first[1:] - 1, len(arr) - 1)
+    return list(zip(starts[first].tolist(), reach[last].tolist()))
+
+
+def merge_intervals(intervals: Sequence[Interval]) -> List[Interval]:
+    """Union of intervals as sorted, disjoint ones (touching intervals are joined)."""
+    intervals = [(start, end) for start, end in intervals if end > start]
+    if not intervals:
+        return []
+    if np is not None and len(intervals) >= NUMPY_MIN_INTERVALS:
+        return _merge_numpy(intervals)
+    return _merge_sweep(intervals)
+
+
+def working_windows(
+    first_day: date,
+    last_day: date,
+    tz: ZoneInfo,
+    day_start: time,
+    day_end: time,
+    include_weekends: bool = False,
+) -> List[Interval]:
+    """day_start..day_end on each day from first_day to last_day (inclusive), local to tz."""
+    if day_end <= day_start:
+        raise ValueError("working hours must end after they start")
+    windows: List[Interval] = []
+    day = first_day
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            windows.append((
+                int(datetime.combine(day, day_start, tzinfo=tz).timestamp()),
+                int(datetime.combine(day, day_end, tzinfo=tz).timestamp()),
+            ))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_slots(
+    busy: List[Interval],
+    windows: List[Interval],
+    duration: int,
+    step: int = 0,
+    limit: Optional[int] = None,
+    not_before: Optional[int] = None,
+) -> Tuple[List[Interval], bool]:
+    """
+    Gaps of at least `duration` seconds inside `windows` that `busy` (merged, sorted) doesn't
+    cover, starting no earlier than `not_before`. Slot starts are rounded up to `step` seconds
+    past the window start (0: no rounding). Returns (slots, truncated) with at most `limit` slots.
+    """
+    busy_ends = [end for _, end in busy]
+    slots: List[Interval] = []
+    for window_start, window_end in windows:
+        cursor = window_start if not_before is None else max(window_start, not_before)
+        i = bisect.bisect_right(busy_ends, cursor)  # first busy interval still running
+        while cursor < window_end:
+            if i < len(busy) and busy[i][0] < window_end:
+                gap_end, resume = busy[i]
+                i += 1
+            else:
+                gap_end, resume = window_end, window_end
+            start = cursor
+            if step and (start - window_start) % step:
+                start += step - (start - window_start) % step
+            if gap_end - start >= duration:
+                if limit is not None and len(slots) >= limit:
+                    return slots, True
+                slots.append((start, gap_end))
+            cursor = max(cursor, resume)
+    return slots, False
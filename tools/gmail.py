@@ -2,17 +2,25 @@
 # Auth/service setup is plumbing; the agent shouldn't call it directly.
 # Tools call get_service() internally.
 
-from langchain.tools import tool
-
 import base64
-from typing import Optional, Tuple, List, Dict, Any
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, List, Dict, Any, Iterable, Iterator
 
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from tools.auth import get_creds, SCOPES
+from tools.aio import with_coroutine
+from tools.auth import DEFAULT_ACCOUNT, current_account
+from tools.artifacts import artifact_tool, render_compact
+from tools.fields import FIELDS
+from tools.service import get_service as google_service
 
 
 # -----------------------
@@ -20,30 +28,39 @@ from tools.auth import get_creds, SCOPES
 # -----------------------
 DEFAULT_USER_ID = "me"
 
-_SERVICE_CACHE = {
-    "scopes": None,      # type: Optional[Tuple[str, ...]]
-    "service": None      # type: Optional[object]
-}
+# Headers requested for format="metadata" (enough for EmailCards and replies)
+METADATA_HEADERS = ["From", "To", "Cc", "Subject", "Date", "Message-Id", "Reply-To"]
 
+# Gmail accepts at most 100 calls per batch HTTP request
+BATCH_LIMIT = 100
 
-def get_service():
-    """
-    Return a Gmail API service:
-      service = build("gmail", "v1", credentials=creds)
+# get_messages uses smaller batches (Gmail rate-limits large ones) and runs a few at once
+GET_MESSAGES_BATCH_SIZE = 50
+BATCH_CONCURRENCY = int(os.getenv("STELLA_GMAIL_BATCH_CONCURRENCY", "4"))
 
-    Cached in-process. Uses shared OAuth credentials from tools.auth (same token as Calendar).
-    """
-    scopes_tuple = tuple(SCOPES)
+# messages.batchModify takes at most 1000 ids; messages.list pages hold at most 500
+BATCH_MODIFY_LIMIT = 1000
+LIST_PAGE_SIZE = 500
 
-    if _SERVICE_CACHE["service"] is not None and _SERVICE_CACHE["scopes"] == scopes_tuple:
-        return _SERVICE_CACHE["service"]
+# mark_all_as_read re-lists after a multi-page run, in case paging skipped messages
+# whose labels changed underneath it
+MARK_ALL_MAX_PASSES = 3
 
-    creds = get_creds()
-    service = build("gmail", "v1", credentials=creds)
+# Bulk results list at most this many ids (the LLM only needs a sample)
+RESULT_ID_SAMPLE = 100
+
+_BATCH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_BATCH_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_service():
+    """
+    Return the Gmail API service (gmail v1).
 
-    _SERVICE_CACHE["scopes"] = scopes_tuple
-    _SERVICE_CACHE["service"] = service
-    return service
+    Built once per process on a thread-safe pool of authorized HTTP transports
+    (tools.service). Uses shared OAuth credentials from tools.auth (same token as Calendar).
+    """
+    return google_service("gmail", "v1")
 
 
 # -----------------------
@@ -104,47 +121,379 @@ def _extract_headers(payload: Dict[str, Any]) -> Dict[str, str]:
     return out
 
 
+def _mirror():
+    """
+    The local metadata mirror (tools.mailstore) when STELLA_GMAIL_MIRROR=1, else None.
+    It mirrors the default account only.
+    """
+    if current_account() != DEFAULT_ACCOUNT:
+        return None
+    from tools.mailstore import get_mirror  # imported here: mailstore builds on this module
+    return get_mirror()
+
+
+def _mirror_changed() -> None:
+    """Called after our own writes so the next mirrored read syncs first."""
+    mirror = _mirror()
+    if mirror is not None:
+        mirror.invalidate()
+
+
+def _message_summary(resp: Dict[str, Any]) -> Dict[str, Any]:
+    """Key fields of a users.messages.get response (shared by get_message and batch fetches)."""
+    headers = _extract_headers(resp.get("payload", {}))
+    return {
+        "message_id": resp.get("id"),
+        "thread_id": resp.get("threadId"),
+        "label_ids": resp.get("labelIds", []),
+        "snippet": resp.get("snippet"),
+        "internalDate": resp.get("internalDate"),
+        "headers": {
+            "from": headers.get("from"),
+            "to": headers.get("to"),
+            "cc": headers.get("cc"),
+            "subject": headers.get("subject"),
+            "date": headers.get("date"),
+            "message_id": headers.get("message-id"),
+            "reply_to": headers.get("reply-to"),
+        },
+    }
+
+
+def _batch_executor() -> ThreadPoolExecutor:
+    """Shared pool for batch requests; bounds how many are in flight across all tool calls."""
+    global _BATCH_EXECUTOR
+    if _BATCH_EXECUTOR is None:
+        with _BATCH_EXECUTOR_LOCK:
+            if _BATCH_EXECUTOR is None:
+                _BATCH_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=BATCH_CONCURRENCY,
+                    thread_name_prefix="gmail-batch",
+                )
+    return _BATCH_EXECUTOR
+
+
+def _batch_error(exception: Exception) -> str:
+    if isinstance(exception, HttpError):
+        return f"{exception.status_code} {exception.reason}"
+    return str(exception)
+
+
+def _batch_get_messages(
+    service: Any,
+    message_ids: List[str],
+    format: str = "metadata",
+    user_id: str = DEFAULT_USER_ID,
+    batch_size: int = BATCH_LIMIT,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+    """
+    Fetch messages with Gmail batch HTTP requests (batch_size ids each, at most BATCH_LIMIT).
+    Batches run concurrently on the shared batch executor when there is more than one.
+    Returns (summaries by id, error message by id); one failed message doesn't fail the rest.
+    """
+    ids = list(dict.fromkeys(message_ids))  # batch request ids must be unique
+    size = max(1, min(batch_size, BATCH_LIMIT))
+    chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+
+    def _fetch(chunk: List[str]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        failed: Dict[str, str] = {}
+
+        def _collect(request_id, response, exception):
+            if exception is not None:
+                failed[request_id] = _batch_error(exception)
+            else:
+                found[request_id] = _message_summary(response)
+
+        batch = service.new_batch_http_request(callback=_collect)
+        for message_id in chunk:
+            batch.add(
+                service.users().messages().get(
+                    userId=user_id, id=message_id, format=format, metadataHeaders=METADATA_HEADERS,
+                    fields=FIELDS["gmail.messages.get"],
+                ),
+                request_id=message_id,
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            # the whole batch request failed: report it against every id it carried
+            for message_id in chunk:
+                if message_id not in found:
+                    failed[message_id] = _batch_error(e)
+        return found, failed
+
+    if len(chunks) == 1:
+        outcomes = [_fetch(chunks[0])]
+    else:
+        # each chunk runs in a copy of the caller's context so its responses count against the calling tool
+        executor = _batch_executor()
+        futures = [executor.submit(contextvars.copy_context().run, _fetch, chunk) for chunk in chunks]
+        outcomes = [future.result() for future in futures]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    errors: Dict[str, str] = {}
+    for found, failed in outcomes:
+        results.update(found)
+        errors.update(failed)
+    return results, errors
+
+
+def _chunked(ids: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk: List[str] = []
+    for message_id in ids:
+        chunk.append(message_id)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_message_ids(
+    service: Any,
+    user_id: str,
+    label_ids: Optional[List[str]],
+    query: Optional[str],
+    seen: set,
+    progress: Dict[str, int],
+    limit: Optional[int] = None,
+) -> Iterator[str]:
+    """
+    Page through messages.list lazily, yielding ids not in `seen` (and adding them),
+    up to `limit`. Counts pages in progress["pages"] / progress["pass_pages"].
+    """
+    page_token = None
+    yielded = 0
+    progress["pass_pages"] = 0
+    while True:
+        resp = (
+            service.users()
+            .messages()
+            .list(userId=user_id, q=query or None, labelIds=label_ids or None,
+                  maxResults=LIST_PAGE_SIZE, pageToken=page_token, fields=FIELDS["gmail.messages.list"])
+            .execute()
+        )
+        progress["pages"] += 1
+        progress["pass_pages"] += 1
+        for m in resp.get("messages") or []:
+            if m["id"] in seen:
+                continue
+            seen.add(m["id"])
+            yield m["id"]
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def _batch_modify_chunks(
+    service: Any,
+    chunks: Iterable[List[str]],
+    add_label_ids: Optional[List[str]],
+    remove_label_ids: Optional[List[str]],
+    user_id: str,
+) -> Dict[str, Any]:
+    """
+    Send one batchModify per chunk on the batch executor. Chunks are pipelined: the
+    next one is produced (e.g. the next list page fetched) while earlier ones are in
+    flight, with at most BATCH_CONCURRENCY outstanding. The first failure is raised
+    once in-flight chunks have settled.
+    """
+    def _send(index: int, ids: List[str]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        service.users().messages().batchModify(
+            userId=user_id,
+            body={"ids": ids, "addLabelIds": add_label_ids or [], "removeLabelIds": remove_label_ids or []},
+        ).execute()
+        return {"chunk": index, "ids": len(ids), "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    executor = _batch_executor()
+    pending = deque()
+    timings: List[Dict[str, Any]] = []
+    count = 0
+    try:
+        for index, ids in enumerate(chunks):
+            while len(pending) >= BATCH_CONCURRENCY:
+                timings.append(pending.popleft().result())
+            pending.append(executor.submit(contextvars.copy_context().run, _send, index, ids))
+            count += len(ids)
+        while pending:
+            timings.append(pending.popleft().result())
+    finally:
+        for future in pending:
+            # let in-flight chunks finish before the error propagates
+            future.exception()
+    return {"count": count, "chunks": timings}
+
+
+def render_bulk_result(result: Dict[str, Any]) -> str:
+    """LLM view of a bulk label change: totals and slowest chunk instead of every chunk timing."""
+    chunks = result.get("chunks") or []
+    summary = {k: v for k, v in result.items() if k != "chunks"}
+    if chunks:
+        summary["chunks"] = len(chunks)
+        summary["slowest_chunk_ms"] = max(c["ms"] for c in chunks)
+    return render_compact(summary)
+
+
+def render_message(result: Dict[str, Any]) -> str:
+    """Compact LLM view of one message: ids/labels line, the useful headers, then the snippet."""
+    headers = result.get("headers") or {}
+    lines = [
+        f"message_id={result.get('message_id')} thread_id={result.get('thread_id')} "
+        f"labels={','.join(result.get('label_ids') or [])}"
+    ]
+    for key in ("from", "to", "cc", "reply_to", "subject", "date"):
+        if headers.get(key):
+            lines.append(f"{key}: {headers[key]}")
+    if result.get("snippet"):
+        lines.append(f"snippet: {result['snippet']}")
+    return "\n".join(lines)
+
+
+def render_message_list(result: Dict[str, Any]) -> str:
+    """
+    LLM view of list_messages. Hydrated lists get one line per message
+    (id | from | subject | date | snippet) instead of the JSON dump.
+    """
+    messages = result.get("messages") or []
+    if not any("headers" in m for m in messages):
+        return render_compact(result)
+
+    header = {k: v for k, v in result.items() if k != "messages"}
+    lines = [render_compact(header)]
+    for m in messages:
+        if m.get("error"):
+            lines.append(f"- {m.get('message_id')} | error: {m['error']}")
+            continue
+        h = m.get("headers") or {}
+        snippet = (m.get("snippet") or "")[:100]
+        unread = " [unread]" if "UNREAD" in (m.get("label_ids") or []) else ""
+        lines.append(
+            f"- {m.get('message_id')}{unread} | {h.get('from') or ''} | {h.get('subject') or '(no subject)'} "
+            f"| {h.get('date') or ''} | {snippet}"
+        )
+    return "\n".join(lines)
+
+
 # -----------------------
 # TOOLS
 # -----------------------
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "list_messages",
+    render=render_message_list,
     description=(
         "List Gmail messages. query uses Gmail search syntax (same as Gmail search box). "
-        "Optionally filter by label_ids (e.g. ['INBOX','UNREAD']). Returns message ids + thread ids."
+        "Optionally filter by label_ids (e.g. ['INBOX','UNREAD']). Returns message ids + thread ids. "
+        "Set hydrate=true to also get from/subject/date/snippet for every message in the same call "
+        "(shown to the user as email cards) instead of calling get_message per id."
     ),
 )
 def list_messages(
     query: Optional[str] = None,
     label_ids: Optional[List[str]] = None,
     max_results: int = 20,
+    hydrate: bool = False,
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
+    mirror = _mirror() if user_id == DEFAULT_USER_ID else None
+    local = mirror.list_messages(query, label_ids, max_results) if mirror is not None else None
+    if local is not None:
+        summaries, more = local
+        return {
+            "query": query,
+            "label_ids": label_ids,
+            "count": len(summaries),
+            "messages": summaries if hydrate else [
+                {"message_id": m["message_id"], "thread_id": m["thread_id"]} for m in summaries
+            ],
+            "nextPageToken": None,
+            "more": more,
+            "source": "mirror",
+        }
+
     service = get_service()
 
     resp = (
         service.users()
         .messages()
-        .list(userId=user_id, q=query or None, labelIds=label_ids or None, maxResults=max_results)
+        .list(userId=user_id, q=query or None, labelIds=label_ids or None, maxResults=max_results,
+              fields=FIELDS["gmail.messages.list"])
         .execute()
     )
 
     msgs = resp.get("messages", []) or []
+    messages = [{"message_id": m.get("id"), "thread_id": m.get("threadId")} for m in msgs]
+
+    if hydrate and messages:
+        # One batch HTTP request per 100 ids instead of one get_message round trip each
+        found, errors = _batch_get_messages(service, [m["message_id"] for m in messages], user_id=user_id)
+        messages = [
+            found.get(m["message_id"]) or {**m, "error": errors.get(m["message_id"], "not returned")}
+            for m in messages
+        ]
+
     return {
         "query": query,
         "label_ids": label_ids,
         "count": len(msgs),
-        "messages": [{"message_id": m.get("id"), "thread_id": m.get("threadId")} for m in msgs],
+        "messages": messages,
         "nextPageToken": resp.get("nextPageToken"),
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
+    "search_local_mail",
+    render=render_message_list,
+    description=(
+        "Instant full-text search over the locally synced mailbox (subject, from, to, snippet), best "
+        "matches first. Words are ANDed; use \"quoted phrases\", from:/to:/subject: for one field, "
+        "-word to exclude, word* for a prefix, and is:unread / in:inbox style label filters. "
+        "Returns message ids with from/subject/date/snippet. Cheap enough to retry with other wording."
+    ),
+)
+def search_local_mail(
+    query: str,
+    label_ids: Optional[List[str]] = None,
+    max_results: int = 20,
+) -> Dict[str, Any]:
+    mirror = _mirror()
+    started = time.perf_counter()
+    try:
+        hits = mirror.search(query, label_ids, max_results) if mirror is not None else None
+    except ValueError:
+        return {"query": query, "count": 0, "messages": [], "error": "Nothing to search for in that query."}
+    if hits is None:
+        return {
+            "query": query,
+            "count": 0,
+            "messages": [],
+            "error": "Local mail index isn't available yet; use list_messages with a Gmail query instead.",
+        }
+
+    return {
+        "query": query,
+        "label_ids": label_ids,
+        "count": len(hits),
+        "messages": hits,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        "source": "mirror",
+    }
+
+
+@with_coroutine
+@artifact_tool(
     "get_message",
+    render=render_message,
     description=(
-        "Get a Gmail message by id. format can be 'metadata' (fast) or 'full' (includes body structure). "
-        "Returns key headers + snippet."
+        "Get a Gmail message by id. Returns key headers + snippet; the message body is not included, "
+        "whatever the format ('metadata', the default and fastest, or 'full')."
     ),
 )
 def get_message(
@@ -152,6 +501,11 @@ def get_message(
     format: str = "metadata",
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
+    mirror = _mirror() if format == "metadata" and user_id == DEFAULT_USER_ID else None
+    local = mirror.get_message(message_id) if mirror is not None else None
+    if local is not None:
+        return local
+
     service = get_service()
 
     resp = (
@@ -161,33 +515,49 @@ def get_message(
             userId=user_id,
             id=message_id,
             format=format,
-            metadataHeaders=["From", "To", "Cc", "Subject", "Date", "Message-Id", "Reply-To"],
+            metadataHeaders=METADATA_HEADERS,
+            fields=FIELDS["gmail.messages.get"],
         )
         .execute()
     )
 
-    payload = resp.get("payload", {})
-    headers = _extract_headers(payload)
+    return _message_summary(resp)
+
+
+@with_coroutine
+@artifact_tool(
+    "get_messages",
+    render=render_message_list,
+    description=(
+        "Get many Gmail messages by id in one call (batched). format can be 'metadata' (fast) or 'full'. "
+        "Returns key headers + snippet per message (no body), in the order given; ids that could not be fetched "
+        "are listed under errors. Prefer this over several get_message calls."
+    ),
+)
+def get_messages(
+    message_ids: List[str],
+    format: str = "metadata",
+    user_id: str = DEFAULT_USER_ID,
+) -> Dict[str, Any]:
+    service = get_service()
+
+    ids = list(dict.fromkeys(message_ids))
+    found, errors = _batch_get_messages(
+        service, ids, format=format, user_id=user_id, batch_size=GET_MESSAGES_BATCH_SIZE
+    )
 
     return {
-        "message_id": resp.get("id"),
-        "thread_id": resp.get("threadId"),
-        "label_ids": resp.get("labelIds", []),
-        "snippet": resp.get("snippet"),
-        "internalDate": resp.get("internalDate"),
-        "headers": {
-            "from": headers.get("from"),
-            "to": headers.get("to"),
-            "cc": headers.get("cc"),
-            "subject": headers.get("subject"),
-            "date": headers.get("date"),
-            "message_id": headers.get("message-id"),
-            "reply_to": headers.get("reply-to"),
-        },
+        "requested": len(ids),
+        "count": len(found),
+        "messages": [found[i] for i in ids if i in found],
+        "errors": [
+            {"message_id": i, "error": errors.get(i, "not returned")} for i in ids if i not in found
+        ],
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "trash_message",
     description="Move a message to TRASH (safe, reversible). Prefer this over permanent delete.",
 )
@@ -196,7 +566,10 @@ def trash_message(
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
     service = get_service()
-    resp = service.users().messages().trash(userId=user_id, id=message_id).execute()
+    resp = service.users().messages().trash(
+        userId=user_id, id=message_id, fields=FIELDS["gmail.messages.trash"]
+    ).execute()
+    _mirror_changed()
     return {
         "trashed": True,
         "message_id": resp.get("id"),
@@ -205,7 +578,8 @@ def trash_message(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "delete_message_permanently",
     description=(
         "Permanently delete a message immediately (NOT reversible). "
@@ -218,14 +592,17 @@ def delete_message_permanently(
 ) -> Dict[str, Any]:
     service = get_service()
     service.users().messages().delete(userId=user_id, id=message_id).execute()
+    _mirror_changed()
     return {"deleted_permanently": True, "message_id": message_id}
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "batch_modify_labels",
+    render=render_bulk_result,
     description=(
-        "Modify labels for many messages at once using batchModify. "
-        "Example: remove INBOX, add ARCHIVE label, etc."
+        "Modify labels for many messages at once using batchModify (any number of ids; "
+        "sent in chunks of 1000). Example: remove INBOX, add ARCHIVE label, etc."
     ),
 )
 def batch_modify_labels(
@@ -235,21 +612,26 @@ def batch_modify_labels(
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
     service = get_service()
-    body = {
-        "ids": message_ids,
-        "addLabelIds": add_label_ids or [],
-        "removeLabelIds": remove_label_ids or [],
-    }
-    service.users().messages().batchModify(userId=user_id, body=body).execute()
+    started = time.perf_counter()
+
+    ids = list(dict.fromkeys(message_ids))
+    report = _batch_modify_chunks(
+        service, _chunked(ids, BATCH_MODIFY_LIMIT), add_label_ids, remove_label_ids, user_id
+    )
+
+    _mirror_changed()
     return {
         "updated": True,
-        "count": len(message_ids),
+        "count": report["count"],
         "add_label_ids": add_label_ids or [],
         "remove_label_ids": remove_label_ids or [],
+        "chunks": report["chunks"],
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "mark_as_read",
     description="Mark a single Gmail message as read by removing the UNREAD label.",
 )
@@ -261,9 +643,11 @@ def mark_as_read(
     resp = (
         service.users()
         .messages()
-        .modify(userId=user_id, id=message_id, body={"removeLabelIds": ["UNREAD"]})
+        .modify(userId=user_id, id=message_id, body={"removeLabelIds": ["UNREAD"]},
+                fields=FIELDS["gmail.messages.modify"])
         .execute()
     )
+    _mirror_changed()
     return {
         "marked_read": True,
         "message_id": resp.get("id"),
@@ -272,7 +656,8 @@ def mark_as_read(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "mark_as_unread",
     description="Mark a single Gmail message as unread by adding the UNREAD label.",
 )
@@ -284,9 +669,11 @@ def mark_as_unread(
     resp = (
         service.users()
         .messages()
-        .modify(userId=user_id, id=message_id, body={"addLabelIds": ["UNREAD"]})
+        .modify(userId=user_id, id=message_id, body={"addLabelIds": ["UNREAD"]},
+                fields=FIELDS["gmail.messages.modify"])
         .execute()
     )
+    _mirror_changed()
     return {
         "marked_unread": True,
         "message_id": resp.get("id"),
@@ -295,49 +682,76 @@ def mark_as_unread(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "mark_all_as_read",
+    render=render_bulk_result,
     description=(
-        "Mark all unread messages in a label as read using a single batchModify call. "
+        "Mark all unread messages in a label as read. Pages through every matching message "
+        "(no 500 limit) and removes UNREAD in batchModify chunks of 1000. "
         "Defaults to INBOX. Provide label_ids to target a different label, or query for "
-        "Gmail search syntax filtering. Processes up to 500 messages (one API page)."
+        "Gmail search syntax filtering. max_results caps how many are marked (default: all)."
     ),
 )
 def mark_all_as_read(
     label_ids: Optional[List[str]] = None,
     query: Optional[str] = None,
-    max_results: int = 500,
+    max_results: Optional[int] = None,
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
     service = get_service()
+    started = time.perf_counter()
 
     # Always include UNREAD so we only fetch messages that actually need changing
     effective_labels = list(label_ids or ["INBOX"])
     if "UNREAD" not in effective_labels:
         effective_labels.append("UNREAD")
 
-    resp = (
-        service.users()
-        .messages()
-        .list(userId=user_id, q=query or None, labelIds=effective_labels, maxResults=max_results)
-        .execute()
-    )
-
-    msgs = resp.get("messages") or []
-    if not msgs:
-        return {"marked_read": True, "count": 0, "message_ids": []}
-
-    message_ids = [m["id"] for m in msgs]
-
-    service.users().messages().batchModify(
-        userId=user_id,
-        body={"ids": message_ids, "removeLabelIds": ["UNREAD"]},
-    ).execute()
+    seen: set = set()
+    progress = {"pages": 0, "pass_pages": 0}
+    sample: List[str] = []
+    chunks: List[Dict[str, Any]] = []
+    total = 0
+    passes = 0
+
+    def _sampled(ids: Iterator[str]) -> Iterator[str]:
+        for message_id in ids:
+            if len(sample) < RESULT_ID_SAMPLE:
+                sample.append(message_id)
+            yield message_id
+
+    while passes < MARK_ALL_MAX_PASSES:
+        remaining = None if max_results is None else max_results - total
+        if remaining is not None and remaining <= 0:
+            break
+        passes += 1
+        ids = _iter_message_ids(service, user_id, effective_labels, query, seen, progress, limit=remaining)
+        report = _batch_modify_chunks(
+            service, _chunked(_sampled(ids), BATCH_MODIFY_LIMIT), None, ["UNREAD"], user_id
+        )
+        total += report["count"]
+        chunks += [{**c, "chunk": len(chunks) + i} for i, c in enumerate(report["chunks"])]
+        # A single page can't have skipped anything; otherwise re-list once more
+        if report["count"] == 0 or progress["pass_pages"] <= 1:
+            break
 
-    return {"marked_read": True, "count": len(message_ids), "message_ids": message_ids}
+    result = {
+        "marked_read": True,
+        "count": total,
+        "message_ids": sample,
+        "pages": progress["pages"],
+        "passes": passes,
+        "chunks": chunks,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if total > len(sample):
+        result["message_ids_truncated"] = True
+    _mirror_changed()
+    return result
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "create_draft",
     description="Create a Gmail draft. Provide to/subject/body. Returns draft_id and message_id.",
 )
@@ -362,9 +776,12 @@ def create_draft(
     )
 
     draft_body = {"message": {"raw": raw}}
-    created = service.users().drafts().create(userId=user_id, body=draft_body).execute()
+    created = service.users().drafts().create(
+        userId=user_id, body=draft_body, fields=FIELDS["gmail.drafts.create"]
+    ).execute()
 
     msg = created.get("message", {}) or {}
+    _mirror_changed()
     return {
         "draft_id": created.get("id"),
         "message_id": msg.get("id"),
@@ -372,7 +789,8 @@ def create_draft(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "update_draft",
     description="Update an existing draft (replaces the draft content). Returns updated draft_id/message_id.",
 )
@@ -398,9 +816,12 @@ def update_draft(
     )
 
     body = {"id": draft_id, "message": {"raw": raw}}
-    updated = service.users().drafts().update(userId=user_id, id=draft_id, body=body).execute()
+    updated = service.users().drafts().update(
+        userId=user_id, id=draft_id, body=body, fields=FIELDS["gmail.drafts.update"]
+    ).execute()
 
     msg = updated.get("message", {}) or {}
+    _mirror_changed()
     return {
         "draft_id": updated.get("id"),
         "message_id": msg.get("id"),
@@ -408,7 +829,8 @@ def update_draft(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "send_draft",
     description="Send an existing draft by draft_id. Returns sent message_id + thread_id.",
 )
@@ -417,7 +839,10 @@ def send_draft(
     user_id: str = DEFAULT_USER_ID,
 ) -> Dict[str, Any]:
     service = get_service()
-    sent = service.users().drafts().send(userId=user_id, body={"id": draft_id}).execute()
+    sent = service.users().drafts().send(
+        userId=user_id, body={"id": draft_id}, fields=FIELDS["gmail.drafts.send"]
+    ).execute()
+    _mirror_changed()
     return {
         "sent": True,
         "message_id": sent.get("id"),
@@ -426,7 +851,8 @@ def send_draft(
     }
 
 
-@tool(
+@with_coroutine
+@artifact_tool(
     "create_reply_draft",
     description=(
         "Create a reply draft to an existing message_id. "
@@ -445,6 +871,7 @@ def create_reply_draft(
         id=original_message_id,
         format="metadata",
         metadataHeaders=["From", "Reply-To", "To", "Cc", "Subject", "Message-Id", "References"],
+        fields=FIELDS["gmail.messages.get"],
     ).execute()
 
     payload = original.get("payload", {})
@@ -478,9 +905,12 @@ def create_reply_draft(
         }
     }
 
-    created = service.users().drafts().create(userId=user_id, body=draft_body).execute()
+    created = service.users().drafts().create(
+        userId=user_id, body=draft_body, fields=FIELDS["gmail.drafts.create"]
+    ).execute()
     msg = created.get("message", {}) or {}
 
+    _mirror_changed()
     return {
         "draft_id": created.get("id"),
         "message_id": msg.get("id"),
@@ -0,0 +1,785 @@
+# tools/mailstore.py
+# Local SQLite mirror of Gmail message metadata (opt-in: STELLA_GMAIL_MIRROR=1).
+#
+# Filled once by a paginated backfill (messages.list + batched metadata gets), then
+# kept current with users.history.list from the stored historyId. list_messages and
+# get_message serve from it when it's fresh, so repeat inbox questions are a local
+# query instead of a Gmail round trip per call.
+#
+# An FTS5 index over subject/from/to/snippet (kept in step with `messages` by
+# triggers) backs search_local_mail: BM25-ranked free-text search in a few ms.
+#
+#   python -m tools.mailstore backfill|sync|stats
+#   python -m tools.mailstore search "quarterly invoice"
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from tools import retry
+from tools.fields import FIELDS, tool_scope
+from tools.quota import BULK, lane_scope
+from tools.gmail import DEFAULT_USER_ID, GET_MESSAGES_BATCH_SIZE, LIST_PAGE_SIZE, _batch_get_messages, get_service
+
+logger = logging.getLogger(__name__)
+
+MIRROR_ENABLED = os.getenv("STELLA_GMAIL_MIRROR", "0") == "1"
+MIRROR_PATH = os.getenv("STELLA_GMAIL_MIRROR_PATH", "gmail_mirror.db")
+# Reads older than this run an incremental sync first (one history.list call)
+MIRROR_MAX_AGE = float(os.getenv("STELLA_GMAIL_MIRROR_MAX_AGE", "30"))
+# Cap for the initial backfill (0 = whole mailbox)
+BACKFILL_MAX = int(os.getenv("STELLA_GMAIL_MIRROR_BACKFILL_MAX", "0"))
+# A backfill that left messages unfetched after transient errors is resumed (those ids
+# only) after BACKFILL_RETRY_BASE seconds, doubling up to BACKFILL_RETRY_CAP; after
+# BACKFILL_MAX_ATTEMPTS runs the remaining ids are given up on like permanent failures
+BACKFILL_RETRY_BASE = float(os.getenv("STELLA_GMAIL_MIRROR_RETRY_BASE", "30"))
+BACKFILL_RETRY_CAP = 3600.0
+BACKFILL_MAX_ATTEMPTS = 5
+
+# Gmail search terms the mirror can answer, as (label, present)
+_QUERY_TERMS = {
+    "is:unread": ("UNREAD", True),
+    "is:read": ("UNREAD", False),
+    "is:starred": ("STARRED", True),
+    "is:important": ("IMPORTANT", True),
+    "in:inbox": ("INBOX", True),
+    "in:sent": ("SENT", True),
+    "in:drafts": ("DRAFT", True),
+    "in:trash": ("TRASH", True),
+    "in:spam": ("SPAM", True),
+    "category:primary": ("CATEGORY_PERSONAL", True),
+    "category:social": ("CATEGORY_SOCIAL", True),
+    "category:promotions": ("CATEGORY_PROMOTIONS", True),
+    "category:updates": ("CATEGORY_UPDATES", True),
+    "category:forums": ("CATEGORY_FORUMS", True),
+}
+
+# Like Gmail, listings skip these unless asked for explicitly
+_HIDDEN_LABELS = ("SPAM", "TRASH")
+
+# Bump when the tables change; an older database is dropped and backfilled again
+SCHEMA_VERSION = 2
+
+# rowid = internal date (ms) << 20 | id hash, so rowid order is date order and the
+# search index can find the newest matches without touching `messages`. Two messages
+# with the same date and hash get consecutive rowids (see MailMirror._rowid).
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    label_ids TEXT NOT NULL DEFAULT '[]',
+    label_terms TEXT NOT NULL DEFAULT '',
+    from_addr TEXT,
+    to_addr TEXT,
+    cc TEXT,
+    subject TEXT,
+    date TEXT,
+    message_id_header TEXT,
+    reply_to TEXT,
+    snippet TEXT,
+    internal_date INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (internal_date DESC);
+
+CREATE TABLE IF NOT EXISTS message_labels (
+    label_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    internal_date INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (label_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS labels_by_date ON message_labels (label_id, internal_date DESC);
+CREATE INDEX IF NOT EXISTS labels_by_message ON message_labels (message_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# External-content FTS5 table: stores only the index, rows live in `messages`.
+# label_terms (labels as single tokens) lets label filters run inside the index.
+# prefix='2 3' makes short prefixes ("inv*") index lookups too.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, from_addr, to_addr, snippet, label_terms,
+    content='messages', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, subject, from_addr, to_addr, snippet, label_terms)
+    VALUES (new.rowid, new.subject, new.from_addr, new.to_addr, new.snippet, new.label_terms);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, from_addr, to_addr, snippet, label_terms)
+    VALUES ('delete', old.rowid, old.subject, old.from_addr, old.to_addr, old.snippet, old.label_terms);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update
+AFTER UPDATE OF subject, from_addr, to_addr, snippet, label_terms ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, from_addr, to_addr, snippet, label_terms)
+    VALUES ('delete', old.rowid, old.subject, old.from_addr, old.to_addr, old.snippet, old.label_terms);
+    INSERT INTO messages_fts (rowid, subject, from_addr, to_addr, snippet, label_terms)
+    VALUES (new.rowid, new.subject, new.from_addr, new.to_addr, new.snippet, new.label_terms);
+END;
+"""
+
+# BM25 column weights (subject, from, to, snippet, labels): a hit in the subject or
+# sender says more about the message than one in the snippet; labels only filter
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0, 0.0)
+_TEXT_COLUMNS = "{subject from_addr to_addr snippet}"
+
+# BM25 is scored over at most this many of the newest matches, which keeps a search
+# for a word in half the mailbox as fast as one for a rare word
+SEARCH_RANK_WINDOW = int(os.getenv("STELLA_GMAIL_SEARCH_WINDOW", "2000"))
+
+# search_local_mail field operators -> FTS5 columns
+_SEARCH_FIELDS = {"subject": "subject", "from": "from_addr", "to": "to_addr"}
+_SEARCH_TERM = re.compile(r'(-?)(?:(\w+):)?("[^"]*"?|\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def parse_query(query: Optional[str]) -> Optional[Tuple[List[str], List[str]]]:
+    """
+    (labels required, labels excluded) for a Gmail query made only of terms the mirror
+    understands (is:unread, in:inbox, category:social, ...), else None.
+    """
+    required: List[str] = []
+    excluded: List[str] = []
+    for term in (query or "").lower().split():
+        negated = term.startswith("-")
+        label_present = _QUERY_TERMS.get(term.lstrip("-"))
+        if label_present is None:
+            return None
+        label, present = label_present
+        (excluded if present == negated else required).append(label)
+    return required, excluded
+
+
+def _doc_key(internal_date: int, message_id: str) -> int:
+    return (internal_date << 20) | (zlib.crc32(message_id.encode()) & 0xFFFFF)
+
+
+def _retryable_error(error: str) -> bool:
+    """A batch part error ("<status> <reason>") worth fetching again."""
+    status, _, reason = error.partition(" ")
+    if status == "403":
+        return "rate limit" in reason.lower()
+    return status == "429" or (status.isdigit() and int(status) in retry.SERVER_ERRORS)
+
+
+def _label_term(label: str) -> str:
+    """A label as one FTS token: CATEGORY_SOCIAL -> CATEGORYSOCIAL."""
+    return re.sub(r"[^0-9A-Za-z]", "", label)
+
+
+def search_expression(text_expr: str, required: Iterable[str] = (), excluded: Iterable[str] = ()) -> str:
+    """Add label filters (as label_terms terms) to a parse_search text expression."""
+    parts = [f"({text_expr})"] + [f'label_terms : "{_label_term(l)}"' for l in required]
+    expr = " AND ".join(parts)
+    excluded = [f'label_terms : "{_label_term(l)}"' for l in excluded]
+    if excluded:
+        expr = f"({expr}) NOT ({' OR '.join(excluded)})"
+    return expr
+
+
+def parse_search(query: Optional[str]) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    (FTS5 MATCH expression for the text, labels required, labels excluded) for a
+    search_local_mail query, or None if it has nothing to search for.
+
+    Words are ANDed (word* matches a prefix); "quoted text" is a phrase; from:/to:/subject:
+    restrict a term to one field; -term excludes; is:/in:/category: terms filter labels
+    like parse_query.
+    """
+    positive: List[str] = []
+    negative: List[str] = []
+    required: List[str] = []
+    excluded: List[str] = []
+    for negated, field, text in _SEARCH_TERM.findall(query or ""):
+        label_present = _QUERY_TERMS.get(f"{field}:{text}".lower()) if field else None
+        if label_present is not None:
+            label, present = label_present
+            (excluded if present == bool(negated) else required).append(label)
+            continue
+        column = _SEARCH_FIELDS.get(field.lower())
+        if field and column is None:
+            text = f"{field} {text}"  # "re:budget" etc. are just words
+        words = _WORD.findall(text)
+        if not words:
+            continue
+        if text.startswith('"'):
+            expr = '"' + " ".join(words) + '"'
+        else:
+            # whole words, as in Gmail; a trailing * asks for a prefix match ("inv*")
+            expr = " AND ".join(f'"{w}"' for w in words)
+            if text.endswith("*"):
+                expr += "*"
+        expr = f"{column or _TEXT_COLUMNS} : ({expr})"
+        (negative if negated else positive).append(f"({expr})")
+    if not positive:
+        return None
+    expr = " AND ".join(positive)
+    if negative:
+        expr = f"({expr}) NOT ({' OR '.join(negative)})"
+    return expr, required, excluded
+
+
+def _row_to_summary(row: sqlite3.Row) -> Dict[str, Any]:
+    """Same shape as tools.gmail._message_summary."""
+    return {
+        "message_id": row["id"],
+        "thread_id": row["thread_id"],
+        "label_ids": json.loads(row["label_ids"]),
+        "snippet": row["snippet"],
+        "internalDate": str(row["internal_date"]),
+        "headers": {
+            "from": row["from_addr"],
+            "to": row["to_addr"],
+            "cc": row["cc"],
+            "subject": row["subject"],
+            "date": row["date"],
+            "message_id": row["message_id_header"],
+            "reply_to": row["reply_to"],
+        },
+    }
+
+
+class MailMirror:
+    def __init__(
+        self,
+        path: str = MIRROR_PATH,
+        service_factory: Callable[[], Any] = get_service,
+        user_id: str = DEFAULT_USER_ID,
+        max_age: float = MIRROR_MAX_AGE,
+        backfill_max: int = BACKFILL_MAX,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.user_id = user_id
+        self.max_age = max_age
+        self.backfill_max = backfill_max
+        self._service_factory = service_factory
+        self._clock = clock
+
+        # one connection shared by all threads, serialized by _db_lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._db.executescript(_SCHEMA)
+        self.fts = self._init_fts()
+        self._db_lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._backfill_thread: Optional[threading.Thread] = None
+        self._counters = {
+            "served_local": 0,
+            "fallbacks": 0,
+            "syncs": 0,
+            "history_records": 0,
+            "backfills": 0,
+            "messages_fetched": 0,
+            "fetch_retries": 0,
+            "fetch_missing": 0,
+            "searches": 0,
+        }
+
+    def _migrate(self) -> None:
+        """Drop tables written by an older SCHEMA_VERSION (the mirror is a cache: it backfills again)."""
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version == SCHEMA_VERSION:
+            return
+        tables = [r[0] for r in self._db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN "
+            "('messages', 'message_labels', 'meta', 'messages_fts')"
+        )]
+        if tables:
+            logger.info("gmail mirror: schema %s -> %s, rebuilding", version, SCHEMA_VERSION)
+        for table in tables:
+            self._db.execute(f"DROP TABLE IF EXISTS {table}")
+        self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.commit()
+
+    def _init_fts(self) -> bool:
+        """Create the search index (filling it from existing rows once). False if SQLite lacks FTS5."""
+        existed = self._db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone() is not None
+        try:
+            self._db.executescript(_FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning("gmail mirror: full-text search unavailable (%s)", e)
+            return False
+        # INSERT OR REPLACE must fire the delete trigger for the row it replaces
+        self._db.execute("PRAGMA recursive_triggers = ON")
+        with self._db:
+            if not existed:
+                self._db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            self._db.execute(
+                "INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', ?)",
+                (f"bm25({', '.join(map(str, FTS_WEIGHTS))})",),
+            )
+        return True
+
+    # ---- meta ----
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, **values: Any) -> None:
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(k, None if v is None else str(v)) for k, v in values.items()],
+            )
+
+    @property
+    def history_id(self) -> Optional[str]:
+        return self._get_meta("history_id")
+
+    @property
+    def ready(self) -> bool:
+        """True once a backfill has completed."""
+        return self._get_meta("backfill_complete") == "1"
+
+    def age(self) -> Optional[float]:
+        last = self._get_meta("last_sync")
+        return None if last is None else max(0.0, self._clock() - float(last))
+
+    def invalidate(self) -> None:
+        """Force the next read to sync first (called after our own Gmail writes)."""
+        if self.ready:
+            self._set_meta(last_sync=0)
+
+    # ---- writes ----
+
+    def upsert(self, summaries: Iterable[Dict[str, Any]]) -> int:
+        rows, label_rows, ids = [], [], []
+        for s in summaries:
+            h = s.get("headers") or {}
+            internal_date = int(s.get("internalDate") or 0)
+            labels = list(s.get("label_ids") or [])
+            ids.append(s["message_id"])
+            rows.append((
+                s["message_id"], s.get("thread_id"), json.dumps(labels), " ".join(map(_label_term, labels)),
+                h.get("from"), h.get("to"), h.get("cc"), h.get("subject"), h.get("date"),
+                h.get("message_id"), h.get("reply_to"), s.get("snippet"), internal_date,
+            ))
+            label_rows += [(label, s["message_id"], internal_date) for label in labels]
+        if not rows:
+            return 0
+        with self._db_lock, self._db:
+            # one row at a time: each rowid must be checked against the rows written before it
+            for row in rows:
+                self._db.execute("INSERT OR REPLACE INTO messages (rowid, id, thread_id, label_ids, label_terms, from_addr, to_addr, cc, "
+                    "subject, date, message_id_header, reply_to, snippet, internal_date) "
+                    "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", (self._rowid(row[-1], row[0]), *row))
+            self._db.executemany("DELETE FROM message_labels WHERE message_id = ?", [(i,) for i in ids])
+            self._db.executemany("INSERT OR IGNORE INTO message_labels VALUES (?,?,?)", label_rows)
+        return len(rows)
+
+    def _rowid(self, internal_date: int, message_id: str) -> int:
+        """
+        This message's rowid: its current one if its date hasn't changed, else _doc_key,
+        moved up past any rowid another message already holds (INSERT OR REPLACE would
+        otherwise silently replace that message). Call with _db_lock held.
+        """
+        row = self._db.execute("SELECT rowid FROM messages WHERE id = ?", (message_id,)).fetchone()
+        if row is not None and row[0] >> 20 == internal_date:
+            return row[0]
+        key = _doc_key(internal_date, message_id)
+        while True:
+            taken = self._db.execute("SELECT id FROM messages WHERE rowid = ?", (key,)).fetchone()
+            if taken is None or taken[0] == message_id:
+                return key
+            key += 1
+
+    def delete(self, message_ids: Iterable[str]) -> None:
+        params = [(i,) for i in message_ids]
+        with self._db_lock, self._db:
+            self._db.executemany("DELETE FROM messages WHERE id = ?", params)
+            self._db.executemany("DELETE FROM message_labels WHERE message_id = ?", params)
+
+    def change_labels(self, message_id: str, add: Iterable[str] = (), remove: Iterable[str] = ()) -> None:
+        with self._db_lock, self._db:
+            row = self._db.execute(
+                "SELECT label_ids, internal_date FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+            if row is None:
+                return  # not mirrored (e.g. older than the backfill cap)
+            add, remove = list(add), set(remove)
+            labels = [l for l in json.loads(row["label_ids"]) if l not in remove]
+            labels += [l for l in add if l not in labels]
+            self._db.execute(
+                "UPDATE messages SET label_ids = ?, label_terms = ? WHERE id = ?",
+                (json.dumps(labels), " ".join(map(_label_term, labels)), message_id),
+            )
+            self._db.executemany(
+                "DELETE FROM message_labels WHERE message_id = ? AND label_id = ?",
+                [(message_id, l) for l in remove],
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO message_labels VALUES (?,?,?)",
+                [(l, message_id, row["internal_date"]) for l in labels],
+            )
+
+    # ---- sync ----
+
+    def _fetch(self, service: Any, message_ids: List[str]) -> Dict[str, str]:
+        """
+        Fetch and store these messages. Parts of a batch that failed with a 429, a 5xx or a
+        rate-limit 403 are fetched again with backoff. Returns the ids still missing, with
+        their last error.
+        """
+        pending, missing = list(message_ids), {}
+        attempt = 0
+        while pending:
+            found, errors = _batch_get_messages(
+                service, pending, user_id=self.user_id, batch_size=GET_MESSAGES_BATCH_SIZE
+            )
+            self.upsert(found.values())
+            self._count("messages_fetched", len(found))
+            # gone since they were listed
+            self.delete([i for i, e in errors.items() if e.startswith("404")])
+            pending = [i for i, e in errors.items() if _retryable_error(e)]
+            missing.update((i, e) for i, e in errors.items() if not e.startswith("404") and not _retryable_error(e))
+            if pending and attempt + 1 >= retry.MAX_ATTEMPTS:
+                missing.update((i, errors[i]) for i in pending)
+                break
+            if pending:
+                time.sleep(retry.backoff(attempt, None))
+                attempt += 1
+                self._count("fetch_retries", len(pending))
+        self._count("fetch_missing", len(missing))
+        return missing
+
+    def backfill(self) -> int:
+        """
+        Mirror the whole mailbox (or backfill_max newest messages). Returns messages stored.
+
+        Rows already mirrored are overwritten in place and the ones no longer listed are
+        dropped only once the listing is done, so a rebuild never empties the mirror. Ids
+        left unfetched by transient errors are kept in meta and the next run fetches only
+        those; ids with permanent errors are recorded under failed_ids and don't hold up
+        completion.
+        """
+        with self._sync_lock, tool_scope("gmail_mirror"):
+            service = self._service_factory()
+            resume = self._get_meta("backfill_retry")
+            if resume is not None:
+                ids = json.loads(resume)
+                missing = self._fetch(service, ids)
+                return self._finish_backfill(self._get_meta("backfill_history"), len(ids), missing)
+
+            # take the history id first so changes made during the backfill are replayed by sync()
+            start_history = service.users().getProfile(
+                userId=self.user_id, fields=FIELDS["gmail.users.getProfile"]
+            ).execute().get("historyId")
+            self._set_meta(backfill_complete=0, failed_ids=None)
+
+            stored, missing, page_token, listed = 0, {}, None, set()
+            while True:
+                # spam and trash too, so in:spam / in:trash can be answered locally
+                resp = (
+                    service.users().messages()
+                    .list(userId=self.user_id, maxResults=LIST_PAGE_SIZE, pageToken=page_token,
+                          includeSpamTrash=True, fields=FIELDS["gmail.messages.list"])
+                    .execute()
+                )
+                ids = [m["id"] for m in resp.get("messages") or []]
+                if self.backfill_max:
+                    ids = ids[:self.backfill_max - stored]
+                missing.update(self._fetch(service, ids))
+                listed.update(ids)
+                stored += len(ids)
+                page_token = resp.get("nextPageToken")
+                if not page_token or (self.backfill_max and stored >= self.backfill_max):
+                    break
+
+            with self._db_lock:
+                mirrored = {r[0] for r in self._db.execute("SELECT id FROM messages")}
+            self.delete(mirrored - listed)
+            return self._finish_backfill(start_history, stored, missing)
+
+    def _finish_backfill(self, start_history: Optional[str], attempted: int, missing: Dict[str, str]) -> int:
+        """Mark the backfill complete, or schedule a resume for its transient failures."""
+        failed = {**json.loads(self._get_meta("failed_ids") or "{}"),
+                  **{i: e for i, e in missing.items() if not _retryable_error(e)}}
+        transient = sorted(i for i, e in missing.items() if _retryable_error(e))
+        attempts = int(self._get_meta("backfill_attempts") or 0) + 1
+        if transient and attempts < BACKFILL_MAX_ATTEMPTS:
+            # an incomplete mirror would answer reads wrongly: resume later with just these ids
+            delay = min(BACKFILL_RETRY_CAP, BACKFILL_RETRY_BASE * 2 ** (attempts - 1))
+            logger.warning("gmail mirror: backfill left %d messages unfetched, retrying them in %.0fs",
+                           len(transient), delay)
+            self._set_meta(backfill_retry=json.dumps(transient), backfill_history=start_history,
+                           backfill_attempts=attempts, backfill_retry_at=self._clock() + delay,
+                           failed_ids=json.dumps(failed))
+            return attempted - len(missing)
+
+        failed.update((i, missing[i]) for i in transient)
+        if failed:
+            logger.warning("gmail mirror: %d messages could not be fetched, see failed_ids", len(failed))
+        self._set_meta(history_id=start_history, backfill_complete=1, last_sync=self._clock(),
+                       failed_ids=json.dumps(failed) if failed else None, backfill_retry=None,
+                       backfill_history=None, backfill_attempts=None, backfill_retry_at=None)
+        self._count("backfills")
+        logger.info("gmail mirror: backfilled %d messages", attempted - len(missing))
+        return attempted - len(missing)
+
+    def sync(self) -> int:
+        """Apply users.history.list changes since the stored historyId. Returns records applied."""
+        if not self.ready:
+            self.backfill()
+            return 0
+        with self._sync_lock, tool_scope("gmail_mirror"):
+            service = self._service_factory()
+            added, deleted = set(), set()
+            applied, page_token, latest = 0, None, self.history_id
+            try:
+                while True:
+                    resp = (
+                        service.users().history()
+                        .list(userId=self.user_id, startHistoryId=self.history_id,
+                              maxResults=500, pageToken=page_token, fields=FIELDS["gmail.history.list"])
+                        .execute()
+                    )
+                    for record in resp.get("history") or []:
+                        applied += 1
+                        for item in record.get("messagesAdded") or []:
+                            added.add(item["message"]["id"])
+                            deleted.discard(item["message"]["id"])
+                        for item in record.get("messagesDeleted") or []:
+                            deleted.add(item["message"]["id"])
+                            added.discard(item["message"]["id"])
+                        for item in record.get("labelsAdded") or []:
+                            self.change_labels(item["message"]["id"], add=item.get("labelIds") or [])
+                        for item in record.get("labelsRemoved") or []:
+                            self.change_labels(item["message"]["id"], remove=item.get("labelIds") or [])
+                    latest = resp.get("historyId") or latest
+                    page_token = resp.get("nextPageToken")
+                    if not page_token:
+                        break
+            except HttpError as e:
+                if getattr(e, "status_code", None) != 404:
+                    raise
+                # historyId too old (Gmail keeps about a week): start over in the background,
+                # reads go to Gmail until the new backfill completes
+                logger.warning("gmail mirror: history %s expired, backfilling again", self.history_id)
+                self._set_meta(backfill_complete=0, backfill_retry=None, backfill_history=None,
+                               backfill_attempts=None, backfill_retry_at=None)
+            else:
+                self.delete(deleted)
+                if self._fetch(service, sorted(added)):
+                    # keep the old historyId so the next sync replays the messages we couldn't fetch
+                    latest = self.history_id
+                self._set_meta(history_id=latest, last_sync=self._clock())
+                self._count("syncs")
+                self._count("history_records", applied)
+                return applied
+        self._start_backfill()
+        return 0
+
+    def _start_backfill(self) -> None:
+        if self._backfill_thread is not None and self._backfill_thread.is_alive():
+            return
+
+        def _run():
+            try:
+                with lane_scope(BULK):
+                    self.backfill()
+            except Exception:
+                logger.exception("gmail mirror: backfill failed")
+                self._set_meta(backfill_retry_at=self._clock() + BACKFILL_RETRY_BASE)
+
+        self._backfill_thread = threading.Thread(target=_run, name="gmail-mirror-backfill", daemon=True)
+        self._backfill_thread.start()
+
+    def ensure_fresh(self) -> bool:
+        """
+        True if the mirror can answer reads now (syncing first when it's older than max_age).
+        Before the first backfill it starts one in the background (unless the last one
+        failed and its retry isn't due yet) and returns False.
+        """
+        if not self.ready:
+            retry_at = self._get_meta("backfill_retry_at")
+            if retry_at is None or self._clock() >= float(retry_at):
+                self._start_backfill()
+            return False
+        age = self.age()
+        if age is None or age > self.max_age:
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("gmail mirror: sync failed, using Gmail directly")
+                return False
+        return self.ready
+
+    # ---- reads ----
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._db_lock:
+            self._counters[key] += n
+
+    def list_messages(
+        self,
+        query: Optional[str] = None,
+        label_ids: Optional[List[str]] = None,
+        max_results: int = 20,
+    ) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """
+        (summaries newest first, more_available) for a listing the mirror can answer,
+        or None (unsupported query, or mirror not ready) so the caller asks Gmail.
+        """
+        parsed = parse_query(query)
+        if parsed is None or not self.ensure_fresh():
+            self._count("fallbacks")
+            return None
+        required = list(dict.fromkeys([*(label_ids or []), *parsed[0]]))
+        excluded = list(parsed[1]) + [l for l in _HIDDEN_LABELS if l not in required]
+
+        sql, params = ["SELECT m.* FROM "], []
+        if required:
+            # walk the (label, date) index of the first label; check the rest per row
+            sql.append("message_labels l0 JOIN messages m ON m.id = l0.message_id WHERE l0.label_id = ?")
+            params.append(required[0])
+            order = "l0.internal_date"
+        else:
+            sql.append("messages m WHERE 1")
+            order = "m.internal_date"
+        for label in required[1:]:
+            sql.append(" AND EXISTS (SELECT 1 FROM message_labels x WHERE x.message_id = m.id AND x.label_id = ?)")
+            params.append(label)
+        for label in excluded:
+            sql.append(" AND NOT EXISTS (SELECT 1 FROM message_labels x WHERE x.message_id = m.id AND x.label_id = ?)")
+            params.append(label)
+        sql.append(f" ORDER BY {order} DESC LIMIT ?")
+        params.append(max_results + 1)
+
+        with self._db_lock:
+            rows = self._db.execute("".join(sql), params).fetchall()
+        self._count("served_local")
+        return [_row_to_summary(r) for r in rows[:max_results]], len(rows) > max_results
+
+    def get_message(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """Metadata summary from the mirror, or None if it isn't mirrored / mirror not fresh."""
+        if not self.ensure_fresh():
+            self._count("fallbacks")
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone()
+        if row is None:
+            self._count("fallbacks")
+            return None
+        self._count("served_local")
+        return _row_to_summary(row)
+
+    def search(
+        self,
+        query: str,
+        label_ids: Optional[List[str]] = None,
+        max_results: int = 20,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Best BM25 matches for a free-text query (see parse_search), best first, each a
+        summary plus its "score" (higher is better). None if the mirror can't answer yet.
+        Raises ValueError for a query with nothing to search for.
+        """
+        if not self.fts or not self.ensure_fresh():
+            self._count("fallbacks")
+            return None
+        parsed = parse_search(query)
+        if parsed is None:
+            raise ValueError(f"nothing to search for in {query!r}")
+        text_expr, required, excluded = parsed
+        required = list(dict.fromkeys([*(label_ids or []), *required]))
+        excluded = excluded + [l for l in _HIDDEN_LABELS if l not in required]
+        expr = search_expression(text_expr, required, excluded)
+
+        with self._db_lock:
+            # rowids ascend with date: the window's oldest match bounds what gets scored
+            floor = self._db.execute(
+                "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (expr, SEARCH_RANK_WINDOW - 1),
+            ).fetchone()
+            rows = self._db.execute(
+                "SELECT m.*, c.rank AS rank FROM ("
+                " SELECT rowid, rank FROM messages_fts"
+                " WHERE messages_fts MATCH ? AND rowid >= ? ORDER BY rank LIMIT ?"
+                ") c JOIN messages m ON m.rowid = c.rowid ORDER BY c.rank",
+                (expr, floor[0] if floor else 0, max_results),
+            ).fetchall()
+
+        self._count("searches")
+        return [{**_row_to_summary(r), "score": round(-r["rank"], 3)} for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._db_lock:
+            messages = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            counters = dict(self._counters)
+        age = self.age()
+        return {
+            **counters,
+            "messages": messages,
+            "ready": self.ready,
+            "search_index": self.fts,
+            "history_id": self.history_id,
+            "unfetchable": len(json.loads(self._get_meta("failed_ids") or "{}")),
+            "age_seconds": None if age is None else round(age, 1),
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+_MIRROR: Optional[MailMirror] = None
+_MIRROR_LOCK = threading.Lock()
+
+
+def get_mirror() -> Optional[MailMirror]:
+    """The process-wide mirror, or None when STELLA_GMAIL_MIRROR is off."""
+    global _MIRROR
+    if not MIRROR_ENABLED:
+        return None
+    if _MIRROR is None:
+        with _MIRROR_LOCK:
+            if _MIRROR is None:
+                _MIRROR = MailMirror()
+    return _MIRROR
+
+
+def main(argv: List[str]) -> None:
+    command = argv[0] if argv else "stats"
+    mirror = MailMirror()
+    if command == "backfill":
+        print(f"stored {mirror.backfill()} messages")
+    elif command == "sync":
+        print(f"applied {mirror.sync()} history records")
+        if mirror._backfill_thread is not None:
+            mirror._backfill_thread.join()
+            print(f"history expired, backfilled again: {mirror.stats()['messages']} messages")
+    elif command == "search":
+        started = time.perf_counter()
+        hits = mirror.search(" ".join(argv[1:])) or []
+        for hit in hits:
+            h = hit["headers"]
+            print(f"{hit['score']:8.2f}  {hit['message_id']}  {h['from']}  |  {h['subject']}")
+        print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return
+    print(json.dumps(mirror.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
@@ -0,0 +1,348 @@
+# tools/quota.py
+# Client-side quota scheduling for Google API calls. Before a PooledHttp (tools/service.py)
+# sends a request, the request's cost in quota units is taken from two token buckets for
+# that API: the account's ("per user" quota) and the process's ("per project" quota).
+# Bulk actions and parallel sessions therefore slow down here instead of drawing 429s.
+#
+# Costs are per API method. Gmail uses its published quota units; Calendar counts
+# requests. The method is recovered from the request path using the routes in the
+# bundled discovery documents, and a batch request costs the sum of its parts.
+#
+# Requests that have to wait queue in priority lanes, FIFO within a lane:
+#   interactive  reads (including freebusy.query)
+#   write        single writes
+#   bulk         batches containing writes, batchModify/batchDelete, and the background
+#                mirror and cache syncs (lane_scope(BULK))
+#
+# A bucket holds BURST_SECONDS worth of refill and refills at limit / (60 + BURST_SECONDS)
+# units per second, so no 60-second window spends more than the per-minute limit. The
+# project limit is per process: with several server workers, give each its share.
+
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Pattern, Tuple
+from urllib.parse import urlsplit
+
+QUOTA_ENABLED = os.getenv("STELLA_QUOTA", "1") != "0"
+BURST_SECONDS = float(os.getenv("STELLA_QUOTA_BURST_SECONDS", "10"))
+
+# Quota units per minute as (per user, per project); match the project's Cloud console
+LIMITS: Dict[str, Tuple[int, int]] = {
+    "gmail": (
+        int(os.getenv("STELLA_GMAIL_USER_QUOTA", "15000")),
+        int(os.getenv("STELLA_GMAIL_PROJECT_QUOTA", "1200000")),
+    ),
+    "calendar": (
+        int(os.getenv("STELLA_CALENDAR_USER_QUOTA", "600")),
+        int(os.getenv("STELLA_CALENDAR_PROJECT_QUOTA", "10000")),
+    ),
+}
+
+# Gmail quota units per method (discovery method id); anything else costs DEFAULT_COST
+COSTS: Dict[str, int] = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.watch": 100,
+    "gmail.users.stop": 50,
+    "gmail.users.drafts.create": 10,
+    "gmail.users.drafts.delete": 10,
+    "gmail.users.drafts.get": 5,
+    "gmail.users.drafts.list": 5,
+    "gmail.users.drafts.send": 100,
+    "gmail.users.drafts.update": 15,
+    "gmail.users.history.list": 2,
+    "gmail.users.labels.create": 5,
+    "gmail.users.labels.delete": 5,
+    "gmail.users.labels.get": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.labels.patch": 5,
+    "gmail.users.labels.update": 5,
+    "gmail.users.messages.attachments.get": 5,
+    "gmail.users.messages.batchDelete": 50,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.delete": 10,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.import": 25,
+    "gmail.users.messages.insert": 25,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.send": 100,
+    "gmail.users.messages.trash": 5,
+    "gmail.users.messages.untrash": 5,
+    "gmail.users.threads.delete": 20,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.list": 10,
+    "gmail.users.threads.modify": 10,
+    "gmail.users.threads.trash": 10,
+    "gmail.users.threads.untrash": 10,
+}
+# Gmail's settings.* methods cost 1-5 units; Calendar charges one per request
+DEFAULT_COST: Dict[str, int] = {"gmail": 5, "calendar": 1}
+
+# Non-GET methods that only read
+READ_METHODS = {"calendar.freebusy.query"}
+# Single requests that act on many messages
+BULK_METHODS = {"gmail.users.messages.batchModify", "gmail.users.messages.batchDelete"}
+
+INTERACTIVE, WRITE, BULK = "interactive", "write", "bulk"
+LANES = (INTERACTIVE, WRITE, BULK)
+
+# API -> (discovery name, version) and the path prefix its requests start with
+API_VERSIONS: Dict[str, Tuple[str, str]] = {"gmail": ("gmail", "v1"), "calendar": ("calendar", "v3")}
+_API_PREFIXES = {f"/{name}/{version}/": api for api, (name, version) in API_VERSIONS.items()}
+# One line per part of a multipart batch body: "GET /gmail/v1/users/me/messages/x?fields=... HTTP/1.1"
+_BATCH_PART = re.compile(r"^(GET|POST|PUT|PATCH|DELETE) (/\S*) HTTP/1\.1", re.MULTILINE)
+
+
+# ---- which method a request calls ----
+
+def _methods(resource: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield from (resource.get("methods") or {}).values()
+    for child in (resource.get("resources") or {}).values():
+        yield from _methods(child)
+
+
+def _pattern(template: str) -> Pattern:
+    # {name} matches one path segment, {+name} (reserved expansion) may span several
+    parts = re.split(r"(\{\+?[^}]+\})", template)
+    return re.compile("".join(
+        (".+" if part.startswith("{+") else "[^/]+") if part.startswith("{") else re.escape(part)
+        for part in parts
+    ))
+
+
+@functools.lru_cache(maxsize=None)
+def _routes(api: str) -> Dict[str, List[Tuple[Pattern, str]]]:
+    """HTTP method -> [(path regex, method id)], paths with fewer parameters first."""
+    from tools.service import discovery_document  # tools.service imports this module
+
+    doc = discovery_document(*API_VERSIONS[api])
+    prefix = "/" + doc["servicePath"]
+    routes: Dict[str, List[Tuple[int, Pattern, str]]] = {}
+    for method in _methods(doc):
+        template = prefix + (method.get("flatPath") or method["path"])
+        routes.setdefault(method["httpMethod"], []).append((template.count("{"), _pattern(template), method["id"]))
+    return {verb: [(p, mid) for _, p, mid in sorted(rs, key=lambda r: r[0])] for verb, rs in routes.items()}
+
+
+def identify(http_method: str, path: str) -> Optional[Tuple[str, Optional[str]]]:
+    """(api, discovery method id or None) for a request path, or None if it isn't Gmail/Calendar."""
+    api = next((a for prefix, a in _API_PREFIXES.items() if path.startswith(prefix)), None)
+    if api is None:
+        return None
+    for pattern, method_id in _routes(api).get(http_method.upper(), []):
+        if pattern.fullmatch(path):
+            return api, method_id
+    return api, None
+
+
+def is_read(http_method: str, method_id: Optional[str]) -> bool:
+    return http_method.upper() == "GET" or method_id in READ_METHODS
+
+
+def calls(uri: str, http_method: str = "GET", body: Any = None) -> Tuple[List[Tuple[str, str]], bool]:
+    """([(HTTP method, path)] of the API calls an HTTP request makes, whether it is a batch)."""
+    path = urlsplit(uri).path
+    if path.startswith("/batch") and body:
+        text = body.decode("utf-8", "replace") if isinstance(body, bytes) else str(body)
+        return [(verb, urlsplit(target).path) for verb, target in _BATCH_PART.findall(text)], True
+    return [(http_method, path)], False
+
+
+def classify(uri: str, http_method: str = "GET", body: Any = None) -> Tuple[Dict[str, int], str]:
+    """
+    Quota units by API and the default lane for one HTTP request; a batch request is
+    charged for each of its parts. Requests outside Gmail/Calendar cost nothing.
+    """
+    parts, batch = calls(uri, http_method, body)
+    charges: Dict[str, int] = {}
+    reads_only = True
+    bulk = False
+    for verb, part_path in parts:
+        found = identify(verb, part_path)
+        if found is None:
+            continue
+        api, method_id = found
+        charges[api] = charges.get(api, 0) + COSTS.get(method_id or "", DEFAULT_COST[api])
+        reads_only = reads_only and is_read(verb, method_id)
+        bulk = bulk or method_id in BULK_METHODS
+    if reads_only:
+        lane = INTERACTIVE
+    elif batch or bulk:
+        lane = BULK
+    else:
+        lane = WRITE
+    return charges, lane
+
+
+_lane: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("quota_lane", default=None)
+
+
+@contextlib.contextmanager
+def lane_scope(lane: str) -> Iterator[None]:
+    """Send Google requests made inside this block (and its copied contexts) in `lane`."""
+    if lane not in LANES:
+        raise ValueError(f"unknown lane {lane!r}")
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+# ---- token buckets ----
+
+class TokenBucket:
+    """`capacity` units refilled at `rate` units per second; waiters queue by (lane, arrival)."""
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = now
+        self.queue: List[Tuple[int, int]] = []  # heap of waiting tickets
+        self.units = 0
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class QuotaScheduler:
+    """
+    Per-user and per-project token buckets per API (created on first use from `limits`,
+    units per minute). acquire() blocks until both buckets have paid for a request;
+    while anyone is queued on a bucket, it is handed out in lane order, FIFO within a lane.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[int, int]]] = None,
+        burst_seconds: float = BURST_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limits = LIMITS if limits is None else limits
+        self.burst_seconds = burst_seconds
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._tickets = itertools.count()
+        self._lanes = {
+            lane: {"requests": 0, "units": 0, "waited": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for lane in LANES
+        }
+        self._throttled = 0
+
+    def _bucket(self, api: str, account: Optional[str]) -> TokenBucket:
+        key = (api, account)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            per_minute = self.limits[api][0 if account is not None else 1]
+            rate = per_minute / (60.0 + self.burst_seconds)
+            bucket = self._buckets[key] = TokenBucket(max(1.0, rate * self.burst_seconds), rate, self._clock())
+        return bucket
+
+    def _take(self, bucket: TokenBucket, cost: float, ticket: Tuple[int, int]) -> None:
+        cost = min(cost, bucket.capacity)  # larger than the bucket: wait for a full one
+        bucket.refill(self._clock())
+        if not bucket.queue and bucket.level >= cost:
+            bucket.level -= cost
+            return
+        heapq.heappush(bucket.queue, ticket)
+        try:
+            while True:
+                bucket.refill(self._clock())
+                head = bucket.queue[0] == ticket
+                if head and bucket.level >= cost:
+                    bucket.level -= cost
+                    return
+                # the head sleeps until its units have refilled; the rest until the head leaves
+                self._cond.wait((cost - bucket.level) / bucket.rate if head else None)
+        finally:
+            bucket.queue.remove(ticket)
+            heapq.heapify(bucket.queue)
+            self._cond.notify_all()
+
+    def acquire(self, charges: Dict[str, int], account: str, lane: str = INTERACTIVE) -> float:
+        """Take each API's units from the account's bucket, then the project's; returns seconds waited."""
+        started = self._clock()
+        priority = LANES.index(lane)
+        with self._cond:
+            for api, cost in charges.items():
+                for owner in (account, None):
+                    bucket = self._bucket(api, owner)
+                    self._take(bucket, cost, (priority, next(self._tickets)))
+                    bucket.units += cost
+            waited = self._clock() - started
+            stats = self._lanes[lane]
+            stats["requests"] += 1
+            stats["units"] += sum(charges.values())
+            if waited > 0.001:
+                stats["waited"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        return waited
+
+    def note_throttled(self) -> None:
+        with self._cond:
+            self._throttled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = self._clock()
+            buckets: Dict[str, Any] = {}
+            for (api, account), bucket in self._buckets.items():
+                bucket.refill(now)
+                buckets[f"{api}: {account or 'project'}"] = {
+                    "level": round(bucket.level, 1),
+                    "capacity": round(bucket.capacity, 1),
+                    "per_minute": self.limits[api][0 if account is not None else 1],
+                    "queued": len(bucket.queue),
+                    "units": bucket.units,
+                }
+            lanes = {
+                lane: {
+                    "requests": s["requests"],
+                    "units": s["units"],
+                    "waited": s["waited"],
+                    "mean_wait_ms": round(1000 * s["wait_seconds"] / s["requests"], 1) if s["requests"] else 0.0,
+                    "max_wait_ms": round(1000 * s["max_wait_seconds"], 1),
+                }
+                for lane, s in self._lanes.items()
+            }
+            return {"buckets": buckets, "lanes": lanes, "throttled_responses": self._throttled}
+
+
+_scheduler = QuotaScheduler()
+
+
+def admit(uri: str, http_method: str, body: Any, account: str) -> float:
+    """Wait until `account` may send this request (called by PooledHttp); returns seconds waited."""
+    if not QUOTA_ENABLED:
+        return 0.0
+    charges, lane = classify(uri, http_method, body)
+    if not charges:
+        return 0.0
+    return _scheduler.acquire(charges, account, _lane.get() or lane)
+
+
+def note_response(status: int, body: Any) -> None:
+    """Count responses that say Google throttled us anyway (429, or 403 rate-limit errors)."""
+    if status == 429 or (status == 403 and b"ratelimitexceeded" in (body or b"").lower()):
+        _scheduler.note_throttled()
+
+
+def stats() -> Dict[str, Any]:
+    return _scheduler.stats()
+
+
+def reset() -> None:
+    """Forget all buckets and counters (tests, or after changing the limits)."""
+    global _scheduler
+    _scheduler = QuotaScheduler()
@@ -0,0 +1,237 @@
+# tools/retry.py
+# Retries and hedged reads for Google API requests. PooledHttp.request (tools/service.py)
+# sends every attempt through execute(), so a 429, a 5xx or a dropped connection costs
+# an HTTP retry rather than a failed tool call and a re-planned agent turn.
+#
+#   - Retried: 429 (and Gmail's 403 rate-limit errors), 500/502/503/504, and transport
+#     errors (OSError, http.client.HTTPException). A final retryable response is returned
+#     as is, so googleapiclient raises its usual HttpError.
+#   - Only idempotent calls are retried on 5xx or transport errors: GET/PUT/DELETE and
+#     the POSTs in IDEMPOTENT_POSTS. A batch qualifies only if every part does. A 429 means
+#     the request was rejected before it ran, so any call is retried on one.
+#   - Waits use exponential backoff with full jitter, or at least the Retry-After the
+#     response asks for. A request gives up once its waits would pass RETRY_BUDGET seconds.
+#   - Hedged reads (STELLA_HEDGE_READS=1): a read still running after the method's
+#     recent p95 latency is sent again on another connection, and the first good
+#     answer wins. Each copy pays its own quota.
+#
+# Retries, giving up, hedges and the latency retries added are counted per tool
+# (tools.fields.current_tool) and shown under "google_retries" in /stats.
+
+import collections
+import contextvars
+import email.utils
+import http.client
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from tools import quota
+from tools.aio import GOOGLE_IO_THREADS
+from tools.fields import current_tool
+
+MAX_ATTEMPTS = int(os.getenv("STELLA_GOOGLE_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = float(os.getenv("STELLA_GOOGLE_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP = float(os.getenv("STELLA_GOOGLE_BACKOFF_CAP", "8"))
+# Seconds a request may spend waiting between attempts; a longer Retry-After fails fast
+RETRY_BUDGET = float(os.getenv("STELLA_GOOGLE_RETRY_BUDGET", "20"))
+
+HEDGE_READS = os.getenv("STELLA_HEDGE_READS", "0") == "1"
+# Never hedge sooner than this, and not before a method has HEDGE_MIN_SAMPLES latencies
+HEDGE_MIN_DELAY = float(os.getenv("STELLA_HEDGE_MIN_MS", "100")) / 1000
+HEDGE_MIN_SAMPLES = 20
+HEDGE_QUANTILE = 0.95
+LATENCY_WINDOW = 200
+
+SERVER_ERRORS = {500, 502, 503, 504}
+IDEMPOTENT_VERBS = {"GET", "HEAD", "PUT", "DELETE"}
+# POSTs that leave the same state however often they run
+IDEMPOTENT_POSTS = quota.READ_METHODS | {
+    "gmail.users.messages.modify",
+    "gmail.users.messages.batchModify",
+    "gmail.users.messages.trash",
+    "gmail.users.messages.untrash",
+    "gmail.users.threads.modify",
+}
+TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+Result = Tuple[Any, bytes]
+
+
+def _method_id(verb: str, path: str) -> Optional[str]:
+    found = quota.identify(verb, path)
+    return found[1] if found else None
+
+
+def _idempotent_call(verb: str, path: str) -> bool:
+    return verb.upper() in IDEMPOTENT_VERBS or _method_id(verb, path) in IDEMPOTENT_POSTS
+
+
+def is_idempotent(uri: str, method: str = "GET", body: Any = None) -> bool:
+    parts, _ = quota.calls(uri, method, body)
+    return all(_idempotent_call(verb, path) for verb, path in parts)
+
+
+def _rate_limited(result: Result) -> bool:
+    status = result[0].status
+    return status == 429 or (status == 403 and b"ratelimitexceeded" in (result[1] or b"").lower())
+
+
+def _retryable(result: Result, idempotent: bool) -> bool:
+    return _rate_limited(result) or (idempotent and result[0].status in SERVER_ERRORS)
+
+
+def retry_after(response: Any) -> Optional[float]:
+    """Seconds the Retry-After header asks for (delta-seconds or an HTTP date), if any."""
+    value = response.get("retry-after") if hasattr(response, "get") else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff(attempt: int, result: Optional[Result]) -> float:
+    """Full-jitter backoff before retry number `attempt` (0-based), at least any Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    asked = retry_after(result[0]) if result is not None else None
+    return delay if asked is None else max(asked, delay)
+
+
+# ---- per-tool counters ----
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def _record(tool: str, **counts: float) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(tool, {
+            "requests": 0, "retried_requests": 0, "retries": 0, "gave_up": 0,
+            "added_ms": 0.0, "hedges": 0, "hedge_wins": 0,
+        })
+        for key, value in counts.items():
+            entry[key] += value
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {tool: {**entry, "added_ms": round(entry["added_ms"], 1)} for tool, entry in _stats.items()}
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        _stats.clear()
+
+
+# ---- hedged reads ----
+
+_latency_lock = threading.Lock()
+_latencies: Dict[str, Deque[float]] = {}
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _note_latency(key: str, seconds: float) -> None:
+    with _latency_lock:
+        _latencies.setdefault(key, collections.deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def hedge_delay(key: str) -> Optional[float]:
+    """When to send a duplicate of a read of this method: its recent p95 latency (None: too few samples)."""
+    with _latency_lock:
+        samples = sorted(_latencies.get(key, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return max(HEDGE_MIN_DELAY, samples[int(HEDGE_QUANTILE * (len(samples) - 1))])
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _executor_lock:
+        if _hedge_executor is None:
+            # primaries and their duplicates both run here while the caller waits
+            _hedge_executor = ThreadPoolExecutor(max_workers=2 * GOOGLE_IO_THREADS, thread_name_prefix="google-hedge")
+        return _hedge_executor
+
+
+def _hedged(send: Callable[[], Result], delay: float, idempotent: bool) -> Tuple[Result, bool, bool]:
+    """(result, hedged, duplicate won). A retryable answer only wins if the other copy fails too."""
+    executor = _executor()
+    # each copy gets its own context copy (tool, account, lane); one context can't be entered twice
+    pending: List[Future] = [executor.submit(contextvars.copy_context().run, send)]
+    done, _ = wait(pending, timeout=delay)
+    hedged = not done
+    if hedged:
+        pending.append(executor.submit(contextvars.copy_context().run, send))
+    duplicate = pending[-1] if hedged else None
+    fallback: Optional[Future] = None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.remove(future)
+            if future.exception() is None and not _retryable(future.result(), idempotent):
+                return future.result(), hedged, future is duplicate
+            fallback = fallback or future
+    return fallback.result(), hedged, fallback is duplicate
+
+
+# ---- the executor ----
+
+def execute(send: Callable[[], Result], uri: str, method: str = "GET", body: Any = None) -> Result:
+    """
+    Run `send` (one HTTP attempt) with retries and, for reads when enabled, a hedged
+    duplicate. Returns the first good (response, content); after the last attempt the
+    final response is returned or the final transport error raised.
+    """
+    parts, batch = quota.calls(uri, method, body)
+    idempotent = all(_idempotent_call(verb, path) for verb, path in parts)
+    latency_key = None
+    if not batch and quota.is_read(method, _method_id(*parts[0])):
+        latency_key = _method_id(*parts[0]) or method.upper()
+    tool = current_tool()
+    started = time.monotonic()
+    waited = 0.0
+    attempt = 0
+    while True:
+        attempt_started = time.monotonic()
+        result: Optional[Result] = None
+        error: Optional[BaseException] = None
+        try:
+            delay = hedge_delay(latency_key) if HEDGE_READS and latency_key else None
+            if delay is not None:
+                result, hedged, won = _hedged(send, delay, idempotent)
+                _record(tool, hedges=int(hedged), hedge_wins=int(won))
+            else:
+                result = send()
+        except TRANSIENT_ERRORS as e:
+            error = e
+
+        if error is None and not _retryable(result, idempotent):
+            finished = time.monotonic()
+            if latency_key:
+                _note_latency(latency_key, finished - attempt_started)
+            _record(tool, requests=1, retries=attempt, retried_requests=int(attempt > 0),
+                    added_ms=1000 * (attempt_started - started))
+            return result
+
+        pause = backoff(attempt, result)
+        if (error is not None and not idempotent) or attempt + 1 >= MAX_ATTEMPTS or waited + pause > RETRY_BUDGET:
+            _record(tool, requests=1, retries=attempt, retried_requests=int(attempt > 0), gave_up=1,
+                    added_ms=1000 * (attempt_started - started))
+            if error is not None:
+                raise error
+            return result
+        time.sleep(pause)
+        waited += pause
+        attempt += 1
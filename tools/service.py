@@ -0,0 +1,324 @@
+# tools/service.py
+# Shared, thread-safe Google API service factory for the Calendar and Gmail tools.
+#
+# googleapiclient's Resource objects are cheap and stateless; the problem is the
+# httplib2.Http underneath, which is not thread-safe. Services built here get a
+# PooledHttp instead: each request borrows an AuthorizedHttp (with its own
+# keep-alive connections) from a bounded pool and returns it afterwards, so
+# parallel tool calls never share a connection.
+#
+# Pools are per Google account (tools.auth.current_account) and held in an LRU of
+# ACCOUNT_POOL_SIZE accounts, each with its credentials and built services, so one
+# process serves many accounts without building a client per call.
+#
+# Resources are built from the discovery documents bundled with googleapiclient
+# (no discovery request), each parsed once per process. googleapiclient and
+# httplib2 are imported on first use so importing the tools stays cheap;
+# warm_up() does all of that ahead of the first request.
+#
+# Every request first waits for its quota units (tools/quota.py), before borrowing a
+# transport, so a request held back by the rate limiter doesn't hold a connection.
+# Retries and hedged reads (tools/retry.py) wrap each attempt, quota included.
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tools.aio import GOOGLE_IO_THREADS
+from tools.auth import DEFAULT_ACCOUNT, SCOPES, current_account, get_credential_manager, has_token
+from tools import quota, retry
+from tools.fields import record_response
+
+logger = logging.getLogger(__name__)
+
+# Max transports (and so concurrent Google requests) per pool. Defaults to the
+# I/O executor size so async tool calls never wait for a connection.
+HTTP_POOL_SIZE = int(os.getenv("STELLA_GOOGLE_HTTP_POOL", str(GOOGLE_IO_THREADS)))
+# Accounts whose credentials, connections and services are kept; the least recently
+# used one is closed beyond this
+ACCOUNT_POOL_SIZE = int(os.getenv("STELLA_ACCOUNT_POOL", "256"))
+
+
+class PooledHttp:
+    """
+    Drop-in for the `http=` argument of googleapiclient's build functions.
+    request() checks out one transport for the duration of the call; transports are
+    created lazily up to `size` and reused (keeping their connections open), callers
+    wait when all are busy. A transport whose request raised is discarded, and so is one
+    returned after close(). Requests are charged to `account`'s Google quota before they
+    are sent, and retried per tools.retry.
+    """
+
+    def __init__(
+        self,
+        credentials: Any,
+        size: int = HTTP_POOL_SIZE,
+        transport_factory: Optional[Callable[[Any], Any]] = None,
+        account: str = DEFAULT_ACCOUNT,
+    ):
+        self.credentials = credentials
+        self.account = account
+        self.size = max(1, size)
+        self._factory = transport_factory or _authorized_http
+        self._idle: List[Any] = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._counters = {
+            "requests": 0,
+            "hits": 0,
+            "waits": 0,
+            "transports_created": 0,
+            "transports_discarded": 0,
+            "connections_opened": 0,
+        }
+
+    def _checkout(self) -> Any:
+        with self._cond:
+            self._counters["requests"] += 1
+            if not self._idle and self._created >= self.size:
+                self._counters["waits"] += 1
+                self._cond.wait_for(lambda: self._idle or self._created < self.size)
+            if self._idle:
+                self._counters["hits"] += 1
+                return self._idle.pop()
+            # reserve the slot before building outside the lock
+            self._created += 1
+            self._counters["transports_created"] += 1
+        try:
+            return self._factory(self.credentials)
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def _checkin(self, transport: Any, healthy: bool) -> None:
+        with self._cond:
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append(transport)
+            else:
+                self._created -= 1
+                if not healthy:
+                    self._counters["transports_discarded"] += 1
+            self._cond.notify()
+        if not keep:
+            # failed, or the pool was closed while this request ran (e.g. account evicted)
+            _close_transport(transport)
+
+    def request(self, uri: str, method: str = "GET", *args: Any, **kwargs: Any) -> Tuple[Any, bytes]:
+        body = kwargs.get("body", args[0] if args else None)
+        return retry.execute(lambda: self._send(uri, method, body, args, kwargs), uri, method, body)
+
+    def _send(self, uri: str, method: str, body: Any, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Tuple[Any, bytes]:
+        quota.admit(uri, method, body, self.account)
+        transport = self._checkout()
+        before = _open_connections(transport)
+        healthy = False
+        try:
+            result = transport.request(uri, method, *args, **kwargs)
+            healthy = True
+            record_response(len(result[1] or b""))
+            quota.note_response(result[0].status, result[1])
+            return result
+        finally:
+            opened = max(0, _open_connections(transport) - before)
+            if opened:
+                with self._cond:
+                    self._counters["connections_opened"] += opened
+            self._checkin(transport, healthy)
+
+    def close(self) -> None:
+        """Close idle transports now and the ones in use as they come back. Requests still work."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for transport in idle:
+            _close_transport(transport)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                **self._counters,
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+            }
+
+
+def _authorized_http(creds: Any) -> Any:
+    import google_auth_httplib2
+    from googleapiclient.http import build_http
+
+    return google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+
+
+def _connections(transport: Any) -> Dict[str, Any]:
+    # AuthorizedHttp wraps an httplib2.Http, which keeps one connection per scheme:host
+    http = getattr(transport, "http", transport)
+    conns = getattr(http, "connections", None)
+    return conns if isinstance(conns, dict) else {}
+
+
+def _open_connections(transport: Any) -> int:
+    return len(_connections(transport))
+
+
+def _close_transport(transport: Any) -> None:
+    for conn in list(_connections(transport).values()):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ---- discovery: bundled documents, parsed once ----
+
+@functools.lru_cache(maxsize=None)
+def discovery_document(api: str, version: str) -> Dict[str, Any]:
+    """The discovery document googleapiclient ships for api/version, parsed (shared; don't modify)."""
+    from googleapiclient import discovery_cache
+
+    doc = discovery_cache.get_static_doc(api, version)
+    if doc is None:
+        raise ValueError(f"no bundled discovery document for {api} {version}")
+    return json.loads(doc)
+
+
+def build(api: str, version: str, http: Any) -> Any:
+    """A Resource for api/version on `http`, from the parsed bundled discovery document."""
+    from googleapiclient.discovery import build_from_document
+
+    return build_from_document(discovery_document(api, version), http=http)
+
+
+# ---- one pool per (account, scope set), one Resource per (api, version) on top of it ----
+_LOCK = threading.Lock()
+_POOLS: "OrderedDict[Tuple[str, Tuple[str, ...]], PooledHttp]" = OrderedDict()
+_SERVICES: Dict[Tuple[str, Tuple[str, ...], str, str], Any] = {}
+_evictions = 0
+
+
+def _close_pool(pool: PooledHttp) -> None:
+    pool.close()
+    close = getattr(pool.credentials, "close", None)
+    if close is not None:
+        close()  # stops the background token refresh
+
+
+def _close_pools_in_background(pools: List[PooledHttp]) -> None:
+    # closing connections and stopping refresh threads is not the evicting request's work
+    def _run():
+        for pool in pools:
+            try:
+                _close_pool(pool)
+            except Exception:
+                logger.exception("closing an evicted Google account pool failed")
+
+    threading.Thread(target=_run, name="google-pool-close", daemon=True).start()
+
+
+def get_http(scopes: Optional[List[str]] = None, account: Optional[str] = None) -> PooledHttp:
+    """
+    Shared PooledHttp for this account (default: the current one) and scope set; Calendar
+    and Gmail use the same one. Marks the account most recently used.
+    """
+    global _evictions
+    key = (account or current_account(), tuple(scopes if scopes is not None else SCOPES))
+    with _LOCK:
+        pool = _POOLS.get(key)
+        if pool is not None:
+            _POOLS.move_to_end(key)
+            return pool
+
+    # loading (and maybe refreshing) a token is network I/O: not under the lock
+    pool = PooledHttp(get_credential_manager(list(key[1]), account=key[0]), account=key[0])
+    evicted: List[PooledHttp] = []
+    with _LOCK:
+        existing = _POOLS.get(key)
+        if existing is not None:
+            evicted.append(pool)  # lost a race with another thread
+            pool = existing
+        else:
+            _POOLS[key] = pool
+            while len(_POOLS) > max(1, ACCOUNT_POOL_SIZE):
+                old_key, old_pool = _POOLS.popitem(last=False)
+                for service_key in [k for k in _SERVICES if k[:2] == old_key]:
+                    del _SERVICES[service_key]
+                evicted.append(old_pool)
+                _evictions += 1
+    if evicted:
+        _close_pools_in_background(evicted)
+    return pool
+
+
+def get_service(api: str, version: str, scopes: Optional[List[str]] = None) -> Any:
+    """
+    Return a googleapiclient Resource for api/version acting for the current account,
+    backed by that account's pool. Safe to call and use from any thread; built once per
+    account while it stays in the pool.
+    """
+    account = current_account()
+    scope_key = tuple(scopes if scopes is not None else SCOPES)
+    key = (account, scope_key, api, version)
+    with _LOCK:
+        service = _SERVICES.get(key)
+    if service is not None:
+        get_http(list(scope_key), account=account)  # keeps the account's LRU position fresh
+        return service
+
+    service = build(api, version, http=get_http(list(scope_key), account=account))
+    with _LOCK:
+        if (account, scope_key) not in _POOLS:
+            return service  # evicted meanwhile: usable, just not kept
+        return _SERVICES.setdefault(key, service)
+
+
+def warm_up(apis: Tuple[Tuple[str, str], ...] = (("calendar", "v3"), ("gmail", "v1"))) -> Dict[str, Any]:
+    """
+    Do the first-request work ahead of time: import googleapiclient, parse the discovery
+    documents and, when the default account's token is on disk with every scope (so no
+    consent prompt can open), load its credentials and build its services.
+    """
+    started = time.perf_counter()
+    for api, version in apis:
+        discovery_document(api, version)
+    built = 0
+    if has_token(DEFAULT_ACCOUNT, SCOPES):
+        for api, version in apis:
+            get_service(api, version)
+            built += 1
+    return {"ms": round((time.perf_counter() - started) * 1000, 1), "services_built": built}
+
+
+def stats() -> Dict[str, Any]:
+    """Pool counters (with token refresh counters), keyed by account and the pool's scopes."""
+    with _LOCK:
+        pools = list(_POOLS.items())
+        evictions = _evictions
+    out: Dict[str, Any] = {}
+    for (account, scopes), pool in pools:
+        entry: Dict[str, Any] = pool.stats()
+        if hasattr(pool.credentials, "stats"):
+            entry["oauth"] = pool.credentials.stats()
+        out[f"{account}: " + " ".join(s.rsplit("/", 1)[-1] for s in scopes)] = entry
+    if evictions:
+        out["accounts_evicted"] = evictions
+    return out
+
+
+def reset() -> None:
+    """Close all pooled connections and forget built services (e.g. after re-auth)."""
+    with _LOCK:
+        pools = list(_POOLS.values())
+        _POOLS.clear()
+        _SERVICES.clear()
+    for pool in pools:
+        _close_pool(pool)
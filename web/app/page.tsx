@@ -9,6 +9,52 @@ interface Message {
   content: string;
   events?: CalendarEvent[];
   emails?: Email[];
+  status?: string; // tool currently running, shown while streaming
+}
+
+// One NDJSON line from POST /chat/stream
+type StreamEvent =
+  | { type: "token"; content: string }
+  | { type: "tool_start"; name: string; args: Record<string, unknown> }
+  | { type: "tool_end"; name: string; ok: boolean }
+  | { type: "events"; events: CalendarEvent[] }
+  | { type: "email"; email: Email }
+  | { type: "done"; reply: string; events: CalendarEvent[]; emails: Email[] }
+  | { type: "error"; message: string };
+
+function applyStreamEvent(msg: Message, ev: StreamEvent): Message {
+  switch (ev.type) {
+    case "token":
+      return { ...msg, content: msg.content + ev.content, status: undefined };
+    case "tool_start":
+      return { ...msg, status: `Running ${ev.name.replace(/_/g, " ")}…` };
+    case "tool_end":
+      return { ...msg, status: undefined };
+    case "events":
+      return { ...msg, events: ev.events };
+    case "email":
+      return { ...msg, emails: [...(msg.emails ?? []), ev.email] };
+    case "done":
+      return {
+        role: "stella",
+        content: ev.reply ?? "",
+        events: Array.isArray(ev.events) ? ev.events : undefined,
+        emails: Array.isArray(ev.emails) ? ev.emails : undefined,
+      };
+    case "error":
+      return { role: "stella", content: "Sorry, I encountered an error. Please try again." };
+  }
+}
+
+// Per-tab conversation id; the server keeps one history per session
+function getSessionId(): string {
+  const key = "stella_session";
+  let id = sessionStorage.getItem(key);
+  if (!id) {
+    id = crypto.randomUUID().replace(/-/g, "");
+    sessionStorage.setItem(key, id);
+  }
+  return id;
 }
 
 export default function Home() {
@@ -67,31 +113,41 @@ export default function Home() {
       textareaRef.current?.focus();
     }, 0);
 
+    // Fold each stream event into the reply bubble (opened by the first event)
+    const updateReply = (ev: StreamEvent) => {
+      setMessages((m) => {
+        const last = m[m.length - 1];
+        if (last?.role !== "stella") {
+          return [...m, applyStreamEvent({ role: "stella", content: "" }, ev)];
+        }
+        return [...m.slice(0, -1), applyStreamEvent(last, ev)];
+      });
+    };
+
     try {
-      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/chat`, {
+      const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/chat/stream`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", "X-Session-Id": getSessionId() },
         body: JSON.stringify({ message: userMsg }),
       });
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
 
-      const data = await res.json();
-      setMessages((m) => [
-        ...m,
-        {
-          role: "stella",
-          content: data.reply ?? "",
-          events: Array.isArray(data.events) ? data.events : undefined,
-          emails: Array.isArray(data.emails) ? data.emails : undefined,
-        },
-      ]);
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop() ?? "";
+        for (const line of lines) {
+          if (line.trim()) updateReply(JSON.parse(line) as StreamEvent);
+        }
+      }
+      if (buffer.trim()) updateReply(JSON.parse(buffer) as StreamEvent);
     } catch (error) {
-      setMessages((m) => [
-        ...m,
-        {
-          role: "stella",
-          content: "Sorry, I encountered an error. Please try again.",
-        },
-      ]);
+      updateReply({ type: "error", message: String(error) });
     } finally {
       setIsLoading(false);
     }
@@ -167,6 +223,9 @@ export default function Home() {
                         : "bg-gray-800 text-gray-100"
                     }`}
                   >
+                    {msg.status && (
+                      <p className="text-xs text-gray-500 italic mb-1">{msg.status}</p>
+                    )}
                     {msg.role === "stella" &&
                     (msg.events?.length || msg.emails?.length) ? (
                       <div className="space-y-3">
@@ -203,8 +262,8 @@ export default function Home() {
                 </div>
               ))}
 
-              {/* Typing Indicator */}
-              {isLoading && (
+              {/* Typing Indicator (until the first stream event opens a reply bubble) */}
+              {isLoading && messages[messages.length - 1]?.role === "user" && (
                 <div className="flex items-start gap-3 justify-start animate-fade-in">
                   <img
                     src="/Stella_1024.png"